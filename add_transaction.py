@@ -10,7 +10,7 @@ import requests
 sys.path.append(os.getcwd())
 
 # Importamos las clases necesarias que controlan la logica de la blockchain
-from blockchain_core import BlockchainNode, Transaction, ActionType
+from blockchain_core import BlockchainNode, Transaction, ActionType, Wallet
 
 
 # Lista de los nodos y sus puertos para saber a donde conectarnos
@@ -31,6 +31,7 @@ PEERS = {
 
 def get_identity():
     # Esta funcion lee el nombre de la carpeta y carga la clave privada del archivo
+    # La llave se parsea una sola vez y la billetera se reutiliza para todas las firmas
     current_dir = os.getcwd()
     node_name = os.path.basename(current_dir)
     key_path = "private_key.pem"
@@ -38,9 +39,7 @@ def get_identity():
     if not os.path.exists(key_path):
         return None, None
 
-    with open(key_path, "r") as f:
-        private_key = f.read().strip()
-    return node_name, private_key
+    return node_name, Wallet.from_file(key_path)
 
 
 def get_node_port(node_name):
@@ -75,7 +74,7 @@ def select_from_menu(items, title, formatter):
 
 def main():
     # Cargamos la identidad del nodo y su llave privada para poder firmar despues
-    node_name, priv_key = get_identity()
+    node_name, wallet = get_identity()
     if not node_name:
         print("Error: No se encontro private_key.pem o la identidad del nodo.")
         return
@@ -374,15 +373,21 @@ def main():
         if txs:
             print(f"\nProcesando {len(txs)} transaccion(es)...")
 
+            checked = []
             for i, tx in enumerate(txs, 1):
                 # Hacemos una revision local basica antes de intentar enviar
                 is_valid_logic, error_msg = node.validate_smart_contract_rules(tx)
                 if not is_valid_logic:
                     print(f"    [!] Tx {i}/{len(txs)} FALLO CHEQUEO LOCAL: {error_msg}")
                     continue
+                checked.append((i, tx))
 
-                # Aqui aplicamos la firma digital usando nuestra clave privada para asegurar que somos nosotros
-                if tx.sign_transaction(priv_key):
+            # Aqui aplicamos la firma digital usando nuestra clave privada para asegurar que somos nosotros
+            # Firmamos todo el lote de una vez con la llave ya cargada
+            signed = wallet.sign_many([tx for _, tx in checked])
+
+            for (i, tx), signed_ok in zip(checked, signed):
+                if signed_ok:
                     # Preparamos los datos y adjuntamos la firma generada
                     payload = tx.to_dict()
                     payload["signature"] = tx.signature
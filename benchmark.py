@@ -0,0 +1,582 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from ecdsa import SigningKey, SECP256k1
+from blockchain_core import (
+    BlockchainNode,
+    Block,
+    LazyBlock,
+    Transaction,
+    ActionType,
+    SIGNATURE_CACHE,
+    TX_VERSION,
+    TX_VERSION_BINARY,
+    TX_VERSION_JSON,
+    TX_VERSION_TYPED,
+    CRYPTO_BACKENDS,
+    EcdsaBackend,
+    STORAGE_PROFILES,
+    cross_check_backends,
+    legacy_merkle_levels,
+    merkle_levels,
+    state_update_batches,
+    verify_batch,
+)
+
+#Pruebas de rendimiento del nucleo de la blockchain
+#Uso: python benchmark.py <prueba> [opciones]
+
+
+#Utilidades
+def timed(fn):
+    #Ejecutamos la funcion y regresamos (segundos, resultado)
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def report(label, seconds, count):
+    rate = count / seconds if seconds else float("inf")
+    print(f"  {label:<38} {seconds * 1000:>10.1f} ms  {rate:>12,.0f} ops/s")
+
+
+def make_transactions(count, version=TX_VERSION):
+    #Transacciones sin firmar para pruebas que no tocan la criptografia
+    pk = SigningKey.generate(curve=SECP256k1).verifying_key.to_string().hex()
+    return [
+        Transaction(
+            pk,
+            pk,
+            f"SHIP-{i}",
+            ActionType.EXTRACTED,
+            "Mina Nevada",
+            "G-LI",
+            float(i),
+            {"lote": i},
+            version=version,
+        )
+        for i in range(count)
+    ]
+
+
+def make_signed_transactions(count, version=TX_VERSION):
+    #Generamos transacciones de prueba de un solo emisor con firmas reales
+    sk = SigningKey.generate(curve=SECP256k1)
+    pk = sk.verifying_key.to_string().hex()
+    priv = sk.to_string().hex()
+    txs = []
+    for i in range(count):
+        tx = Transaction(
+            pk,
+            pk,
+            f"SHIP-{i}",
+            ActionType.EXTRACTED,
+            "Mina Nevada",
+            "G-LI",
+            float(i),
+            {"lote": i},
+            version=version,
+        )
+        tx.sign_transaction(priv)
+        txs.append(tx)
+    return txs
+
+
+class LegacyTransaction(Transaction):
+    #Replica el comportamiento anterior: serializa y hashea en cada llamada
+    def calculate_hash(self):
+        tx_string = json.dumps(self.to_dict(), sort_keys=True)
+        return hashlib.sha256(tx_string.encode()).hexdigest()
+
+
+def rebuild_transactions(block_data, cls):
+    return [cls.from_dict(t) for t in block_data["transactions"]]
+
+
+#Pruebas
+def bench_tx_hash(args):
+    #Construccion y verificacion de un bloque grande con y sin hash memorizado
+    print(f"[*] Firmando {args.txs} transacciones...")
+    #Usamos la codificacion JSON en ambos lados para medir solo el efecto de memorizar
+    txs = make_signed_transactions(args.txs, version=TX_VERSION_JSON)
+    block = Block(2, txs, "0" * 64, "Bench")
+    block_data = json.loads(block.to_json())
+
+    #La firma ya se verifico al entrar a la mempool, aqui medimos lo que queda en recepcion
+    print("[*] Verificando firmas una vez (admision a mempool)...")
+    verify_batch(txs)
+
+    print(f"\nConstruccion + verificacion de un bloque de {args.txs} transacciones:")
+    for label, cls in (("hash recalculado (anterior)", LegacyTransaction), ("hash memorizado", Transaction)):
+        def run():
+            rebuilt = rebuild_transactions(block_data, cls)
+            return all(tx.is_valid() for tx in rebuilt)
+
+        seconds, ok = timed(run)
+        report(label, seconds, args.txs)
+        if not ok:
+            print("    [!] Alguna firma no fue valida")
+    print(f"  Cache de firmas: {SIGNATURE_CACHE.stats()}")
+
+
+def bench_tx_encoding(args):
+    #Codificacion canonica JSON (v1) contra binaria (v2) y binaria con tipos (v3)
+    print(f"Hash de {args.txs} transacciones nuevas:")
+    results = {}
+    for label, version in (
+        ("JSON v1", TX_VERSION_JSON),
+        ("binario v2", TX_VERSION_BINARY),
+        ("binario con tipos v3", TX_VERSION_TYPED),
+    ):
+        txs = make_transactions(args.txs, version=version)
+        for tx in txs:
+            tx.invalidate_hash()
+
+        def run():
+            for tx in txs:
+                tx.invalidate_hash()
+            return txs
+
+        seconds, _ = timed(run)
+        results[version] = seconds
+        report(label, seconds, args.txs)
+        size = sum(len(tx.canonical_bytes()) for tx in txs) / len(txs)
+        print(f"    bytes canonicos promedio: {size:.0f}")
+
+    print(f"\nReconstruccion de un bloque de {args.txs} transacciones (from_json):")
+    for label, version in (
+        ("JSON v1", TX_VERSION_JSON),
+        ("binario v2", TX_VERSION_BINARY),
+        ("binario con tipos v3", TX_VERSION_TYPED),
+    ):
+        block_json = Block(2, make_transactions(args.txs, version=version), "0" * 64, "Bench").to_json()
+        seconds, _ = timed(lambda: Block.from_json(block_json))
+        report(label, seconds, args.txs)
+
+    speedup = results[TX_VERSION_JSON] / results[TX_VERSION]
+    print(f"\n  Aceleracion del hash binario: {speedup:.2f}x")
+
+
+def bench_crypto(args):
+    #Firmas y verificaciones por segundo en cada backend criptografico disponible
+    count = min(args.txs, 500)
+    messages = [hashlib.sha256(str(i).encode()).hexdigest().encode() for i in range(count)]
+    print(f"{count} firmas y verificaciones por backend:")
+    for name, cls in sorted(CRYPTO_BACKENDS.items()):
+        backend = cls()
+        if name != "ecdsa":
+            print(f"  verificacion cruzada con ecdsa: {cross_check_backends(EcdsaBackend(), backend)}")
+        priv = backend.generate_private_key()
+        sk = backend.load_signing_key(priv)
+        vk = backend.load_verifying_key(backend.public_key_from_private(priv))
+        seconds, signatures = timed(lambda: [backend.sign(sk, m) for m in messages])
+        report(f"{name} firmar", seconds, count)
+        seconds, ok = timed(lambda: all(backend.verify(vk, sig, m) for sig, m in zip(signatures, messages)))
+        report(f"{name} verificar", seconds, count)
+
+
+def build_chain_db(db_path, total_txs, txs_per_block=1000, storage_profile="bench", block_store="table", storage_backend=None):
+    #Creamos una base de datos temporal con una cadena de prueba (firmas ficticias, no se verifican)
+    node = BlockchainNode(
+        "Bench", db_path, storage_profile=storage_profile, block_store=block_store, storage_backend=storage_backend
+    )
+    txs = make_transactions(total_txs)
+    prev_hash = "0" * 64
+    for index, start in enumerate(range(0, total_txs, txs_per_block), 1):
+        chunk = txs[start:start + txs_per_block]
+        for tx in chunk:
+            tx.signature = "0" * 128
+        #Los bloques v2 llevan raiz de estado, sin ella una instantanea de la punta se rechaza
+        block = Block(index, chunk, prev_hash, "Bench", state_root=node.compute_state_root(chunk))
+        node.save_block_to_db(block)
+        prev_hash = block.hash
+    return node
+
+
+def bench_chain_memory(args):
+    #Memoria usada por load_chain al cargar toda la cadena
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"[*] Generando cadena de {args.txs} transacciones...")
+        node = build_chain_db(os.path.join(tmp, "bench.db"), args.txs)
+        tracemalloc.start()
+        seconds, chain = timed(node.load_chain)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        total = sum(len(b.transactions) for b in chain)
+        print(f"\nload_chain de {len(chain)} bloques / {total} transacciones:")
+        report("carga", seconds, total)
+        print(f"  memoria retenida: {current / 2**20:.1f} MiB ({current / total:.0f} bytes/tx)")
+        print(f"  pico de memoria:  {peak / 2**20:.1f} MiB")
+
+
+def legacy_save_block(node, block):
+    #Replica la aplicacion anterior: una sentencia por transaccion y la mempool en otra conexion
+    conn = sqlite3.connect(node.db_file)
+    conn.execute(
+        "INSERT INTO blocks (block_index, block_hash, previous_hash, validator, timestamp, data) VALUES (?, ?, ?, ?, ?, ?)",
+        (block.index, block.hash, block.previous_hash, block.validator, block.timestamp, block.to_json()),
+    )
+    for tx in block.transactions:
+        if tx.action in ["EXTRACTED", "MANUFACTURED"]:
+            conn.execute(
+                "INSERT OR REPLACE INTO shipments (shipment_id, good_id, quantity, current_owner_pk, current_location, last_action, last_updated_timestamp, is_active) VALUES (?, ?, ?, ?, ?, ?, ?, 1)",
+                (tx.shipment_id, tx.good_id, tx.quantity, tx.receiver, tx.location, tx.action, tx.timestamp),
+            )
+        else:
+            q_sql = ", quantity = ?" if tx.quantity is not None else ""
+            params = [tx.receiver, tx.location, tx.action, tx.timestamp]
+            if tx.quantity is not None:
+                params.append(tx.quantity)
+            params.append(tx.shipment_id)
+            conn.execute(
+                f"UPDATE shipments SET current_owner_pk = ?, current_location = ?, last_action = ?, last_updated_timestamp = ?, is_active = 1 {q_sql} WHERE shipment_id = ?",
+                params,
+            )
+    conn.commit()
+    conn.close()
+    conn = sqlite3.connect(node.db_file)
+    for tx in block.transactions:
+        conn.execute("DELETE FROM mempool WHERE tx_hash = ?", (tx.tx_hash,))
+    conn.commit()
+    conn.close()
+
+
+def batched_save_block(node, block):
+    #Las mismas filas que legacy_save_block (bloque, envios y mempool) pero con executemany
+    #en una sola transaccion: aisla la ganancia de agrupar las escrituras
+    conn = sqlite3.connect(node.db_file)
+    conn.execute(
+        "INSERT INTO blocks (block_index, block_hash, previous_hash, validator, timestamp, data) VALUES (?, ?, ?, ?, ?, ?)",
+        (block.index, block.hash, block.previous_hash, block.validator, block.timestamp, block.to_json()),
+    )
+    for sql, rows in state_update_batches(block.transactions):
+        conn.executemany(sql, rows)
+    conn.executemany("DELETE FROM mempool WHERE tx_hash = ?", [(tx.tx_hash,) for tx in block.transactions])
+    conn.commit()
+    conn.close()
+
+
+def bench_block_apply(args):
+    #Aplicacion de un bloque de creaciones y otro de envios
+    #Las dos primeras filas escriben lo mismo (sentencia por fila contra executemany), la tercera
+    #es save_block_to_db completo: suma los indices de transacciones y procedencia y el arbol
+    #de estado, cuyo tiempo se mide aparte
+    created = make_transactions(args.txs)
+    shipped = [
+        Transaction(tx.sender, tx.receiver, tx.shipment_id, ActionType.SHIPPED, "Puerto", version=tx.version)
+        for tx in created
+    ]
+    for tx in created + shipped:
+        tx.signature = "0" * 128
+    print(f"Aplicando 2 bloques de {args.txs} transacciones (creacion y envio):")
+    for label, apply in (
+        ("filas: una sentencia por tx (anterior)", legacy_save_block),
+        ("filas: executemany atomico", batched_save_block),
+        ("save_block_to_db completo", lambda node, block: node.save_block_to_db(block)),
+    ):
+        with tempfile.TemporaryDirectory() as tmp:
+            node = BlockchainNode("Bench", os.path.join(tmp, "bench.db"))
+            #Cronometramos el arbol de estado dentro de la aplicacion completa
+            tree_seconds = []
+            update_state_tree = node.storage._update_state_tree
+
+            def timed_tree(conn, shipment_ids):
+                seconds, hashes = timed(lambda: update_state_tree(conn, shipment_ids))
+                tree_seconds.append(seconds)
+                return hashes
+
+            node.storage._update_state_tree = timed_tree
+            prev_hash = "0" * 64
+            total = 0.0
+            for index, txs in enumerate((created, shipped), 1):
+                block = Block(index, txs, prev_hash, "Bench")
+                block.to_json()
+                prev_hash = block.hash
+                with node.storage.db.connection() as conn:
+                    conn.executemany(
+                        "INSERT INTO mempool VALUES (?, ?, ?)",
+                        [(tx.tx_hash, "{}", tx.timestamp) for tx in txs],
+                    )
+                    conn.commit()
+                seconds, _ = timed(lambda: apply(node, block))
+                total += seconds
+            report(label, total, 2 * args.txs)
+            if tree_seconds:
+                report("  de ello arbol de estado", sum(tree_seconds), 2 * args.txs)
+                report("  de ello filas e indices", total - sum(tree_seconds), 2 * args.txs)
+            node.close()
+
+
+def bench_rules(args):
+    #Reglas del contrato sobre envios existentes: consulta a SQLite contra cache de estado
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"[*] Generando cadena de {args.txs} transacciones...")
+        node = build_chain_db(os.path.join(tmp, "bench.db"), args.txs)
+        created = [tx for block in node.load_chain() for tx in block.transactions]
+        shipped = [
+            Transaction(tx.receiver, tx.receiver, tx.shipment_id, ActionType.SHIPPED, "Puerto")
+            for tx in created
+        ]
+        print(f"\nValidando reglas de {len(shipped)} envios:")
+        for label, cache_size in (("SQLite por transaccion", 0), ("cache de estado", args.txs)):
+            node.state_cache = None
+            if cache_size:
+                node.enable_state_cache(cache_size)
+            seconds, results = timed(lambda: [node.validate_smart_contract_rules(tx)[0] for tx in shipped])
+            report(label, seconds, len(shipped))
+            if not all(results):
+                print("    [!] Alguna regla fallo")
+        print(f"  consistencia de la cache: {node.verify_state_cache()[0]}")
+        node.close()
+
+
+def bench_bootstrap(args):
+    #Arranque de un nodo nuevo: repetir todos los bloques contra importar una instantanea
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"[*] Generando cadena de {args.txs} transacciones...")
+        source = build_chain_db(os.path.join(tmp, "source.db"), args.txs, txs_per_block=100)
+        blocks = list(source.iter_blocks_json())
+        print(f"\nArranque de un nodo con {len(blocks)} bloques / {args.txs} transacciones:")
+
+        def replay():
+            node = BlockchainNode("Bench", os.path.join(tmp, "replay.db"), storage_profile="bench")
+            for data in blocks:
+                node.save_block_to_db(LazyBlock.from_json(data))
+            return node
+
+        seconds, replayed = timed(replay)
+        report("repetir la historia", seconds, len(blocks))
+
+        def bootstrap():
+            node = BlockchainNode("Bench", os.path.join(tmp, "snapshot.db"), storage_profile="bench")
+            snapshot = json.loads(json.dumps(source.export_snapshot()))
+            return node, node.import_snapshot(snapshot)
+
+        seconds, (restored, result) = timed(bootstrap)
+        report("instantanea (exportar + importar)", seconds, len(blocks))
+        same = restored.export_snapshot()["state"] == replayed.export_snapshot()["state"]
+        print(f"  {result[1]}, mismo estado: {same}")
+        for node in (source, replayed, restored):
+            node.close()
+
+
+def bench_state_root(args):
+    #Costo de mantener la raiz de estado: bloque incremental contra reconstruir todo el arbol
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"[*] Generando cadena de {args.txs} transacciones...")
+        node = build_chain_db(os.path.join(tmp, "bench.db"), args.txs)
+        tip = node.get_tip()
+        moved = [
+            Transaction("ab" * 64, "cd" * 64, f"SHIP-{i}", ActionType.SHIPPED, "Puerto")
+            for i in range(0, args.txs, max(1, args.txs // 100))
+        ]
+        for tx in moved:
+            tx.signature = "0" * 128
+        print(f"\nRaiz de estado con {args.txs} envios, bloque de {len(moved)} cambios:")
+        seconds, root = timed(lambda: node.compute_state_root(moved))
+        report("incremental (compute_state_root)", seconds, len(moved))
+        block = Block(tip.index + 1, moved, tip.hash, "Bench", state_root=root)
+        seconds, result = timed(lambda: node.save_block_to_db(block))
+        report("guardar bloque con raiz", seconds, len(moved))
+        seconds, rebuilt = timed(node.rebuild_state_tree)
+        report("reconstruccion completa", seconds, args.txs)
+        print(f"  {result[1]}, raiz igual tras reconstruir: {rebuilt == root}")
+        node.close()
+
+
+def bench_storage(args):
+    #Bloques aplicados por segundo (save_block_to_db) con cada perfil y con el backend en memoria
+    txs_per_block = 100
+    blocks = max(1, args.txs // txs_per_block)
+    print(f"Aplicando {blocks} bloques de {txs_per_block} transacciones:")
+    for profile in ("durable", "balanced", "bench"):
+        with tempfile.TemporaryDirectory() as tmp:
+            seconds, node = timed(
+                lambda: build_chain_db(
+                    os.path.join(tmp, "bench.db"), blocks * txs_per_block, txs_per_block, profile
+                )
+            )
+            report(f"{profile} ({STORAGE_PROFILES[profile]['synchronous']})", seconds, blocks)
+            node.close()
+    #Nodos completos sin disco: las mismas tablas de SQLite en RAM y el motor memory (diccionarios)
+    for label, backend in (("sqlite en RAM", "sqlite"), ("memory (sin SQL)", "memory")):
+        seconds, node = timed(
+            lambda: build_chain_db(":memory:", blocks * txs_per_block, txs_per_block, storage_backend=backend)
+        )
+        report(label, seconds, blocks)
+        node.close()
+
+
+def bench_query_plans(args):
+    #Regresion: las consultas frecuentes deben usar indices en una base migrada
+    with tempfile.TemporaryDirectory() as tmp:
+        node = BlockchainNode("Bench", os.path.join(tmp, "bench.db"))
+        print(f"Esquema version {node.schema_version()}:")
+        failed = []
+        for name, (uses_index, plan) in node.explain_hot_queries().items():
+            print(f"  {'OK ' if uses_index else 'MAL'} {name:<16} {' | '.join(plan)}")
+            if not uses_index:
+                failed.append(name)
+        node.close()
+    if failed:
+        raise SystemExit(f"[!] Consultas sin indice: {', '.join(failed)}")
+
+
+def bench_history(args):
+    #Historial de un envio: decodificar toda la cadena contra el indice de transacciones
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"[*] Generando cadena de {args.txs} transacciones...")
+        node = build_chain_db(os.path.join(tmp, "bench.db"), args.txs)
+        target = f"SHIP-{args.txs // 2}"
+
+        def scan():
+            return [
+                tx for block in node.load_chain() for tx in block.transactions
+                if tx.shipment_id == target
+            ]
+
+        print(f"\nEventos de {target}:")
+        seconds, found = timed(scan)
+        report("load_chain y filtrar (anterior)", seconds, 1)
+        seconds, history = timed(lambda: node.get_shipment_history(target))
+        report("indice de transacciones", seconds, 1)
+        print(f"  eventos: {len(found)} / {len(history)}")
+        node.close()
+
+
+def build_lineage_db(node, shipments):
+    #Grafo sintetico de procedencia: lotes -> componentes -> subensambles -> productos
+    #Cada envio de un nivel se fabrica con dos envios del nivel anterior
+    rng = random.Random(42)
+    sizes = [shipments // 100, shipments // 25, shipments // 5]
+    sizes.append(shipments - sum(sizes))
+    levels = [[f"L{level}-{i}" for i in range(size)] for level, size in enumerate(sizes)]
+    edges = []
+    for level in range(1, len(levels)):
+        parents = levels[level - 1]
+        for child in levels[level]:
+            for parent in rng.sample(parents, 2):
+                edges.append((parent, child, level))
+    with node.storage.db.connection() as conn:
+        conn.executemany("INSERT OR IGNORE INTO lineage VALUES (?, ?, ?)", edges)
+        conn.commit()
+    return levels
+
+
+def bench_lineage(args):
+    #Consulta de retiro (recall) sobre la tabla de procedencia
+    with tempfile.TemporaryDirectory() as tmp:
+        node = BlockchainNode("Bench", os.path.join(tmp, "bench.db"), storage_profile="bench")
+        print(f"[*] Generando grafo de procedencia con {args.shipments:,} envios...")
+        levels = build_lineage_db(node, args.shipments)
+        lot, product = levels[0][7], levels[-1][7]
+        print("\nConsultas de procedencia:")
+        seconds, descendants = timed(lambda: node.get_descendants(lot))
+        report(f"descendientes de un lote ({len(descendants)})", seconds, 1)
+        seconds, ancestors = timed(lambda: node.get_ancestors(product))
+        report(f"ancestros de un producto ({len(ancestors)})", seconds, 1)
+        seconds, near = timed(lambda: node.get_descendants(lot, max_depth=1))
+        report(f"descendientes directos ({len(near)})", seconds, 1)
+        node.close()
+
+
+def bench_merkle(args):
+    #Arbol de Merkle sobre hex concatenado (v1) contra digests binarios (v2)
+    for count in (1000, 10000, 100000):
+        digests = [hashlib.sha256(str(i).encode()).digest() for i in range(count)]
+        hex_hashes = [d.hex() for d in digests]
+        print(f"Arbol de Merkle con {count} transacciones:")
+        legacy, _ = timed(lambda: legacy_merkle_levels(hex_hashes))
+        report("hex concatenado (v1)", legacy, count)
+        binary, _ = timed(lambda: merkle_levels(digests))
+        report("digests binarios (v2)", binary, count)
+        print(f"  aceleracion: {legacy / binary:.2f}x")
+
+
+def bench_block_load(args):
+    #Lectura de bloques guardados: reconstruccion completa contra carga perezosa
+    block_json = Block(2, make_transactions(args.txs), "0" * 64, "Bench").to_json()
+    print(f"Carga de un bloque de {args.txs} transacciones:")
+    eager, _ = timed(lambda: Block.from_json(block_json).hash)
+    report("from_json completo", eager, args.txs)
+    lazy, _ = timed(lambda: LazyBlock.from_json(block_json).hash)
+    report("LazyBlock solo encabezado", lazy, args.txs)
+    relay, _ = timed(lambda: LazyBlock.from_json(block_json).to_json())
+    report("LazyBlock reenviado (to_json)", relay, args.txs)
+    full, _ = timed(lambda: LazyBlock.from_json(block_json).verify_merkle_root())
+    report("LazyBlock + verify_merkle_root", full, args.txs)
+    print(f"  aceleracion solo encabezado: {eager / lazy:.1f}x")
+
+
+def bench_block_store(args):
+    #Cuerpos de bloque en la tabla de SQLite contra el log segmentado con mmap
+    txs_per_block = 20
+    blocks = max(1, args.txs // txs_per_block)
+    txs = make_transactions(blocks * txs_per_block)
+    for tx in txs:
+        tx.signature = "0" * 128
+    print(f"{blocks} bloques de {txs_per_block} transacciones (perfil balanced):")
+    for store in ("table", "log"):
+        with tempfile.TemporaryDirectory() as tmp:
+            node = BlockchainNode(
+                "Bench", os.path.join(tmp, "bench.db"), storage_profile="balanced", block_store=store
+            )
+            latencies = []
+            prev_hash = "0" * 64
+            for index in range(1, blocks + 1):
+                block = Block(index, txs[(index - 1) * txs_per_block:index * txs_per_block], prev_hash, "Bench")
+                seconds, _ = timed(lambda: node.save_block_to_db(block))
+                latencies.append(seconds)
+                prev_hash = block.hash
+            latencies.sort()
+            print(f"\n[{store}]")
+            print(
+                f"  agregar bloque: mediana {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+                f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms"
+            )
+            seconds, chain = timed(node.load_chain)
+            report("load_chain secuencial", seconds, len(chain))
+            seconds, body = timed(lambda: "[" + ",".join(node.iter_blocks_json()) + "]")
+            report("cuerpo de /chain", seconds, blocks)
+            print(f"  {len(body) / 2**20 / seconds:,.0f} MiB/s")
+            seconds, _ = timed(lambda: [node.get_block_by_index(random.randint(1, blocks)) for _ in range(1000)])
+            report("1000 bloques al azar", seconds, 1000)
+            node.close()
+
+
+BENCHMARKS = {
+    "block-load": bench_block_load,
+    "block-store": bench_block_store,
+    "block-apply": bench_block_apply,
+    "bootstrap": bench_bootstrap,
+    "history": bench_history,
+    "lineage": bench_lineage,
+    "merkle": bench_merkle,
+    "query-plans": bench_query_plans,
+    "rules": bench_rules,
+    "state-root": bench_state_root,
+    "storage": bench_storage,
+    "chain-memory": bench_chain_memory,
+    "crypto": bench_crypto,
+    "tx-hash": bench_tx_hash,
+    "tx-encoding": bench_tx_encoding,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks del nucleo de la blockchain")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS) + ["all"])
+    parser.add_argument("--txs", type=int, default=10000, help="Transacciones por bloque")
+    parser.add_argument("--shipments", type=int, default=1000000, help="Envios en el grafo de procedencia")
+    args = parser.parse_args()
+
+    names = sorted(BENCHMARKS) if args.benchmark == "all" else [args.benchmark]
+    for name in names:
+        print(f"\n=== {name} ===")
+        BENCHMARKS[name](args)
@@ -1,11 +1,384 @@
+import gzip
 import hashlib
 import json
+import mmap
 import time
 import sqlite3
+import math
+import multiprocessing
 import os
+import struct
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import count, groupby
 from enum import Enum
 from typing import List, Dict, Any
-from ecdsa import SigningKey, VerifyingKey, SECP256k1, BadSignatureError
+from ecdsa import (
+    SigningKey,
+    VerifyingKey,
+    SECP256k1,
+    BadSignatureError,
+    MalformedPointError,
+)
+from ecdsa.util import sigdecode_der, sigdecode_string, sigencode_der, sigencode_string
+
+#Backend nativo opcional, si libsecp256k1 no esta instalado usamos ecdsa puro
+try:
+    import coincurve
+except ImportError:
+    coincurve = None
+
+#Candado de archivo para el unico proceso que escribe el log de bloques (msvcrt en Windows)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+#Caches compartidos por todo el proceso (mempool, recepcion de bloques y minado)
+class LRUCache:
+    #Cache acotada que descarta lo menos usado y lleva la cuenta de aciertos y fallos
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        #Resumen para monitorear que tan util esta siendo la cache
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+#El consorcio tiene pocas llaves asi que con un tamano modesto nunca se desalojan
+VERIFYING_KEY_CACHE = LRUCache(maxsize=1024)
+#Resultado de cada firma ya verificada, indexado por (tx_hash, firma)
+#Asi una transaccion se verifica una sola vez aunque pase por mempool, minado y gossip
+SIGNATURE_CACHE = LRUCache(maxsize=50000)
+
+
+def cache_stats():
+    #Exponemos las tasas de acierto de las caches criptograficas del nodo
+    return {
+        "verifying_keys": VERIFYING_KEY_CACHE.stats(),
+        "signatures": SIGNATURE_CACHE.stats(),
+    }
+
+
+#Backends criptograficos
+#Todas las firmas son ECDSA sobre SECP256k1 del hash de la transaccion (texto hex) con SHA1
+#que es el comportamiento por defecto de ecdsa, y se guardan como r||s en 64 bytes hex
+class CryptoBackend:
+    name = "base"
+
+    def generate_private_key(self) -> str:
+        raise NotImplementedError
+
+    def public_key_from_private(self, private_key_hex: str) -> str:
+        raise NotImplementedError
+
+    def load_signing_key(self, private_key_hex: str):
+        raise NotImplementedError
+
+    def load_verifying_key(self, public_key_hex: str):
+        raise NotImplementedError
+
+    def sign(self, signing_key, message: bytes) -> str:
+        raise NotImplementedError
+
+    def verify(self, verifying_key, signature_hex: str, message: bytes) -> bool:
+        raise NotImplementedError
+
+
+class EcdsaBackend(CryptoBackend):
+    #Implementacion en Python puro, siempre disponible
+    name = "ecdsa"
+
+    def generate_private_key(self):
+        return SigningKey.generate(curve=SECP256k1).to_string().hex()
+
+    def public_key_from_private(self, private_key_hex):
+        return self.load_signing_key(private_key_hex).verifying_key.to_string().hex()
+
+    def load_signing_key(self, private_key_hex):
+        return SigningKey.from_string(bytes.fromhex(private_key_hex), curve=SECP256k1)
+
+    def load_verifying_key(self, public_key_hex):
+        return VerifyingKey.from_string(bytes.fromhex(public_key_hex), curve=SECP256k1)
+
+    def sign(self, signing_key, message):
+        return signing_key.sign(message).hex()
+
+    def verify(self, verifying_key, signature_hex, message):
+        try:
+            return verifying_key.verify(bytes.fromhex(signature_hex), message)
+        except (BadSignatureError, ValueError):
+            return False
+
+
+class CoincurveBackend(CryptoBackend):
+    #Envuelve libsecp256k1 (via coincurve), mucho mas rapido que ecdsa puro
+    name = "coincurve"
+    _order = SECP256k1.order
+
+    @staticmethod
+    def _hasher(message):
+        #libsecp256k1 firma digests de 32 bytes, rellenamos el SHA1 con ceros a la izquierda
+        #para que represente el mismo numero que usa ecdsa
+        return bytes(12) + hashlib.sha1(message).digest()
+
+    def generate_private_key(self):
+        return coincurve.PrivateKey().secret.hex()
+
+    def public_key_from_private(self, private_key_hex):
+        return self.load_signing_key(private_key_hex).public_key.format(compressed=False)[1:].hex()
+
+    def load_signing_key(self, private_key_hex):
+        return coincurve.PrivateKey(bytes.fromhex(private_key_hex))
+
+    def load_verifying_key(self, public_key_hex):
+        raw = bytes.fromhex(public_key_hex)
+        if len(raw) != 64:
+            raise ValueError("Llave publica invalida")
+        return coincurve.PublicKey(b"\x04" + raw)
+
+    def sign(self, signing_key, message):
+        der = signing_key.sign(message, hasher=self._hasher)
+        r, s = sigdecode_der(der, self._order)
+        return sigencode_string(r, s, self._order).hex()
+
+    def verify(self, verifying_key, signature_hex, message):
+        try:
+            r, s = sigdecode_string(bytes.fromhex(signature_hex), self._order)
+            if not (0 < r < self._order and 0 < s < self._order):
+                return False
+            #libsecp256k1 solo acepta S bajo, ecdsa puede generar S alto y ambos son validos
+            if s > self._order // 2:
+                s = self._order - s
+            der = sigencode_der(r, s, self._order)
+            return verifying_key.verify(der, message, hasher=self._hasher)
+        except (ValueError, MalformedPointError):
+            return False
+
+
+CRYPTO_BACKENDS = {"ecdsa": EcdsaBackend}
+if coincurve is not None:
+    CRYPTO_BACKENDS["coincurve"] = CoincurveBackend
+
+
+def cross_check_backends(reference: CryptoBackend, candidate: CryptoBackend, rounds: int = 3):
+    #Comprobamos que ambos backends den exactamente los mismos resultados antes de usar el nuevo
+    for i in range(rounds):
+        priv = reference.generate_private_key()
+        pub = reference.public_key_from_private(priv)
+        if candidate.public_key_from_private(priv) != pub:
+            return False
+        message = hashlib.sha256(f"cross-check-{i}".encode()).hexdigest().encode()
+        tampered = message[:-1] + b"0" if message[-1:] != b"0" else message[:-1] + b"1"
+        for signer in (reference, candidate):
+            signature = signer.sign(signer.load_signing_key(priv), message)
+            r, s = sigdecode_string(bytes.fromhex(signature), SECP256k1.order)
+            #La misma firma con S alto tambien debe aceptarse en ambos
+            high_s = sigencode_string(r, SECP256k1.order - s, SECP256k1.order).hex()
+            for backend in (reference, candidate):
+                vk = backend.load_verifying_key(pub)
+                if not backend.verify(vk, signature, message):
+                    return False
+                if not backend.verify(vk, high_s, message):
+                    return False
+                if backend.verify(vk, signature, tampered):
+                    return False
+    return True
+
+
+CRYPTO_BACKEND = EcdsaBackend()
+
+
+def set_crypto_backend(name: str = "auto"):
+    #Elegimos el backend al arrancar: "auto" usa el nativo si existe y pasa la verificacion cruzada
+    global CRYPTO_BACKEND
+    if name == "auto":
+        name = "coincurve" if "coincurve" in CRYPTO_BACKENDS else "ecdsa"
+    if name not in CRYPTO_BACKENDS:
+        raise ValueError(f"Backend criptografico no disponible: {name}")
+    backend = CRYPTO_BACKENDS[name]()
+    if backend.name != "ecdsa" and not cross_check_backends(EcdsaBackend(), backend):
+        print(f"[!] El backend {name} no coincide con ecdsa, usando ecdsa")
+        backend = EcdsaBackend()
+    CRYPTO_BACKEND = backend
+    #Las llaves cargadas pertenecen al backend anterior y los procesos hijos deben reiniciarse
+    VERIFYING_KEY_CACHE.clear()
+    shutdown_verifier()
+    return backend
+
+
+def get_crypto_backend():
+    return CRYPTO_BACKEND
+
+
+def get_verifying_key(public_key_hex: str):
+    #Decodificar y validar el punto de la curva es caro, lo hacemos una sola vez por llave
+    backend = CRYPTO_BACKEND
+    key = (backend.name, public_key_hex)
+    vk = VERIFYING_KEY_CACHE.get(key)
+    if vk is None:
+        vk = backend.load_verifying_key(public_key_hex)
+        VERIFYING_KEY_CACHE.put(key, vk)
+    return vk
+
+
+def verify_signature(sender_public_key: str, signature: str, tx_hash: str):
+    #Verificacion ECDSA pura, vive a nivel de modulo para poder mandarla a otros procesos
+    try:
+        vk = get_verifying_key(sender_public_key)
+        return CRYPTO_BACKEND.verify(vk, signature, tx_hash.encode())
+    except (MalformedPointError, ValueError, TypeError):
+        return False
+
+
+#Motor de verificacion por lotes
+#Numero de procesos para verificar firmas (se puede cambiar con configure_verifier)
+#Pocos por defecto: setup_network corre 11 nodos en la misma maquina y con un proceso por
+#nucleo en cada uno la maquina quedaba sobresuscrita
+VERIFY_WORKERS = int(os.environ.get("BLOCKCHAIN_VERIFY_WORKERS", min(2, os.cpu_count() or 1)))
+#Con pocos elementos sale mas caro mandar el trabajo a otro proceso que hacerlo aqui
+PARALLEL_VERIFY_THRESHOLD = 32
+
+_verify_pool = None
+_verify_pool_lock = threading.Lock()
+
+
+def configure_verifier(workers: int):
+    #Cambiamos el numero de procesos y cerramos el pool anterior si existia
+    global VERIFY_WORKERS
+    VERIFY_WORKERS = max(1, int(workers))
+    shutdown_verifier()
+
+
+def shutdown_verifier():
+    global _verify_pool
+    with _verify_pool_lock:
+        if _verify_pool is not None:
+            _verify_pool.shutdown(wait=True)
+            _verify_pool = None
+
+
+def _init_pool_worker(backend_name: str):
+    #Cada proceso hijo arranca limpio (sin caches ni pool), solo elegimos el backend del padre
+    #No toma ningun candado: en un proceso nuevo no hay nada que limpiar
+    global CRYPTO_BACKEND
+    CRYPTO_BACKEND = CRYPTO_BACKENDS[backend_name]()
+
+
+def _pool_context():
+    #El pool se crea tarde, con los hilos de Flask ya corriendo. Un fork copiaria candados
+    #tomados por otros hilos (caches, sqlite) y el hijo podria quedarse bloqueado para siempre,
+    #por eso los procesos salen de un forkserver (o de spawn donde no existe, como en Windows)
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _get_verify_pool():
+    #Creamos el pool de procesos solo cuando se necesita por primera vez
+    global _verify_pool
+    with _verify_pool_lock:
+        #El mismo pool se usa para verificar y para firmar lotes
+        if _verify_pool is None:
+            #Los procesos hijos usan el mismo backend criptografico que el padre
+            _verify_pool = ProcessPoolExecutor(
+                max_workers=VERIFY_WORKERS,
+                mp_context=_pool_context(),
+                initializer=_init_pool_worker,
+                initargs=(CRYPTO_BACKEND.name,),
+            )
+        return _verify_pool
+
+
+#Seleccion del backend al importar el modulo (BLOCKCHAIN_CRYPTO_BACKEND=auto|ecdsa|coincurve)
+set_crypto_backend(os.environ.get("BLOCKCHAIN_CRYPTO_BACKEND", "auto"))
+
+
+def sign_hashes(private_key_hex: str, tx_hashes: List[str]):
+    #Firma varios hashes con la misma llave, los procesos del pool la cargan una vez por lote
+    backend = CRYPTO_BACKEND
+    sk = backend.load_signing_key(private_key_hex)
+    return [backend.sign(sk, tx_hash.encode()) for tx_hash in tx_hashes]
+
+
+def verify_batch(transactions: List["Transaction"]):
+    #Verificamos las firmas de muchas transacciones repartiendo el trabajo entre los procesos del pool
+    #Regresa una lista de booleanos en el mismo orden que las transacciones recibidas
+    jobs = []
+    results = [False] * len(transactions)
+    for i, tx in enumerate(transactions):
+        if not tx.signature:
+            continue
+        tx_hash = tx.calculate_hash()
+        cached = SIGNATURE_CACHE.get((tx_hash, tx.signature))
+        if cached is None:
+            jobs.append((i, tx.sender, tx.signature, tx_hash))
+        else:
+            results[i] = cached
+
+    if not jobs:
+        return results
+
+    if VERIFY_WORKERS <= 1 or len(jobs) < PARALLEL_VERIFY_THRESHOLD:
+        checked = [verify_signature(*job[1:]) for job in jobs]
+    else:
+        senders, signatures, hashes = zip(*(job[1:] for job in jobs))
+        chunksize = max(1, len(jobs) // (VERIFY_WORKERS * 4))
+        try:
+            checked = list(
+                _get_verify_pool().map(
+                    verify_signature, senders, signatures, hashes, chunksize=chunksize
+                )
+            )
+        except Exception as e:
+            #Si el pool falla no detenemos la red, verificamos en este mismo hilo
+            print(f"[!] Fallo el pool de verificacion ({e}), verificando en serie")
+            shutdown_verifier()
+            checked = [verify_signature(*job[1:]) for job in jobs]
+
+    for (i, _, signature, tx_hash), ok in zip(jobs, checked):
+        SIGNATURE_CACHE.put((tx_hash, signature), ok)
+        results[i] = ok
+    return results
 
 
 #Modelos de Datos
@@ -21,223 +394,3012 @@ class ActionType(Enum):
     VOTE = "VOTE"
 
 
-class Transaction:
-    def __init__(
-        self,
-        sender_public_key: str,
-        receiver_public_key: str,
-        shipment_id: str,
-        action: ActionType,
-        location: str,
-        good_id: str = None,
-        quantity: float = None,
-        metadata: Dict[str, Any] = None,
-        timestamp: float = None,
-        signature: str = None,
-    ):
-        self.sender = sender_public_key
-        self.receiver = receiver_public_key
-        self.shipment_id = shipment_id
-        #Aseguramos que la accion se guarde como texto simple
-        self.action = action.value if isinstance(action, ActionType) else action
-        self.location = location
-        self.good_id = good_id
-        self.quantity = quantity
-        self.metadata = metadata if metadata else {}
-        self.timestamp = timestamp if timestamp else time.time()
-        self.signature = signature
-        #Calculamos el hash unico de la transaccion al momento de crearla
-        self.tx_hash = self.calculate_hash()
+#Versiones de la codificacion canonica que se firma y se hashea
+#La version 1 es el JSON original, la conservamos para que los bloques viejos sigan validando
+TX_VERSION_JSON = 1
+TX_VERSION_BINARY = 2
+#La version 2 guarda cantidad y tiempo siempre como double: 5 y 5.0 (o dos enteros mayores que
+#2**53 que redondean igual) firmaban los mismos bytes. La 3 distingue enteros y flotantes
+TX_VERSION_TYPED = 3
+TX_VERSION = TX_VERSION_TYPED
+
+
+_U32 = struct.Struct(">I")
+_F64 = struct.Struct(">d")
+#Los metadatos son libres, los guardamos como JSON compacto y ordenado
+_METADATA_ENCODER = json.JSONEncoder(sort_keys=True, separators=(",", ":"))
+
+
+def _encode_text(value: str):
+    #Cadenas con prefijo de longitud (4 bytes big endian) en UTF-8
+    #Solo texto: convertir con str() haria que 7 y "7" firmaran lo mismo
+    if type(value) is not str:
+        raise TypeError(f"Se esperaba texto y llego {type(value).__name__}")
+    raw = value.encode()
+    return _U32.pack(len(raw)) + raw
+
+
+def _encode_number(value):
+    #Numero con etiqueta de tipo (version 3): 0 sin valor, 1 double, 2 entero de cualquier
+    #tamano en complemento a dos big endian con prefijo de longitud
+    if value is None:
+        return b"\x00"
+    if type(value) is float:
+        return b"\x01" + _F64.pack(value)
+    if type(value) is int:
+        raw = value.to_bytes(value.bit_length() // 8 + 1, "big", signed=True)
+        return b"\x02" + _U32.pack(len(raw)) + raw
+    raise TypeError(f"Se esperaba un numero y llego {type(value).__name__}")
+
+
+@lru_cache(maxsize=1024)
+def _encode_key(value: str):
+    #Las llaves viajan como hex, en binario guardamos los 32/64 bytes crudos
+    #Si no es hex canonico (minusculas) la guardamos como texto para no perder informacion
+    try:
+        raw = bytes.fromhex(value)
+    except (TypeError, ValueError):
+        raw = None
+    if raw is not None and len(raw) < 256 and raw.hex() == value:
+        return b"\x01" + bytes((len(raw),)) + raw
+    return b"\x00" + _encode_text(value)
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+#Campos permitidos al leer transacciones y bloques: los bloques recibidos se guardan y se
+#reenvian tal como llegaron, un campo extra no entra en ningun hash y viajaria sin validar
+TX_FIELDS = frozenset(
+    (
+        "sender",
+        "receiver",
+        "shipment_id",
+        "action",
+        "good_id",
+        "quantity",
+        "timestamp",
+        "location",
+        "metadata",
+        "version",
+        "signature",
+    )
+)
+BLOCK_FIELDS = frozenset(
+    (
+        "index",
+        "timestamp",
+        "transactions",
+        "previous_hash",
+        "validator",
+        "merkle_root",
+        "hash",
+        "version",
+        "state_root",
+    )
+)
+
+
+def check_fields(data: Dict[str, Any], allowed, kind: str):
+    unknown = data.keys() - allowed
+    if unknown:
+        raise ValueError(f"{kind} con campos desconocidos: {', '.join(sorted(unknown))}")
+
+
+def is_finite_number(value):
+    #int o float finito (bool no cuenta). Los enteros deben caber en un INTEGER de SQLite
+    if type(value) is int:
+        return -2**63 <= value < 2**63
+    return type(value) is float and math.isfinite(value)
+
+
+def check_transaction(t: Dict[str, Any]):
+    #Campos y tipos de una transaccion recibida: ids y textos son str y los numeros finitos
+    #Asi cada motor de almacenamiento guarda exactamente el mismo valor que se firmo
+    check_fields(t, TX_FIELDS, "Transaccion")
+    for field in ("sender", "receiver", "shipment_id", "action", "location"):
+        if type(t.get(field)) is not str:
+            raise ValueError(f"Transaccion con {field} que no es texto")
+    for field in ("good_id", "signature"):
+        if t.get(field) is not None and type(t[field]) is not str:
+            raise ValueError(f"Transaccion con {field} que no es texto")
+    for field in ("quantity", "timestamp"):
+        if t.get(field) is not None and not is_finite_number(t[field]):
+            raise ValueError(f"Transaccion con {field} que no es un numero finito")
+    if t.get("metadata") is not None and type(t["metadata"]) is not dict:
+        raise ValueError("Transaccion con metadata que no es un objeto")
+    if "version" in t and type(t["version"]) is not int:
+        raise ValueError("Transaccion con version que no es un entero")
+
+
+def _unique_keys(pairs):
+    #object_pairs_hook de json: dos claves iguales se leerian distinto segun el parser
+    data = dict(pairs)
+    if len(data) != len(pairs):
+        raise ValueError("JSON con claves repetidas")
+    return data
+
+
+class Transaction:
+    #Usamos __slots__ porque al cargar la cadena se crean cientos de miles de objetos
+    #y el diccionario por instancia era la mayor parte de la memoria
+    __slots__ = (
+        "version",
+        "sender",
+        "receiver",
+        "shipment_id",
+        "action",
+        "location",
+        "good_id",
+        "quantity",
+        "metadata",
+        "timestamp",
+        "signature",
+        "tx_hash",
+        "_canonical",
+    )
+
+    def __init__(
+        self,
+        sender_public_key: str,
+        receiver_public_key: str,
+        shipment_id: str,
+        action: ActionType,
+        location: str,
+        good_id: str = None,
+        quantity: float = None,
+        metadata: Dict[str, Any] = None,
+        timestamp: float = None,
+        signature: str = None,
+        version: int = TX_VERSION,
+    ):
+        self.version = version
+        #Solo hay un punado de llaves y acciones, compartimos una sola copia de cada texto
+        self.sender = _intern(sender_public_key)
+        self.receiver = _intern(receiver_public_key)
+        self.shipment_id = shipment_id
+        #Aseguramos que la accion se guarde como texto simple
+        self.action = _intern(action.value if isinstance(action, ActionType) else action)
+        self.location = location
+        self.good_id = good_id
+        self.quantity = quantity
+        self.metadata = metadata if metadata else {}
+        self.timestamp = timestamp if timestamp else time.time()
+        if version == TX_VERSION_BINARY:
+            #La version 2 firma cantidad y tiempo como double: guardamos ese mismo valor
+            self.quantity = None if quantity is None else float(quantity)
+            self.timestamp = float(self.timestamp)
+        self.signature = signature
+        #Guardamos la codificacion canonica para no volver a serializar en cada firma o verificacion
+        self._canonical = None
+        self.tx_hash = None
+        #Calculamos el hash unico de la transaccion al momento de crearla
+        self.tx_hash = self.calculate_hash()
+
+    def to_dict(self):
+        #Convertimos el objeto a diccionario para poder guardarlo o enviarlo facil
+        data = {
+            "sender": self.sender,
+            "receiver": self.receiver,
+            "shipment_id": self.shipment_id,
+            "action": self.action,
+            "good_id": self.good_id,
+            "quantity": self.quantity,
+            "timestamp": self.timestamp,
+            "location": self.location,
+            "metadata": self.metadata,
+        }
+        #Las transacciones JSON no llevan version para que su hash no cambie
+        if self.version != TX_VERSION_JSON:
+            data["version"] = self.version
+        return data
+
+    @classmethod
+    def from_dict(cls, t: Dict[str, Any]):
+        #Reconstruimos la transaccion desde lo que recibimos por la red o guardamos en disco
+        #Si no trae version es una transaccion del formato JSON original
+        check_transaction(t)
+        return cls(
+            t["sender"],
+            t["receiver"],
+            t["shipment_id"],
+            ActionType(t["action"]),
+            t["location"],
+            t.get("good_id"),
+            t.get("quantity"),
+            t.get("metadata"),
+            t.get("timestamp"),
+            t.get("signature"),
+            t.get("version", TX_VERSION_JSON),
+        )
+
+    def encode_binary(self):
+        #Codificacion binaria determinista con campos en orden fijo
+        #version | emisor | receptor | envio | accion | ubicacion | bien | cantidad | tiempo | metadatos
+        buf = bytearray((self.version,))
+        buf += _encode_key(self.sender)
+        buf += _encode_key(self.receiver)
+        buf += _encode_text(self.shipment_id)
+        buf += _encode_text(self.action)
+        buf += _encode_text(self.location)
+        if self.good_id is None:
+            buf += b"\x00"
+        else:
+            buf += b"\x01" + _encode_text(self.good_id)
+        if self.version == TX_VERSION_BINARY:
+            if self.quantity is None:
+                buf += b"\x00"
+            else:
+                buf += b"\x01" + _F64.pack(self.quantity)
+            buf += _F64.pack(self.timestamp)
+        else:
+            buf += _encode_number(self.quantity)
+            buf += _encode_number(self.timestamp)
+        buf += _encode_text(_METADATA_ENCODER.encode(self.metadata) if self.metadata else "{}")
+        return bytes(buf)
+
+    def _encode_canonical(self):
+        if self.version == TX_VERSION_JSON:
+            return json.dumps(self.to_dict(), sort_keys=True).encode()
+        if self.version in (TX_VERSION_BINARY, TX_VERSION_TYPED):
+            return self.encode_binary()
+        raise ValueError(f"Version de transaccion desconocida: {self.version}")
+
+    def canonical_bytes(self):
+        #Bytes exactos que se firman y se hashean, se calculan una sola vez
+        if self._canonical is None:
+            self._canonical = self._encode_canonical()
+        return self._canonical
+
+    def calculate_hash(self):
+        #Aqui usamos SHA256 para crear una huella digital unica de la transaccion y asegurar integridad
+        #El resultado queda memorizado en tx_hash, si se modifica un campo hay que llamar invalidate_hash
+        if self.tx_hash is None:
+            #Si nadie pidio los bytes canonicos no los retenemos, en cadenas grandes pesan mucho
+            canonical = self._canonical if self._canonical is not None else self._encode_canonical()
+            self.tx_hash = hashlib.sha256(canonical).hexdigest()
+        return self.tx_hash
+
+    def invalidate_hash(self):
+        #Descartamos la codificacion memorizada despues de cambiar algun campo y recalculamos
+        self._canonical = None
+        self.tx_hash = None
+        return self.calculate_hash()
+
+    def sign_transaction(self, private_key_hex: str):
+        #Usamos criptografia asimetrica para firmar la transaccion y garantizar que realmente fuimos nosotros
+        #Para firmar muchas transacciones conviene crear un Wallet y reutilizarlo
+        try:
+            return Wallet(private_key_hex).sign(self)
+        except Exception as e:
+            print(f"Error al firmar: {e}")
+            return False
+
+    def is_valid(self):
+        #Verificamos matematicamente que la firma coincida con la clave publica del emisor
+        if not self.signature:
+            return False
+        #Si ya verificamos esta misma firma antes reutilizamos el resultado
+        tx_hash = self.calculate_hash()
+        key = (tx_hash, self.signature)
+        result = SIGNATURE_CACHE.get(key)
+        if result is None:
+            result = verify_signature(self.sender, self.signature, tx_hash)
+            SIGNATURE_CACHE.put(key, result)
+        return result
+
+class Wallet:
+    #Identidad de un participante: carga la llave privada una sola vez y firma con ella
+    def __init__(self, private_key_hex: str):
+        self.backend = CRYPTO_BACKEND
+        self._private_key_hex = private_key_hex
+        #Parsear la llave es lo caro, lo hacemos aqui y no en cada firma
+        self._signing_key = self.backend.load_signing_key(private_key_hex)
+        self.public_key = self.backend.public_key_from_private(private_key_hex)
+
+    @classmethod
+    def from_file(cls, key_path: str = "private_key.pem"):
+        with open(key_path, "r") as f:
+            return cls(f.read().strip())
+
+    def sign(self, tx: Transaction):
+        try:
+            tx.signature = self.backend.sign(self._signing_key, tx.calculate_hash().encode())
+            return True
+        except Exception as e:
+            print(f"Error al firmar: {e}")
+            return False
+
+    def sign_many(self, transactions: List[Transaction], parallel: bool = None):
+        #Firmamos un lote completo, en paralelo si es grande y hay varios nucleos
+        #Regresa una lista de booleanos en el mismo orden que las transacciones
+        if parallel is None:
+            parallel = VERIFY_WORKERS > 1 and len(transactions) >= PARALLEL_VERIFY_THRESHOLD
+        if not parallel:
+            return [self.sign(tx) for tx in transactions]
+
+        hashes = [tx.calculate_hash() for tx in transactions]
+        size = max(1, len(hashes) // (VERIFY_WORKERS * 4))
+        chunks = [hashes[i:i + size] for i in range(0, len(hashes), size)]
+        try:
+            signed = _get_verify_pool().map(
+                sign_hashes, [self._private_key_hex] * len(chunks), chunks
+            )
+            signatures = [sig for chunk in signed for sig in chunk]
+        except Exception as e:
+            print(f"[!] Fallo el pool de firmas ({e}), firmando en serie")
+            shutdown_verifier()
+            return [self.sign(tx) for tx in transactions]
+        for tx, signature in zip(transactions, signatures):
+            tx.signature = signature
+        return [True] * len(transactions)
+
+
+#Versiones del bloque, definen como se calcula la raiz de Merkle
+#La version 1 concatena hashes en hex, la conservamos para validar la cadena existente
+BLOCK_VERSION_LEGACY = 1
+BLOCK_VERSION_BINARY = 2
+BLOCK_VERSION = BLOCK_VERSION_BINARY
+
+
+def merkle_levels(digests: List[bytes]):
+    #Arbol de Merkle sobre digests crudos de 32 bytes, regresa todos los niveles (hojas primero)
+    #Si un nivel es impar el ultimo nodo se combina consigo mismo
+    if not digests:
+        return []
+    sha256 = hashlib.sha256
+    levels = [list(digests)]
+    level = levels[0]
+    while len(level) > 1:
+        if len(level) % 2:
+            level = level + [level[-1]]
+        level = [sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+        levels.append(level)
+    return levels
+
+
+def legacy_merkle_levels(hashes: List[str]):
+    #Arbol original de la version 1: concatena los hashes en hex y vuelve a codificar
+    if not hashes:
+        return []
+    levels = [list(hashes)]
+    level = levels[0]
+    while len(level) > 1:
+        temp = []
+        for i in range(0, len(level), 2):
+            combined = level[i] + (level[i + 1] if i + 1 < len(level) else level[i])
+            temp.append(hashlib.sha256(combined.encode()).hexdigest())
+        level = temp
+        levels.append(level)
+    return levels
+
+
+def merkle_branch(levels, position: int):
+    #Rama desde la hoja en position hasta la raiz, en el formato de verify_merkle_proof
+    branch = []
+    for level in levels[:-1]:
+        sibling = position ^ 1
+        if sibling >= len(level):
+            #Nivel impar, el ultimo nodo se combino consigo mismo
+            sibling = position
+        node = level[sibling]
+        branch.append(
+            {
+                "hash": node if isinstance(node, str) else node.hex(),
+                "side": "left" if sibling < position else "right",
+            }
+        )
+        position //= 2
+    return branch
+
+
+def block_header_hash(header: Dict[str, Any]):
+    #Hash del encabezado, se usa igual al crear bloques y al verificar pruebas de inclusion
+    data = {
+        "index": header["index"],
+        "timestamp": header["timestamp"],
+        "previous_hash": header["previous_hash"],
+        "merkle_root": header["merkle_root"],
+        "validator": header["validator"],
+    }
+    #Los bloques de la version 1 no incluyen la version para conservar su hash
+    version = header.get("version", BLOCK_VERSION_LEGACY)
+    if version != BLOCK_VERSION_LEGACY:
+        data["version"] = version
+    #La raiz de estado es opcional, los bloques sin ella conservan su hash
+    if header.get("state_root") is not None:
+        data["state_root"] = header["state_root"]
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def verify_merkle_proof(tx_hash: str, branch: List[Dict[str, str]], merkle_root: str, version: int = BLOCK_VERSION):
+    #Recalculamos la raiz subiendo por la rama, sin necesidad del bloque completo
+    try:
+        if version == BLOCK_VERSION_LEGACY:
+            current = tx_hash
+            for step in branch:
+                pair = step["hash"] + current if step["side"] == "left" else current + step["hash"]
+                current = hashlib.sha256(pair.encode()).hexdigest()
+            return current == merkle_root
+        current = bytes.fromhex(tx_hash)
+        for step in branch:
+            sibling = bytes.fromhex(step["hash"])
+            pair = sibling + current if step["side"] == "left" else current + sibling
+            current = hashlib.sha256(pair).digest()
+        return current.hex() == merkle_root
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
+def verify_inclusion_proof(proof: Dict[str, Any]):
+    #Verificador del lado del cliente para la respuesta de /proof/<tx_hash>
+    #Comprueba la transaccion, la rama de Merkle y que el encabezado no este alterado
+    try:
+        header = proof["block"]
+        tx_hash = proof["tx_hash"]
+        if block_header_hash(header) != header["hash"]:
+            return False, "El encabezado del bloque no coincide con su hash"
+        if "transaction" in proof:
+            tx = Transaction.from_dict(proof["transaction"])
+            if tx.tx_hash != tx_hash:
+                return False, "La transaccion no coincide con su hash"
+        version = header.get("version", BLOCK_VERSION_LEGACY)
+        if not verify_merkle_proof(tx_hash, proof["branch"], header["merkle_root"], version):
+            return False, "La rama de Merkle no lleva a la raiz del bloque"
+    except (KeyError, TypeError, ValueError) as e:
+        return False, f"Prueba mal formada: {e}"
+    return True, "Transaccion incluida en el bloque"
+
+
+class Block:
+    __slots__ = (
+        "index",
+        "timestamp",
+        "transactions",
+        "previous_hash",
+        "validator",
+        "version",
+        "merkle_root",
+        "hash",
+        "state_root",
+        "_merkle_levels",
+        "_json",
+    )
+
+    def __init__(
+        self,
+        index: int,
+        transactions: List[Transaction],
+        previous_hash: str,
+        validator_address: str,
+        timestamp: float = None,
+        hash: str = None,
+        version: int = BLOCK_VERSION,
+        state_root: str = None,
+    ):
+        self.index = index
+        self.timestamp = timestamp if timestamp else time.time()
+        self.transactions = transactions
+        self.previous_hash = previous_hash
+        self.validator = validator_address
+        self.version = version
+        #Raiz del estado de envios despues de aplicar el bloque (opcional)
+        self.state_root = state_root
+        self._merkle_levels = None
+        self._json = None
+        #Calculamos la raiz de Merkle para resumir todas las transacciones en un solo hash
+        self.merkle_root = self.compute_merkle_root()
+        #Generamos el hash del bloque para hacerlo inmutable
+        self.hash = hash
+        if not hash:
+            self.hash = self.calculate_block_hash()
+
+    @property
+    def merkle_levels(self):
+        #Niveles completos del arbol, sirven para recalcular la raiz y generar pruebas
+        if self._merkle_levels is None:
+            if self.version == BLOCK_VERSION_LEGACY:
+                self._merkle_levels = legacy_merkle_levels(
+                    [tx.tx_hash for tx in self.transactions]
+                )
+            else:
+                self._merkle_levels = merkle_levels(
+                    [bytes.fromhex(tx.tx_hash) for tx in self.transactions]
+                )
+        return self._merkle_levels
+
+    def compute_merkle_root(self):
+        #Implementamos un Arbol de Merkle para agrupar eficientemente todos los hashes de las transacciones
+        #El arbol queda guardado en el bloque, la raiz se publica en hex por compatibilidad
+        self._merkle_levels = None
+        levels = self.merkle_levels
+        if not levels:
+            return ""
+        root = levels[-1][0]
+        return root if isinstance(root, str) else root.hex()
+
+    def header(self):
+        #Encabezado del bloque sin transacciones, suficiente para verificar pruebas de inclusion
+        data = {
+            "index": self.index,
+            "timestamp": self.timestamp,
+            "previous_hash": self.previous_hash,
+            "merkle_root": self.merkle_root,
+            "validator": self.validator,
+            "hash": self.hash,
+        }
+        if self.version != BLOCK_VERSION_LEGACY:
+            data["version"] = self.version
+        if self.state_root is not None:
+            data["state_root"] = self.state_root
+        return data
+
+    def calculate_block_hash(self):
+        #Creamos el hash del bloque vinculandolo con el anterior para formar la cadena irrompible
+        return block_header_hash(self.header())
+
+    def merkle_proof(self, tx_hash: str):
+        #Rama de Merkle desde la transaccion hasta la raiz, None si no esta en el bloque
+        position = next(
+            (i for i, tx in enumerate(self.transactions) if tx.tx_hash == tx_hash), None
+        )
+        if position is None:
+            return None
+        return merkle_branch(self.merkle_levels, position)
+
+    def verify_merkle_root(self):
+        #Recalculamos la raiz desde las transacciones y la comparamos con la publicada
+        return self.compute_merkle_root() == self.merkle_root
+
+    def transactions_data(self):
+        return [
+            {**tx.to_dict(), "signature": tx.signature}
+            for tx in self.transactions
+        ]
+
+    def to_json(self):
+        #Preparamos el bloque en formato JSON para guardarlo
+        #Un bloque ya hasheado no cambia, asi que se serializa una sola vez para guardar y propagar
+        if self._json is not None:
+            return self._json
+        data = {
+            "index": self.index,
+            "timestamp": self.timestamp,
+            "transactions": self.transactions_data(),
+            "previous_hash": self.previous_hash,
+            "validator": self.validator,
+            "merkle_root": self.merkle_root,
+            "hash": self.hash,
+        }
+        if self.version != BLOCK_VERSION_LEGACY:
+            data["version"] = self.version
+        if self.state_root is not None:
+            data["state_root"] = self.state_root
+        self._json = json.dumps(data)
+        return self._json
+
+
+    @staticmethod
+    def from_json(json_str):
+        #Reconstruimos el bloque desde el texto JSON que recibimos
+        d = json.loads(json_str)
+        check_fields(d, BLOCK_FIELDS, "Bloque")
+        txs = [Transaction.from_dict(t) for t in d["transactions"]]
+        return Block(
+            d["index"],
+            txs,
+            d["previous_hash"],
+            d["validator"],
+            d["timestamp"],
+            d["hash"],
+            d.get("version", BLOCK_VERSION_LEGACY),
+            d.get("state_root"),
+        )
+
+
+class LazyBlock(Block):
+    #Bloque leido de JSON: el encabezado se toma tal cual y las transacciones se construyen
+    #solo cuando alguien las pide. La raiz de Merkle publicada se confia hasta llamar a
+    #verify_merkle_root, que es lo que hace validate_block antes de aceptar el bloque
+    #De las transacciones solo guardamos el texto JSON (o el dict si no hay texto) y su numero,
+    #los dicts de load_chain ocupaban mas que los propios objetos Transaction
+    __slots__ = ("_tx_data", "_tx_objects", "_tx_count")
+
+    def __init__(self, data: Dict[str, Any]):
+        check_fields(data, BLOCK_FIELDS, "Bloque")
+        self.index = data["index"]
+        self.timestamp = data["timestamp"]
+        self.previous_hash = data["previous_hash"]
+        self.validator = data["validator"]
+        self.version = data.get("version", BLOCK_VERSION_LEGACY)
+        self.merkle_root = data["merkle_root"]
+        self.hash = data["hash"]
+        self.state_root = data.get("state_root")
+        self._merkle_levels = None
+        self._json = None
+        self._tx_data = data["transactions"]
+        self._tx_count = len(self._tx_data)
+        self._tx_objects = None
+
+    @classmethod
+    def from_json(cls, json_str, strict=False):
+        #Conservamos el texto original, to_json lo regresa sin volver a serializar
+        #Acepta bytes tal como llegan por la red. strict (bloques recibidos por la red) revisa
+        #ademas los campos de cada transaccion y que no haya claves repetidas antes de
+        #quedarnos con el texto, los bloques de la base ya pasaron por aqui
+        if strict:
+            data = json.loads(json_str, object_pairs_hook=_unique_keys)
+            for tx in data.get("transactions", []):
+                check_transaction(tx)
+        else:
+            data = json.loads(json_str)
+        block = cls(data)
+        block._json = json_str.decode() if isinstance(json_str, bytes) else json_str
+        #Con el texto guardado los dicts sobran, se vuelven a leer si se piden
+        block._tx_data = None
+        return block
+
+    def _load_tx_data(self):
+        if self._tx_data is not None:
+            return self._tx_data
+        return json.loads(self._json)["transactions"]
+
+    @property
+    def transactions(self):
+        if self._tx_objects is None:
+            self._tx_objects = [Transaction.from_dict(t) for t in self._load_tx_data()]
+            self._tx_data = None
+        return self._tx_objects
+
+    @transactions.setter
+    def transactions(self, value):
+        self._tx_objects = value
+        self._tx_data = None
+        self._json = None
+
+    @property
+    def tx_count(self):
+        #Numero de transacciones sin tener que construirlas
+        if self._tx_objects is None:
+            return self._tx_count
+        return len(self._tx_objects)
+
+    def transactions_data(self):
+        #Si nadie toco las transacciones las reenviamos tal como llegaron
+        if self._tx_objects is None:
+            return self._load_tx_data()
+        return super().transactions_data()
+
+
+#Perfiles de almacenamiento, se aplican como PRAGMA a cada conexion al abrirla
+#WAL deja que los lectores (dashboard, view_blockchain, hilos de Flask) lean mientras el minero escribe
+STORAGE_PROFILES = {
+    #Cada commit se sincroniza a disco, mismo nivel de seguridad que antes
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -2000,
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+    },
+    #Un corte de luz puede perder los ultimos commits pero la base nunca se corrompe
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,
+        "mmap_size": 256 * 2**20,
+        "temp_store": "MEMORY",
+    },
+    #Solo para pruebas de rendimiento, sin fsync ni journal en disco
+    "bench": {
+        "journal_mode": "MEMORY",
+        "synchronous": "OFF",
+        "cache_size": -262144,
+        "mmap_size": 1024 * 2**20,
+        "temp_store": "MEMORY",
+    },
+}
+#BLOCKCHAIN_STORAGE_PROFILE=durable|balanced|bench
+DEFAULT_STORAGE_PROFILE = os.environ.get("BLOCKCHAIN_STORAGE_PROFILE", "durable")
+
+
+def storage_pragmas(profile: str):
+    if profile not in STORAGE_PROFILES:
+        raise ValueError(f"Perfil de almacenamiento desconocido: {profile}")
+    return STORAGE_PROFILES[profile]
+
+
+class ConnectionManager:
+    #Pool acotado de conexiones: cada operacion toma una conexion libre y la devuelve al
+    #terminar (with db.connection() as conn). Antes habia una por hilo y Flask atiende cada
+    #peticion en un hilo nuevo, asi que cada peticion abria otra y repetia los PRAGMA
+    #Dentro de una operacion el mismo hilo recibe la misma conexion (llamadas anidadas)
+    #sqlite3 guarda las sentencias preparadas de cada conexion
+    def __init__(self, db_file, pragmas: Dict[str, Any] = None, cached_statements=256, max_connections=8):
+        self.db_file = db_file
+        self.pragmas = pragmas or {}
+        self.cached_statements = cached_statements
+        self.max_connections = max_connections
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        self._idle = []
+        #Conexion prestada -> generacion de PRAGMA con la que se abrio
+        self._in_use = {}
+        self._open = 0
+        self._generation = 0
+        self._closed = False
+
+    @contextmanager
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+        conn = self._checkout()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._checkin(conn)
+
+    def _checkout(self):
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("La base de datos ya se cerro")
+                if self._idle:
+                    conn = self._idle.pop()
+                    self._in_use[conn] = self._generation
+                    return conn
+                if self._open < self.max_connections:
+                    self._open += 1
+                    generation = self._generation
+                    break
+                self._cond.wait()
+        try:
+            conn = self._connect()
+            for name, value in self.pragmas.items():
+                conn.execute(f"PRAGMA {name}={value}")
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._in_use[conn] = generation
+        return conn
+
+    def _checkin(self, conn):
+        #Una transaccion que quedo abierta (por un error) no pasa a la siguiente operacion
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            generation = self._in_use.pop(conn)
+            if self._closed or generation != self._generation:
+                conn.close()
+                self._open -= 1
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def _connect(self):
+        #check_same_thread=False: la conexion pasa de un hilo a otro entre operaciones
+        return sqlite3.connect(
+            self.db_file,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+        )
+
+    def set_pragmas(self, pragmas: Dict[str, Any]):
+        #Las conexiones libres se cierran y las prestadas al devolverse, las nuevas usan los
+        #PRAGMA actualizados
+        with self._cond:
+            self.pragmas = pragmas
+            self._generation += 1
+            self._close_idle()
+
+    def open_connections(self):
+        with self._cond:
+            return self._open
+
+    def _close_idle(self):
+        for conn in self._idle:
+            conn.close()
+        self._open -= len(self._idle)
+        self._idle.clear()
+
+    def close(self):
+        #Las conexiones prestadas se cierran cuando su operacion las devuelve
+        with self._cond:
+            self._closed = True
+            self._close_idle()
+            self._cond.notify_all()
+
+
+class SharedCacheConnection(sqlite3.Connection):
+    #En cache compartida SQLite no espera (busy_timeout) si otra conexion tiene la tabla
+    #bloqueada, falla de inmediato. Reintentamos hasta timeout como haria con un archivo
+    lock_timeout = 5.0
+
+    def _retry(self, fn, *args):
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            try:
+                return fn(*args)
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or time.monotonic() > deadline:
+                    raise
+                time.sleep(0.001)
+
+    def execute(self, *args):
+        return self._retry(super().execute, *args)
+
+    def executemany(self, *args):
+        return self._retry(super().executemany, *args)
+
+    def commit(self):
+        return self._retry(super().commit)
+
+
+_MEMORY_DATABASES = count(1)
+
+
+class MemoryConnectionManager(ConnectionManager):
+    #SQLiteStorage con db_path=":memory:": mismo esquema y mismas consultas que en disco
+    #Con ":memory:" cada conexion (una por hilo) tendria su propia base vacia, por eso todas
+    #abren una base con nombre en cache compartida. La conexion ancla la mantiene viva hasta
+    #close(), despues el contenido se pierde
+    def __init__(self, db_file=":memory:", pragmas: Dict[str, Any] = None, cached_statements=256):
+        super().__init__(db_file, pragmas, cached_statements)
+        self.uri = f"file:blockchain-{os.getpid()}-{next(_MEMORY_DATABASES)}?mode=memory&cache=shared"
+        self._anchor = self._connect()
+
+    def _connect(self):
+        return sqlite3.connect(
+            self.uri,
+            uri=True,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+            factory=SharedCacheConnection,
+        )
+
+    def close(self):
+        super().close()
+        if self._anchor is not None:
+            self._anchor.close()
+            self._anchor = None
+
+
+#Donde se guardan los cuerpos de los bloques, el estado mutable siempre queda en SQLite
+#BLOCKCHAIN_BLOCK_STORE=table|log (sin valor se usa el que ya tenga la base, o table)
+DEFAULT_BLOCK_STORE = os.environ.get("BLOCKCHAIN_BLOCK_STORE")
+
+
+class TableBlockStore:
+    #Cuerpo de cada bloque como TEXT en la columna blocks.data (almacenamiento original)
+    #Se escribe dentro de la misma transaccion que el estado, append y truncate no hacen nada
+    name = "table"
+
+    def __init__(self, db: ConnectionManager):
+        self.db = db
+        self.fsync = False
+        self.writable = True
+
+    def open_writer(self):
+        pass
+
+    def column_value(self, data: str):
+        #Valor de blocks.data al insertar la fila del bloque
+        return data
+
+    def append(self, index: int, data: str):
+        pass
+
+    def truncate(self, height: int):
+        pass
+
+    def get(self, index: int):
+        with self.db.connection() as conn:
+            row = conn.execute(
+                "SELECT data FROM blocks WHERE block_index = ?", (index,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def scan(self, start: int = 1, end: int = None, batch: int = 256):
+        #(indice, JSON) de los bloques con cuerpo entre start y end, en orden
+        #Se lee por lotes y la conexion se devuelve al pool entre lotes: un generador a medias
+        #no retiene una conexion ni deja abierta una lectura que bloquee al escritor
+        end = sys.maxsize if end is None else end
+        while start <= end:
+            with self.db.connection() as conn:
+                rows = conn.execute(
+                    "SELECT block_index, data FROM blocks WHERE block_index BETWEEN ? AND ? AND data IS NOT NULL ORDER BY block_index LIMIT ?",
+                    (start, end, batch),
+                ).fetchall()
+            yield from rows
+            if len(rows) < batch:
+                return
+            start = rows[-1][0] + 1
+
+    def prune(self, first: int, last: int):
+        with self.db.connection() as conn:
+            conn.execute(
+                "UPDATE blocks SET data = NULL WHERE block_index BETWEEN ? AND ?", (first, last)
+            )
+            conn.commit()
+        #El espacio queda en las paginas libres de SQLite, prune_blocks lo mide
+        return 0
+
+    def close(self):
+        pass
+
+
+class BlockLog:
+    #Cuerpos de bloque en archivos de segmento de solo escritura al final (un JSON por linea)
+    #y un indice compacto altura -> (segmento, offset, largo) de 16 bytes por bloque
+    #Las lecturas usan mmap del segmento, SQLite solo guarda encabezados y estado mutable
+    #Un solo proceso escribe (el que guarda bloques, normalmente p2p.py): open_writer toma un
+    #candado exclusivo y recorta la cola que quedo por encima de la altura confirmada en SQLite
+    #(el cuerpo se escribe antes del commit). Los demas procesos abren el log solo para leer
+    #y nunca ven entradas por encima de committed_height()
+    name = "log"
+    ENTRY = struct.Struct("<IQI")
+
+    def __init__(self, directory: str, committed_height, segment_size: int = 64 * 2**20, fsync: bool = True):
+        self.directory = directory
+        self.committed_height = committed_height
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self.writable = False
+        self._lock = threading.Lock()
+        self._maps = {}
+        self._lock_file = None
+        self._segment_file = None
+        os.makedirs(directory, exist_ok=True)
+        self._index_path = os.path.join(directory, "index.bin")
+        if not os.path.exists(self._index_path):
+            open(self._index_path, "ab").close()
+        self._index_file = open(self._index_path, "rb")
+        self._index = bytearray()
+
+    def _segment_path(self, segment: int):
+        return os.path.join(self.directory, f"segment-{segment:06d}.log")
+
+    def _segments(self):
+        return sorted(
+            int(name[8:14])
+            for name in os.listdir(self.directory)
+            if name.startswith("segment-") and name.endswith(".log")
+        )
+
+    def _open_segment(self, segment: int):
+        self._active = segment
+        self._segment_file = open(self._segment_path(segment), "ab")
+        self._active_size = self._segment_file.tell()
+
+    def _close_map(self, segment: int):
+        mapped = self._maps.pop(segment, None)
+        if mapped is not None:
+            mapped.close()
+
+    def _entry(self, position: int):
+        return self.ENTRY.unpack_from(self._index, position * self.ENTRY.size)
+
+    def height(self):
+        return len(self._index) // self.ENTRY.size
+
+    def open_writer(self):
+        #Convierte este proceso en el escritor del log, falla si otro proceso ya lo es
+        with self._lock:
+            if self.writable:
+                return
+            lock_file = open(os.path.join(self.directory, "LOCK"), "a+b")
+            try:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            except OSError:
+                lock_file.close()
+                raise RuntimeError(f"Otro proceso esta escribiendo el log de bloques {self.directory}")
+            self._lock_file = lock_file
+            self._index_file.close()
+            self._index_file = open(self._index_path, "r+b")
+            self._index = bytearray(self._index_file.read())
+            #Una entrada escrita a medias (corte de luz) se descarta
+            del self._index[len(self._index) - len(self._index) % self.ENTRY.size:]
+            self._index_file.truncate(len(self._index))
+            self.writable = True
+            self._truncate(self.committed_height())
+            if self._segment_file is None:
+                segments = self._segments()
+                self._open_segment(segments[-1] if segments else 0)
+
+    def _check_writer(self):
+        if not self.writable:
+            raise RuntimeError("El log de bloques esta abierto solo para lectura")
+
+    def column_value(self, data: str):
+        #blocks.data queda en NULL, el cuerpo vive en el log
+        return None
+
+    def append(self, index: int, data: str):
+        raw = data.encode()
+        with self._lock:
+            self._check_writer()
+            #Los huecos (bloques anteriores a una instantanea) quedan como entradas vacias
+            missing = index - 1 - self.height()
+            if missing < 0:
+                raise ValueError(f"El log ya tiene el bloque #{index}")
+            if self._active_size and self._active_size + len(raw) + 1 > self.segment_size:
+                self._segment_file.close()
+                self._open_segment(self._active + 1)
+            entries = bytes(missing * self.ENTRY.size) + self.ENTRY.pack(
+                self._active, self._active_size, len(raw)
+            )
+            self._segment_file.write(raw + b"\n")
+            self._segment_file.flush()
+            self._index_file.seek(len(self._index))
+            self._index_file.write(entries)
+            self._index_file.flush()
+            if self.fsync:
+                os.fsync(self._segment_file.fileno())
+                os.fsync(self._index_file.fileno())
+            self._index += entries
+            self._active_size += len(raw) + 1
+
+    def truncate(self, height: int):
+        #Descarta los bloques por encima de height (escritos pero sin commit en SQLite)
+        with self._lock:
+            self._check_writer()
+            self._truncate(height)
+
+    def _truncate(self, height: int):
+        height = max(height, 0)
+        if height >= self.height():
+            return
+        dropped = [self._entry(i) for i in range(height, self.height())]
+        del self._index[height * self.ENTRY.size:]
+        self._index_file.truncate(len(self._index))
+        first = next(((seg, off) for seg, off, length in dropped if length), None)
+        if first is None:
+            return
+        segment, offset = first
+        if self._segment_file is not None:
+            self._segment_file.close()
+        for later in self._segments():
+            if later >= segment:
+                self._close_map(later)
+            if later > segment:
+                os.remove(self._segment_path(later))
+        os.truncate(self._segment_path(segment), offset)
+        self._open_segment(segment)
+
+    def _read(self, segment: int, offset: int, length: int):
+        mapped = self._maps.get(segment)
+        if mapped is None or offset + length > len(mapped):
+            #El segmento activo crece, se vuelve a mapear cuando se pide algo nuevo
+            self._close_map(segment)
+            try:
+                with open(self._segment_path(segment), "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (FileNotFoundError, ValueError):
+                return None
+            self._maps[segment] = mapped
+        return mapped[offset:offset + length].decode()
+
+    def _refresh(self, height: int):
+        #Un lector solo carga entradas confirmadas, las de arriba todavia pueden recortarse
+        if self.writable or height <= self.height():
+            return
+        self._index_file.seek(len(self._index))
+        tail = self._index_file.read((height - self.height()) * self.ENTRY.size)
+        self._index += tail[:len(tail) - len(tail) % self.ENTRY.size]
+
+    def _get(self, index: int):
+        if index > self.height():
+            return None
+        segment, offset, length = self._entry(index - 1)
+        return self._read(segment, offset, length) if length else None
+
+    def get(self, index: int):
+        height = self.committed_height()
+        if not 0 < index <= height:
+            return None
+        with self._lock:
+            self._refresh(height)
+            return self._get(index)
+
+    def scan(self, start: int = 1, end: int = None):
+        height = self.committed_height()
+        end = height if end is None else min(end, height)
+        with self._lock:
+            self._refresh(height)
+        for index in range(max(start, 1), end + 1):
+            with self._lock:
+                data = self._get(index)
+            if data is not None:
+                yield index, data
+
+    def prune(self, first: int, last: int):
+        #Vacia las entradas del indice y borra los segmentos que ya no tienen bloques vivos
+        with self._lock:
+            self._check_writer()
+            last = min(last, self.height())
+            if last < first:
+                return 0
+            pruned = {self._entry(i)[0] for i in range(first - 1, last) if self._entry(i)[2]}
+            live = {self._entry(i)[0] for i in range(last, self.height()) if self._entry(i)[2]}
+            live.add(self._active)
+            size = self.ENTRY.size
+            self._index[(first - 1) * size:last * size] = bytes((last - first + 1) * size)
+            self._index_file.seek((first - 1) * size)
+            self._index_file.write(self._index[(first - 1) * size:last * size])
+            self._index_file.flush()
+            if self.fsync:
+                os.fsync(self._index_file.fileno())
+            reclaimed = 0
+            for segment in pruned - live:
+                self._close_map(segment)
+                path = self._segment_path(segment)
+                if os.path.exists(path):
+                    reclaimed += os.path.getsize(path)
+                    os.remove(path)
+            return reclaimed
+
+    def close(self):
+        with self._lock:
+            for segment in list(self._maps):
+                self._close_map(segment)
+            if self._segment_file is not None:
+                self._segment_file.close()
+            self._index_file.close()
+            if self._lock_file is not None:
+                #Cerrar el archivo libera el candado de escritor
+                self._lock_file.close()
+                self._lock_file = None
+            self.writable = False
+
+
+BLOCK_STORES = ("table", "log")
+
+
+#Resultado de StateCache.get_shipment cuando la cache no sabe y hay que preguntar al almacenamiento
+STATE_UNKNOWN = object()
+
+
+class StateCache:
+    #Copia en memoria de los envios y participantes que leen las reglas del contrato
+    #El almacenamiento sigue siendo la fuente de verdad: la cache se carga al iniciar y se actualiza
+    #despues de cada commit de save_block_to_db. Si hay mas envios que max_shipments se
+    #desalojan los menos usados y los que falten se leen de la base (complete=False)
+    def __init__(self, max_shipments: int = 200000):
+        self.max_shipments = max_shipments
+        self.shipments = OrderedDict()
+        self.participants = set()
+        #Con la tabla completa en memoria un envio ausente es un envio que no existe
+        self.complete = False
+        self.hits = 0
+        self.misses = 0
+        #Cambia con cada bloque aplicado, evita guardar lecturas ya viejas
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def load(self, storage):
+        participants = storage.participant_keys()
+        rows = storage.recent_shipment_states(self.max_shipments + 1)
+        with self._lock:
+            self.participants = participants
+            self.complete = len(rows) <= self.max_shipments
+            self.shipments = OrderedDict(reversed(rows[: self.max_shipments]))
+            self.generation += 1
+
+    def has_participant(self, public_key):
+        return public_key in self.participants
+
+    def get_shipment(self, shipment_id):
+        #(dueño, ultima accion, activo), None si no existe o STATE_UNKNOWN si hay que ir al almacenamiento
+        with self._lock:
+            state = self.shipments.get(shipment_id)
+            if state is not None:
+                self.shipments.move_to_end(shipment_id)
+                self.hits += 1
+                return state
+            if self.complete:
+                self.hits += 1
+                return None
+            self.misses += 1
+            return STATE_UNKNOWN
+
+    def fill(self, shipment_id, state, generation):
+        #Guardamos lo leido del almacenamiento solo si ningun bloque se aplico mientras tanto
+        with self._lock:
+            if generation == self.generation and state is not None:
+                self._put(shipment_id, state)
+
+    def _put(self, shipment_id, state):
+        self.shipments[shipment_id] = state
+        self.shipments.move_to_end(shipment_id)
+        while len(self.shipments) > self.max_shipments:
+            self.shipments.popitem(last=False)
+            self.complete = False
+
+    def apply_block(self, transactions: List[Transaction]):
+        #Mismos efectos que STATE_UPDATES, en el mismo orden
+        with self._lock:
+            for tx in transactions:
+                kind = state_update_kind(tx)
+                if kind == "CREATE":
+                    self._put(tx.shipment_id, (tx.receiver, tx.action, 1))
+                    continue
+                if kind == "VOTE":
+                    continue
+                state = self.shipments.get(tx.shipment_id)
+                if state is None:
+                    #Si no esta en memoria el almacenamiento tiene la version correcta
+                    continue
+                if kind == "RETIRE":
+                    self.shipments[tx.shipment_id] = (state[0], tx.action, 0)
+                else:
+                    self.shipments[tx.shipment_id] = (tx.receiver, tx.action, 1)
+            self.generation += 1
+
+    def verify(self, storage):
+        #Autoverificacion: cada entrada en memoria debe coincidir con su fila en el almacenamiento
+        mismatches = []
+        with self._lock:
+            cached = list(self.shipments.items())
+            participants = set(self.participants)
+            complete = self.complete
+        for shipment_id, state in cached:
+            if storage.get_shipment_state(shipment_id) != state:
+                mismatches.append(shipment_id)
+        if complete:
+            total = storage.count_shipments()
+            if total != len(cached):
+                mismatches.append(f"{total - len(cached)} envios faltantes")
+        if storage.participant_keys() != participants:
+            mismatches.append("participantes")
+        return mismatches
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "shipments": len(self.shipments),
+                "max_shipments": self.max_shipments,
+                "participants": len(self.participants),
+                "complete": self.complete,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+#Migraciones del esquema, la posicion en la lista es la version que deja la base
+#(PRAGMA user_version). Las bases existentes de los nodos se actualizan al abrirlas
+SCHEMA_MIGRATIONS = [
+    #1: indices para el inventario de cada wallet, el orden de la mempool y la eleccion de delegados
+    [
+        "CREATE INDEX IF NOT EXISTS idx_shipments_owner_active ON shipments (current_owner_pk, is_active)",
+        "CREATE INDEX IF NOT EXISTS idx_mempool_timestamp ON mempool (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_participants_votes ON participants (votes DESC, name ASC)",
+    ],
+    #2: tabla normalizada de transacciones para consultar historiales sin decodificar bloques
+    #Las bases existentes se llenan con backfill_transactions (python node_admin.py backfill)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS transactions (
+            block_index INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            tx_hash TEXT NOT NULL,
+            sender TEXT,
+            receiver TEXT,
+            shipment_id TEXT,
+            action TEXT,
+            timestamp REAL,
+            PRIMARY KEY (block_index, position)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_transactions_hash ON transactions (tx_hash)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_shipment ON transactions (shipment_id, block_index, position)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_sender ON transactions (sender, block_index, position)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_receiver ON transactions (receiver, block_index, position)",
+    ],
+    #3: aristas de procedencia (insumo -> producto) y una tabla clave/valor del nodo
+    #Los bloques que ya existian se indexan con backfill_lineage hasta la altura guardada aqui
+    [
+        "CREATE TABLE IF NOT EXISTS node_meta (key TEXT PRIMARY KEY, value)",
+        """
+        CREATE TABLE IF NOT EXISTS lineage (
+            parent_id TEXT NOT NULL,
+            child_id TEXT NOT NULL,
+            block_index INTEGER,
+            PRIMARY KEY (parent_id, child_id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_lineage_child ON lineage (child_id, parent_id)",
+        "INSERT OR REPLACE INTO node_meta (key, value) SELECT 'lineage_backfill_height', COALESCE(MAX(block_index), 0) FROM blocks",
+    ],
+    #4: arbol de estado por cubetas y la raiz de estado de cada bloque
+    #El arbol de las bases existentes se construye al abrirlas (state_tree_stale)
+    [
+        "ALTER TABLE blocks ADD COLUMN state_root TEXT",
+        """
+        CREATE TABLE IF NOT EXISTS state_leaves (
+            shipment_id TEXT PRIMARY KEY,
+            bucket INTEGER NOT NULL,
+            leaf BLOB NOT NULL
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_state_leaves_bucket ON state_leaves (bucket, shipment_id, leaf)",
+        "CREATE TABLE IF NOT EXISTS state_buckets (bucket INTEGER PRIMARY KEY, hash BLOB NOT NULL)",
+        "INSERT OR REPLACE INTO node_meta (key, value) VALUES ('state_tree_stale', 1)",
+    ],
+    #5: encabezado en JSON para los bloques cuyo cuerpo se poda (data queda en NULL)
+    [
+        "ALTER TABLE blocks ADD COLUMN header TEXT",
+    ],
+    #6: las hojas del arbol de estado ya no incluyen last_updated_timestamp, se reconstruye
+    [
+        "INSERT OR REPLACE INTO node_meta (key, value) VALUES ('state_tree_stale', 1)",
+    ],
+]
+SCHEMA_VERSION = len(SCHEMA_MIGRATIONS)
+
+#Consultas frecuentes que deben resolverse con un indice (ver explain_hot_queries)
+HOT_QUERIES = {
+    "inventario": (
+        "SELECT shipment_id, g.name, s.current_location FROM shipments s JOIN goods g ON s.good_id=g.good_id WHERE s.current_owner_pk=? AND s.is_active=1",
+        ("pk",),
+    ),
+    "mempool": ("SELECT data FROM mempool ORDER BY timestamp ASC", ()),
+    "delegados": (
+        "SELECT name FROM participants ORDER BY votes DESC, name ASC LIMIT 3",
+        (),
+    ),
+    "candidatos": (
+        "SELECT name, votes FROM participants WHERE name != ? ORDER BY votes DESC",
+        ("name",),
+    ),
+    "historial_envio": (
+        "SELECT * FROM transactions WHERE shipment_id = ? ORDER BY block_index, position",
+        ("SHIP",),
+    ),
+    "enviados_por": (
+        "SELECT * FROM transactions WHERE sender = ? ORDER BY block_index, position",
+        ("pk",),
+    ),
+    "recibidos_por": (
+        "SELECT * FROM transactions WHERE receiver = ? ORDER BY block_index, position",
+        ("pk",),
+    ),
+    "transaccion": ("SELECT block_index, position FROM transactions WHERE tx_hash = ?", ("hash",)),
+    "insumos": ("SELECT parent_id FROM lineage WHERE child_id = ?", ("SHIP",)),
+    "productos": ("SELECT child_id FROM lineage WHERE parent_id = ?", ("SHIP",)),
+    "cubeta_estado": (
+        "SELECT shipment_id, leaf FROM state_leaves WHERE bucket = ? ORDER BY shipment_id",
+        (0,),
+    ),
+}
+
+#Claves de metadata con las que se registran los insumos de un producto
+#add_transaction.py y dashboard.py usan source_materials (lista), test.py usa lote_origen
+LINEAGE_METADATA_KEYS = ("source_materials", "lote_origen")
+#Limite de profundidad por defecto para recorrer la procedencia
+MAX_LINEAGE_DEPTH = 64
+
+
+def lineage_edges(block: Block):
+    #Aristas (insumo, producto, bloque) de los activos creados en el bloque
+    edges = []
+    for tx in block.transactions:
+        if tx.action not in ["EXTRACTED", "MANUFACTURED"] or not isinstance(tx.metadata, dict):
+            continue
+        for key in LINEAGE_METADATA_KEYS:
+            sources = tx.metadata.get(key)
+            if isinstance(sources, str):
+                sources = [sources]
+            if not isinstance(sources, list):
+                continue
+            for parent in sources:
+                if isinstance(parent, str) and parent:
+                    edges.append((parent, tx.shipment_id, block.index))
+    return edges
+
+TRANSACTION_COLUMNS = (
+    "block_index",
+    "position",
+    "tx_hash",
+    "sender",
+    "receiver",
+    "shipment_id",
+    "action",
+    "timestamp",
+)
+
+
+def transaction_rows(block: Block):
+    #Filas de la tabla transactions para un bloque, en el orden en que aparecen
+    return [
+        (
+            block.index,
+            position,
+            tx.tx_hash,
+            tx.sender,
+            tx.receiver,
+            tx.shipment_id,
+            tx.action,
+            tx.timestamp,
+        )
+        for position, tx in enumerate(block.transactions)
+    ]
+
+
+#Sentencias para aplicar cada tipo de transaccion al estado (participantes y envios)
+STATE_UPDATES = {
+    "VOTE": (
+        "UPDATE participants SET votes = votes + 1 WHERE public_key = ?",
+        lambda tx: (tx.receiver,),
+    ),
+    "RETIRE": (
+        "UPDATE shipments SET is_active = 0, last_action = ?, last_updated_timestamp = ? WHERE shipment_id = ?",
+        lambda tx: (tx.action, tx.timestamp, tx.shipment_id),
+    ),
+    "CREATE": (
+        """
+        INSERT OR REPLACE INTO shipments (shipment_id, good_id, quantity, current_owner_pk, current_location, last_action, last_updated_timestamp, is_active)
+        VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+        """,
+        lambda tx: (
+            tx.shipment_id,
+            tx.good_id,
+            tx.quantity,
+            tx.receiver,
+            tx.location,
+            tx.action,
+            tx.timestamp,
+        ),
+    ),
+    #Si la transaccion no trae cantidad se conserva la anterior
+    "TRANSFER": (
+        "UPDATE shipments SET current_owner_pk = ?, current_location = ?, last_action = ?, last_updated_timestamp = ?, is_active = 1, quantity = COALESCE(?, quantity) WHERE shipment_id = ?",
+        lambda tx: (
+            tx.receiver,
+            tx.location,
+            tx.action,
+            tx.timestamp,
+            tx.quantity,
+            tx.shipment_id,
+        ),
+    ),
+}
+
+
+def state_update_kind(tx: Transaction):
+    if tx.action == "VOTE":
+        return "VOTE"
+    if tx.action in ["DESTROYED", "CONSUMED"]:
+        return "RETIRE"
+    if tx.action in ["EXTRACTED", "MANUFACTURED"]:
+        return "CREATE"
+    return "TRANSFER"
+
+
+def state_update_batches(transactions: List[Transaction]):
+    #Agrupamos transacciones consecutivas del mismo tipo para un solo executemany
+    #Solo se juntan las consecutivas: un envio creado y enviado en el mismo bloque
+    #se aplica en el mismo orden que antes
+    for kind, group in groupby(transactions, key=state_update_kind):
+        sql, params = STATE_UPDATES[kind]
+        yield sql, [params(tx) for tx in group]
+
+
+#Instantaneas del estado para arrancar nodos nuevos sin repetir toda la historia
+SNAPSHOT_FORMAT = 1
+#Tablas de estado que viajan en la instantanea y sus columnas en orden
+SNAPSHOT_TABLES = {
+    "participants": ("name", "public_key", "role", "reputation", "votes"),
+    "goods": ("good_id", "name", "unit_of_measure"),
+    "shipments": (
+        "shipment_id",
+        "good_id",
+        "quantity",
+        "current_owner_pk",
+        "current_location",
+        "last_action",
+        "last_updated_timestamp",
+        "is_active",
+    ),
+}
+
+
+#Arbol de estado autenticado sobre la tabla shipments
+#Cada envio es una hoja (hash de su fila) dentro de una de STATE_BUCKETS cubetas elegida por el
+#hash de su id. El hash de la cubeta cubre sus hojas ordenadas y la raiz es el Merkle de las
+#cubetas, asi que aplicar un bloque solo recalcula las cubetas que toco
+STATE_BUCKETS = 4096
+EMPTY_BUCKET = hashlib.sha256(b"").digest()
+
+
+def state_bucket(shipment_id: str):
+    return int.from_bytes(hashlib.sha256(shipment_id.encode()).digest()[:4], "big") % STATE_BUCKETS
+
+
+#last_updated_timestamp no entra en la hoja: en los envios de genesis es la hora local en que
+#setup_network instalo cada nodo, no viene de la cadena y daria una raiz distinta por nodo
+STATE_LEAF_FIELDS = tuple(
+    i for i, column in enumerate(SNAPSHOT_TABLES["shipments"]) if column != "last_updated_timestamp"
+)
+
+
+#Mismo resultado que json.dumps(..., separators=(",", ":")) sin crear un encoder por hoja
+_LEAF_JSON = json.JSONEncoder(separators=(",", ":")).encode
+
+
+def state_leaf(row):
+    #row en el orden de SNAPSHOT_TABLES["shipments"]
+    fields = [row[i] for i in STATE_LEAF_FIELDS]
+    return hashlib.sha256(_LEAF_JSON(fields).encode()).digest()
+
+
+def state_bucket_hash(leaves):
+    #leaves: pares (shipment_id, hoja) ordenados por shipment_id
+    h = hashlib.sha256()
+    for shipment_id, leaf in leaves:
+        h.update(_encode_text(shipment_id))
+        h.update(leaf)
+    return h.digest()
+
+
+def state_root_from_buckets(bucket_hashes: List[bytes]):
+    return merkle_levels(bucket_hashes)[-1][0].hex()
+
+
+def verify_state_proof(proof: Dict[str, Any], state_root: str = None):
+    #Verificador del lado del cliente para /state_proof/<shipment_id>
+    #Prueba que el envio tiene exactamente ese estado (o que no existe) bajo la raiz dada
+    try:
+        shipment_id = proof["shipment_id"]
+        root = proof["state_root"]
+        if state_root is not None and root != state_root:
+            return False, "La raiz de estado no es la esperada"
+        if "block" in proof:
+            header = proof["block"]
+            if block_header_hash(header) != header["hash"] or header.get("state_root") != root:
+                return False, "El encabezado no respalda la raiz de estado"
+        if proof["bucket"] != state_bucket(shipment_id):
+            return False, "Cubeta incorrecta para el envio"
+        leaves = [(sid, bytes.fromhex(leaf)) for sid, leaf in proof["bucket_leaves"]]
+        ids = [sid for sid, _ in leaves]
+        if ids != sorted(set(ids)):
+            return False, "Las hojas de la cubeta no estan ordenadas"
+        found = dict(leaves).get(shipment_id)
+        if proof["state"] is None:
+            if found is not None:
+                return False, "El envio si existe en la cubeta"
+        elif proof["state"][0] != shipment_id or found != state_leaf(proof["state"]):
+            return False, "El estado no coincide con su hoja"
+        bucket_hash = state_bucket_hash(leaves).hex()
+        if not verify_merkle_proof(bucket_hash, proof["branch"], root, BLOCK_VERSION_BINARY):
+            return False, "La rama no lleva a la raiz de estado"
+    except (KeyError, TypeError, ValueError, IndexError) as e:
+        return False, f"Prueba mal formada: {e}"
+    if proof["state"] is None:
+        return True, "El envio no existe en este estado"
+    return True, "Estado del envio verificado"
+
+
+def snapshot_digest(snapshot: Dict[str, Any]):
+    #Hash del contenido de la instantanea, detecta archivos truncados o alterados en transito
+    content = {
+        "height": snapshot["height"],
+        "tip_hash": snapshot["tip_hash"],
+        "state": snapshot["state"],
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+class BlockPrunedError(LookupError):
+    #El cuerpo del bloque se borro en modo podado, solo queda su encabezado
+    def __init__(self, index, pruned_height):
+        super().__init__(
+            f"El bloque #{index} fue podado, los cuerpos estan disponibles desde el #{pruned_height + 1}"
+        )
+        self.index = index
+        self.pruned_height = pruned_height
+
+
+class HistoryUnavailableError(LookupError):
+    #El nodo arranco desde una instantanea: los indices de transacciones y procedencia empiezan
+    #en su altura y la respuesta dependeria de bloques anteriores que este nodo nunca tuvo
+    def __init__(self, subject, snapshot_height):
+        super().__init__(
+            f"El historial de {subject} empieza antes de la instantanea (bloque #{snapshot_height}), consultalo en un nodo completo"
+        )
+        self.subject = subject
+        self.snapshot_height = snapshot_height
+
+
+#Logica principal del Nodo Blockchain
+class BlockHeader:
+    #Solo las columnas de la tabla blocks, sin reconstruir ni rehashear transacciones
+    __slots__ = ("index", "hash", "previous_hash", "validator", "timestamp")
+
+    def __init__(self, index, hash, previous_hash, validator, timestamp):
+        self.index = index
+        self.hash = hash
+        self.previous_hash = previous_hash
+        self.validator = validator
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_block(cls, block: Block):
+        return cls(block.index, block.hash, block.previous_hash, block.validator, block.timestamp)
+
+
+#Tipo de cada columna de SNAPSHOT_TABLES ("?" admite NULL). Un estado con otros tipos se
+#rechaza antes de guardarlo: SQLite no convierte nada y MemoryStorage guarda los mismos valores
+STATE_COLUMN_TYPES = {
+    "participants": ("text", "text", "text?", "int?", "int?"),
+    "goods": ("text", "text?", "text?"),
+    "shipments": ("text", "text?", "real?", "text", "text?", "text", "real", "int"),
+}
+
+
+def _column_value_ok(value, kind):
+    if value is None:
+        return kind.endswith("?")
+    kind = kind.rstrip("?")
+    if kind == "text":
+        return type(value) is str
+    if kind == "int":
+        return type(value) is int and -2**63 <= value < 2**63
+    return is_finite_number(value)
+
+
+def check_state_rows(state: Dict[str, Any]):
+    if not isinstance(state, dict):
+        raise ValueError("Estado que no es un objeto")
+    for table, kinds in STATE_COLUMN_TYPES.items():
+        rows = state.get(table)
+        if not isinstance(rows, list):
+            raise ValueError(f"Estado sin la tabla {table}")
+        for row in rows:
+            if not isinstance(row, (list, tuple)) or len(row) != len(kinds):
+                raise ValueError(f"Fila de {table} con columnas incorrectas")
+            for value, kind in zip(row, kinds):
+                if not _column_value_ok(value, kind):
+                    raise ValueError(f"Fila de {table} con un valor invalido: {value!r}")
+
+
+def archive_blocks(archive_dir, rows):
+    #Cuerpos que se van a podar en gzip, una linea JSON por bloque
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"blocks-{rows[0][0]:08d}-{rows[-1][0]:08d}.jsonl.gz")
+    with gzip.open(path, "wt") as archive:
+        for _, data in rows:
+            archive.write(data + "\n")
+    return path
+
+
+class ChainStorage:
+    #Interfaz de almacenamiento del nodo: bloques, estado, mempool y participantes
+    #BlockchainNode (consenso, reglas del contrato, validacion) solo usa estos metodos, un motor
+    #nuevo es una subclase registrada en STORAGE_BACKENDS. Cada escritura es atomica: save_block
+    #guarda bloque, indices, estado y limpieza de la mempool juntos o no guarda nada
+    name = "base"
+    block_store = None
+
+    def set_profile(self, profile: str):
+        pass
+
+    def close(self):
+        pass
+
+    #Mantenimiento: solo los motores con esquema versionado e indices propios lo necesitan
+    def schema_version(self):
+        return SCHEMA_VERSION
+
+    def explain_hot_queries(self):
+        return {}
+
+    def backfill_transactions(self, batch_blocks=500):
+        return 0
+
+    def backfill_lineage(self):
+        return 0
+
+    def get_meta(self, key, default=None):
+        raise NotImplementedError
+
+    def set_meta(self, key, value):
+        raise NotImplementedError
+
+    #Participantes
+    def get_delegates(self, limit: int):
+        #Nombres con mas votos (empate por nombre)
+        raise NotImplementedError
+
+    def get_first_participant(self):
+        raise NotImplementedError
+
+    def has_participant(self, public_key):
+        raise NotImplementedError
+
+    def participant_keys(self):
+        raise NotImplementedError
+
+    def get_public_key_by_name(self, name):
+        raise NotImplementedError
+
+    def get_name_by_public_key(self, pk):
+        raise NotImplementedError
+
+    #Estado de los envios y arbol de estado
+    def get_shipment_state(self, shipment_id):
+        #(dueño actual, ultima accion, activo) o None
+        raise NotImplementedError
+
+    def recent_shipment_states(self, limit: int):
+        #[(shipment_id, estado)] de los envios actualizados mas recientemente primero
+        raise NotImplementedError
+
+    def count_shipments(self):
+        raise NotImplementedError
+
+    def get_state_root(self):
+        raise NotImplementedError
+
+    def compute_state_root(self, transactions: List[Transaction]):
+        raise NotImplementedError
+
+    def get_state_bucket(self, shipment_id):
+        #(fila del envio, hojas de su cubeta, hashes de todas las cubetas) para get_state_proof
+        raise NotImplementedError
+
+    def rebuild_state_tree(self):
+        raise NotImplementedError
+
+    #Mempool
+    def add_to_mempool(self, tx_hash, data, timestamp):
+        #False si la transaccion ya estaba
+        raise NotImplementedError
+
+    def get_mempool_data(self):
+        #JSON de las transacciones pendientes en orden de llegada
+        raise NotImplementedError
+
+    def remove_from_mempool(self, tx_hashes: List[str]):
+        raise NotImplementedError
+
+    #Bloques
+    def save_block(self, block: Block):
+        raise NotImplementedError
+
+    def get_last_block_header(self):
+        raise NotImplementedError
+
+    def get_block_header(self, index):
+        raise NotImplementedError
+
+    def get_block_data(self, index):
+        raise NotImplementedError
+
+    def scan_blocks(self, start: int = 1, end: int = None):
+        #(indice, JSON) de los bloques con cuerpo entre start y end, en orden
+        raise NotImplementedError
+
+    def scan_headers(self, start: int = 1, end: int = None):
+        #(indice, encabezado JSON guardado al podar o None) de cada bloque entre start y end
+        raise NotImplementedError
+
+    def get_pruned_height(self):
+        return int(self.get_meta("pruned_height", 0))
+
+    def prune_blocks(self, keep: int, archive_dir: str = None, vacuum: bool = False):
+        raise NotImplementedError
+
+    #Indices de historial y procedencia
+    def find_transaction(self, tx_hash):
+        #(bloque, posicion) de la primera aparicion de la transaccion o None
+        raise NotImplementedError
+
+    def shipment_created(self, shipment_id):
+        #Si el indice tiene la creacion (EXTRACTED o MANUFACTURED) del envio
+        raise NotImplementedError
+
+    def get_shipment_transactions(self, shipment_id, limit=None):
+        raise NotImplementedError
+
+    def get_participant_transactions(self, public_key, role="any", limit=None):
+        raise NotImplementedError
+
+    def walk_lineage(self, shipment_id, direction: str, max_depth: int):
+        #direction "ancestors" o "descendants", profundidad minima de cada envio alcanzado
+        raise NotImplementedError
+
+    #Instantaneas
+    def export_state(self):
+        #(altura, hash de la punta, estado por tabla de SNAPSHOT_TABLES) o None sin bloques
+        raise NotImplementedError
+
+    def import_state(self, tip_block: Block, state: Dict[str, Any]):
+        #Reemplaza el estado y guarda tip_block como unico bloque, (ok, motivo)
+        raise NotImplementedError
+
+
+class SQLiteStorage(ChainStorage):
+    #Motor original: estado, mempool e indices en tablas de SQLite y cuerpos de bloque en la
+    #tabla blocks o en el log segmentado. db_path=":memory:" usa la misma base en RAM
+    name = "sqlite"
+
+    def __init__(self, db_path="blockchain.db", storage_profile=DEFAULT_STORAGE_PROFILE, block_store=None):
+        self.db_file = db_path
+        self.storage_profile = storage_profile
+        manager = MemoryConnectionManager if db_path == ":memory:" else ConnectionManager
+        self.db = manager(db_path, storage_pragmas(storage_profile))
+        #Serializa a los escritores del arbol de estado y guarda sus cubetas en memoria
+        self._state_lock = threading.RLock()
+        self._bucket_hashes = None
+        self.init_db()
+        self.blocks = self._open_block_store(block_store or DEFAULT_BLOCK_STORE)
+
+    @property
+    def block_store(self):
+        return self.blocks.name
+
+    def init_db(self):
+        #Preparamos las tablas de la base de datos para guardar bloques y participantes
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            #Tabla para guardar la cadena de bloques completa
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS blocks (block_index INTEGER PRIMARY KEY, block_hash TEXT UNIQUE, previous_hash TEXT, validator TEXT, timestamp REAL, data TEXT)"
+            )
+            #Tabla para los participantes donde guardamos sus votos y reputacion
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS participants (name TEXT UNIQUE, public_key TEXT PRIMARY KEY, role TEXT, reputation INTEGER DEFAULT 10, votes INTEGER DEFAULT 0)"
+            )
+            #Tabla para el catalogo de productos disponibles
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS goods (good_id TEXT PRIMARY KEY, name TEXT, unit_of_measure TEXT)"
+            )
+            #Tabla para rastrear el estado actual de cada envio
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS shipments (shipment_id TEXT PRIMARY KEY, good_id TEXT, quantity REAL, current_owner_pk TEXT, current_location TEXT, last_action TEXT, last_updated_timestamp REAL, is_active INTEGER DEFAULT 1)"
+            )
+            #Tabla temporal para transacciones que aun no estan en un bloque
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS mempool (tx_hash TEXT PRIMARY KEY, data TEXT, timestamp REAL)"
+            )
+            conn.commit()
+        self.migrate()
+        if self.get_meta("state_tree_stale"):
+            self.rebuild_state_tree()
+
+    def schema_version(self):
+        with self.db.connection() as conn:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def migrate(self):
+        #Aplicamos las migraciones pendientes, cada una en su propia transaccion junto con la version
+        #BEGIN IMMEDIATE toma el candado de escritura antes de leer la version: si otro proceso
+        #abre la misma base a la vez espera y despues ve la migracion ya aplicada
+        with self.db.connection() as conn:
+            while self.schema_version() < SCHEMA_VERSION:
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    version = self.schema_version() + 1
+                    if version <= SCHEMA_VERSION:
+                        for statement in SCHEMA_MIGRATIONS[version - 1]:
+                            conn.execute(statement)
+                        conn.execute(f"PRAGMA user_version = {version}")
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+
+    def explain_hot_queries(self):
+        #Plan de SQLite para cada consulta frecuente y si evita recorrer la tabla completa
+        #Una consulta esta bien si cada paso usa un indice y no ordena en una tabla temporal
+        with self.db.connection() as conn:
+            report = {}
+            for name, (query, params) in HOT_QUERIES.items():
+                plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+                uses_index = all(
+                    "USING" in step and "TEMP B-TREE" not in step for step in plan
+                )
+                report[name] = (uses_index, plan)
+        return report
+
+    def set_profile(self, profile: str):
+        self.db.set_pragmas(storage_pragmas(profile))
+        self.storage_profile = profile
+        self.blocks.fsync = STORAGE_PROFILES[profile]["synchronous"] == "FULL"
+
+    def _open_block_store(self, kind: str = None):
+        #El tipo de almacen queda en node_meta para que todos los procesos (p2p.py, dashboard,
+        #view_blockchain) lean los cuerpos del mismo lugar
+        current = self.get_meta("block_store", "table")
+        kind = kind or current
+        if kind not in BLOCK_STORES:
+            raise ValueError(f"Almacen de bloques desconocido: {kind}")
+        if kind == "table":
+            if current != "table":
+                raise ValueError("La base guarda los bloques en un log segmentado, usa block_store='log'")
+            return TableBlockStore(self.db)
+        if isinstance(self.db, MemoryConnectionManager):
+            raise ValueError("El log de bloques necesita una base en disco")
+        #Se abre solo para leer, el proceso que guarda bloques se vuelve escritor al hacerlo
+        store = BlockLog(
+            self.db_file + "-blocks",
+            self._committed_height,
+            fsync=STORAGE_PROFILES[self.storage_profile]["synchronous"] == "FULL",
+        )
+        with self.db.connection() as conn:
+            if current == "table":
+                #Primera vez con log: copiamos los cuerpos que ya estaban en la tabla
+                store.open_writer()
+                store.truncate(0)
+                for index, data in TableBlockStore(self.db).scan():
+                    store.append(index, data)
+                try:
+                    conn.execute("UPDATE blocks SET data = NULL")
+                    conn.execute("INSERT OR REPLACE INTO node_meta (key, value) VALUES ('block_store', 'log')")
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    store.close()
+                    raise
+        return store
+
+    def _committed_height(self):
+        #Altura confirmada en SQLite, lo que el log tenga arriba de ella no existe todavia
+        with self.db.connection() as conn:
+            return conn.execute(
+                "SELECT COALESCE(MAX(block_index), 0) FROM blocks"
+            ).fetchone()[0]
+
+    def close(self):
+        #Cerramos todas las conexiones del nodo al apagarlo
+        self.db.close()
+        self.blocks.close()
+
+    def get_meta(self, key, default=None):
+        with self.db.connection() as conn:
+            row = conn.execute(
+                "SELECT value FROM node_meta WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.db.connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO node_meta (key, value) VALUES (?, ?)", (key, value))
+            conn.commit()
+
+    def get_delegates(self, limit: int):
+        with self.db.connection() as conn:
+            rows = conn.execute(
+                "SELECT name FROM participants ORDER BY votes DESC, name ASC LIMIT ?", (limit,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def get_first_participant(self):
+        with self.db.connection() as conn:
+            row = conn.execute("SELECT name FROM participants LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def has_participant(self, public_key):
+        with self.db.connection() as conn:
+            return conn.execute(
+                "SELECT 1 FROM participants WHERE public_key=?", (public_key,)
+            ).fetchone() is not None
+
+    def participant_keys(self):
+        with self.db.connection() as conn:
+            return {row[0] for row in conn.execute("SELECT public_key FROM participants")}
+
+    def get_public_key_by_name(self, name):
+        with self.db.connection() as conn:
+            res = conn.execute(
+                "SELECT public_key FROM participants WHERE name = ?", (name,)
+            ).fetchone()
+        return res[0] if res else None
+
+    def get_name_by_public_key(self, pk):
+        with self.db.connection() as conn:
+            res = conn.execute(
+                "SELECT name FROM participants WHERE public_key = ?", (pk,)
+            ).fetchone()
+        return res[0] if res else None
+
+    def get_shipment_state(self, shipment_id):
+        with self.db.connection() as conn:
+            row = conn.execute(
+                "SELECT current_owner_pk, last_action, is_active FROM shipments WHERE shipment_id = ?",
+                (shipment_id,),
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def recent_shipment_states(self, limit: int):
+        with self.db.connection() as conn:
+            rows = conn.execute(
+                "SELECT shipment_id, current_owner_pk, last_action, is_active FROM shipments ORDER BY last_updated_timestamp DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [(row[0], (row[1], row[2], row[3])) for row in rows]
+
+    def count_shipments(self):
+        with self.db.connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM shipments").fetchone()[0]
+
+    def save_block(self, block: Block):
+        #Bloque, estado y limpieza de la mempool van en una sola transaccion de SQLite:
+        #o se aplica todo o nada, un fallo a medias no deja estado y mempool desincronizados
+        with self._state_lock:
+            self.blocks.open_writer()
+            with self.db.connection() as conn:
+                block_json = block.to_json()
+                appended = False
+                try:
+                    #Un indice repetido falla aqui (clave de transactions) antes de tocar el estado
+                    conn.executemany(
+                        "INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        transaction_rows(block),
+                    )
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO lineage VALUES (?, ?, ?)", lineage_edges(block)
+                    )
+                    bucket_hashes = self._apply_state(conn, block.transactions)
+                    state_root = state_root_from_buckets(bucket_hashes)
+                    #Si el bloque trae raiz de estado debe coincidir con la nuestra
+                    if block.state_root is not None and block.state_root != state_root:
+                        conn.rollback()
+                        return False, "La raiz de estado no coincide con el estado local"
+                    #La fila del bloque se escribe una sola vez, ya con su raiz de estado
+                    #(un UPDATE posterior reescribia la fila completa con el cuerpo del bloque)
+                    conn.execute(
+                        "INSERT INTO blocks (block_index, block_hash, previous_hash, validator, timestamp, data, state_root) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            block.index,
+                            block.hash,
+                            block.previous_hash,
+                            block.validator,
+                            block.timestamp,
+                            self.blocks.column_value(block_json),
+                            state_root,
+                        ),
+                    )
+                    conn.executemany(
+                        "DELETE FROM mempool WHERE tx_hash = ?",
+                        [(tx.tx_hash,) for tx in block.transactions],
+                    )
+                    #Con log segmentado el cuerpo se escribe justo antes del commit
+                    #(appended va antes: un append a medias tambien se recorta)
+                    appended = True
+                    self.blocks.append(block.index, block_json)
+                    conn.commit()
+                except sqlite3.IntegrityError:
+                    conn.rollback()
+                    return False, "Bloque ya registrado"
+                except Exception:
+                    conn.rollback()
+                    if appended:
+                        self.blocks.truncate(block.index - 1)
+                    raise
+                self._bucket_hashes = bucket_hashes
+        return True, "Guardado"
+
+    def _apply_state(self, conn, transactions: List[Transaction]):
+        #Aplicamos las transacciones a las tablas de estado dentro de la transaccion abierta
+        #y regresamos las cubetas del arbol de estado ya actualizadas
+        for sql, rows in state_update_batches(transactions):
+            conn.executemany(sql, rows)
+        changed = {tx.shipment_id for tx in transactions if tx.action != "VOTE"}
+        return self._update_state_tree(conn, changed)
+
+    def _load_bucket_hashes(self, conn):
+        if self._bucket_hashes is None:
+            hashes = [EMPTY_BUCKET] * STATE_BUCKETS
+            for bucket, digest in conn.execute("SELECT bucket, hash FROM state_buckets"):
+                hashes[bucket] = digest
+            self._bucket_hashes = hashes
+        return self._bucket_hashes
+
+    def _update_state_tree(self, conn, shipment_ids):
+        #Recalculamos las hojas de los envios tocados y solo las cubetas que los contienen
+        columns = SNAPSHOT_TABLES["shipments"]
+        ids = list(shipment_ids)
+        buckets = {sid: state_bucket(sid) for sid in ids}
+        rows = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            for row in conn.execute(
+                f"SELECT {', '.join(columns)} FROM shipments WHERE shipment_id IN ({','.join('?' for _ in chunk)})",
+                chunk,
+            ):
+                rows[row[0]] = row
+        conn.executemany(
+            "INSERT OR REPLACE INTO state_leaves VALUES (?, ?, ?)",
+            [(sid, buckets[sid], state_leaf(row)) for sid, row in rows.items()],
+        )
+        conn.executemany(
+            "DELETE FROM state_leaves WHERE shipment_id = ?",
+            [(sid,) for sid in ids if sid not in rows],
+        )
+        #Las hojas de todas las cubetas tocadas se leen por lotes, no con una consulta por cubeta
+        #(una cubeta que quedo sin hojas no aparece en la consulta y vuelve a EMPTY_BUCKET)
+        touched = sorted(set(buckets.values()))
+        hashes = list(self._load_bucket_hashes(conn))
+        for bucket in touched:
+            hashes[bucket] = EMPTY_BUCKET
+        for start in range(0, len(touched), 500):
+            chunk = touched[start:start + 500]
+            cursor = conn.execute(
+                f"SELECT bucket, shipment_id, leaf FROM state_leaves WHERE bucket IN ({','.join('?' for _ in chunk)}) ORDER BY bucket, shipment_id",
+                chunk,
+            )
+            for bucket, leaves in groupby(cursor, key=lambda row: row[0]):
+                hashes[bucket] = state_bucket_hash((sid, leaf) for _, sid, leaf in leaves)
+        conn.executemany(
+            "INSERT OR REPLACE INTO state_buckets VALUES (?, ?)",
+            [(bucket, hashes[bucket]) for bucket in touched],
+        )
+        return hashes
+
+    def _rebuild_state_tree(self, conn):
+        #Construye el arbol completo desde shipments, dentro de la transaccion abierta
+        columns = SNAPSHOT_TABLES["shipments"]
+        conn.execute("DELETE FROM state_leaves")
+        conn.execute("DELETE FROM state_buckets")
+        buckets = {}
+        for row in conn.execute(f"SELECT {', '.join(columns)} FROM shipments"):
+            buckets.setdefault(state_bucket(row[0]), []).append((row[0], state_leaf(row)))
+        hashes = [EMPTY_BUCKET] * STATE_BUCKETS
+        for bucket, leaves in buckets.items():
+            leaves.sort()
+            conn.executemany(
+                "INSERT INTO state_leaves VALUES (?, ?, ?)",
+                [(sid, bucket, leaf) for sid, leaf in leaves],
+            )
+            hashes[bucket] = state_bucket_hash(leaves)
+        conn.executemany(
+            "INSERT INTO state_buckets VALUES (?, ?)",
+            [(bucket, hashes[bucket]) for bucket in buckets],
+        )
+        return hashes
+
+    def rebuild_state_tree(self):
+        #Reconstruye el arbol de estado (bases anteriores a la migracion 4) y fija la raiz de la punta
+        with self._state_lock, self.db.connection() as conn:
+            try:
+                conn.execute("BEGIN")
+                hashes = self._rebuild_state_tree(conn)
+                state_root = state_root_from_buckets(hashes)
+                conn.execute(
+                    "UPDATE blocks SET state_root = ? WHERE block_index = (SELECT MAX(block_index) FROM blocks)",
+                    (state_root,),
+                )
+                conn.execute("DELETE FROM node_meta WHERE key = 'state_tree_stale'")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            self._bucket_hashes = hashes
+        return state_root
+
+    def get_state_root(self):
+        with self._state_lock, self.db.connection() as conn:
+            return state_root_from_buckets(self._load_bucket_hashes(conn))
+
+    def compute_state_root(self, transactions: List[Transaction]):
+        with self._state_lock, self.db.connection() as conn:
+            try:
+                conn.execute("BEGIN")
+                hashes = self._apply_state(conn, transactions)
+            finally:
+                conn.rollback()
+        return state_root_from_buckets(hashes)
+
+    def get_state_bucket(self, shipment_id):
+        columns = SNAPSHOT_TABLES["shipments"]
+        with self._state_lock, self.db.connection() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(columns)} FROM shipments WHERE shipment_id = ?",
+                (shipment_id,),
+            ).fetchone()
+            leaves = conn.execute(
+                "SELECT shipment_id, leaf FROM state_leaves WHERE bucket = ? ORDER BY shipment_id",
+                (state_bucket(shipment_id),),
+            ).fetchall()
+            hashes = list(self._load_bucket_hashes(conn))
+        return row, leaves, hashes
+
+    def add_to_mempool(self, tx_hash, data, timestamp):
+        with self.db.connection() as conn:
+            try:
+                #Verificamos si ya tenemos esta transaccion para no duplicarla
+                if conn.execute("SELECT 1 FROM mempool WHERE tx_hash = ?", (tx_hash,)).fetchone():
+                    return False
+                conn.execute("INSERT INTO mempool VALUES (?, ?, ?)", (tx_hash, data, timestamp))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return True
+
+    def get_mempool_data(self):
+        with self.db.connection() as conn:
+            rows = conn.execute(
+                "SELECT data FROM mempool ORDER BY timestamp ASC"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def remove_from_mempool(self, tx_hashes: List[str]):
+        with self.db.connection() as conn:
+            conn.executemany(
+                "DELETE FROM mempool WHERE tx_hash = ?", [(tx_hash,) for tx_hash in tx_hashes]
+            )
+            conn.commit()
+
+    def get_last_block_header(self):
+        #Encabezado del ultimo bloque leido directo de las columnas, sin tocar el JSON
+        with self.db.connection() as conn:
+            row = conn.execute(
+                "SELECT block_index, block_hash, previous_hash, validator, timestamp FROM blocks ORDER BY block_index DESC LIMIT 1"
+            ).fetchone()
+        return BlockHeader(*row) if row else None
+
+    def get_block_header(self, index):
+        with self.db.connection() as conn:
+            row = conn.execute(
+                "SELECT block_index, block_hash, previous_hash, validator, timestamp FROM blocks WHERE block_index = ?",
+                (index,),
+            ).fetchone()
+        return BlockHeader(*row) if row else None
+
+    def get_block_data(self, index):
+        return self.blocks.get(index)
+
+    def scan_blocks(self, start: int = 1, end: int = None):
+        return self.blocks.scan(start, end)
+
+    def scan_headers(self, start: int = 1, end: int = None):
+        with self.db.connection() as conn:
+            return conn.execute(
+                "SELECT block_index, header FROM blocks WHERE block_index BETWEEN ? AND ? ORDER BY block_index",
+                (start, sys.maxsize if end is None else end),
+            ).fetchall()
+
+    def prune_blocks(self, keep: int, archive_dir: str = None, vacuum: bool = False):
+        #Borra (o archiva en archive_dir) los cuerpos anteriores a los ultimos keep bloques
+        #El encabezado queda en la columna header para seguir validando la cadena
+        keep = max(1, keep)
+        with self._state_lock, self.db.connection() as conn:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            size_before = self._db_file_size()
+            pruned_height = self.get_pruned_height()
+            cutoff = self._committed_height() - keep
+            report = {
+                "pruned_blocks": 0,
+                "pruned_height": max(pruned_height, cutoff, 0),
+                "archive": None,
+                "bytes_reclaimed": 0,
+            }
+            if cutoff <= pruned_height:
+                report["pruned_height"] = pruned_height
+                return report
+            self.blocks.open_writer()
+            rows = list(self.blocks.scan(pruned_height + 1, cutoff))
+            try:
+                if archive_dir and rows:
+                    report["archive"] = archive_blocks(archive_dir, rows)
+                conn.executemany(
+                    "UPDATE blocks SET header = ? WHERE block_index = ?",
+                    [
+                        (json.dumps(LazyBlock.from_json(data).header()), index)
+                        for index, data in rows
+                    ],
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO node_meta (key, value) VALUES ('pruned_height', ?)",
+                    (cutoff,),
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            #En la tabla quedan paginas libres, del log se borran los segmentos sin bloques vivos
+            segments_reclaimed = self.blocks.prune(pruned_height + 1, cutoff)
+            report["pruned_blocks"] = len(rows)
+            free_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            #Las paginas liberadas se reutilizan para bloques nuevos, VACUUM ademas achica el archivo
+            report["bytes_reclaimed"] = (free_after - free_before) * page_size + segments_reclaimed
+            if vacuum:
+                conn.execute("VACUUM")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                report["bytes_reclaimed"] = max(0, size_before - self._db_file_size()) + segments_reclaimed
+        return report
+
+    def _db_file_size(self):
+        if isinstance(self.db, MemoryConnectionManager):
+            return 0
+        return sum(
+            os.path.getsize(path)
+            for path in (self.db_file, self.db_file + "-wal")
+            if os.path.exists(path)
+        )
+
+    def find_transaction(self, tx_hash):
+        with self.db.connection() as conn:
+            row = conn.execute(
+                "SELECT block_index, position FROM transactions WHERE tx_hash = ? ORDER BY block_index LIMIT 1",
+                (tx_hash,),
+            ).fetchone()
+        return tuple(row) if row else None
 
-    def to_dict(self):
-        #Convertimos el objeto a diccionario para poder guardarlo o enviarlo facil
-        return {
-            "sender": self.sender,
-            "receiver": self.receiver,
-            "shipment_id": self.shipment_id,
-            "action": self.action,
-            "good_id": self.good_id,
-            "quantity": self.quantity,
-            "timestamp": self.timestamp,
-            "location": self.location,
-            "metadata": self.metadata,
-        }
+    def shipment_created(self, shipment_id):
+        with self.db.connection() as conn:
+            return conn.execute(
+                "SELECT 1 FROM transactions WHERE shipment_id = ? AND action IN ('EXTRACTED', 'MANUFACTURED') LIMIT 1",
+                (shipment_id,),
+            ).fetchone() is not None
 
+    def _query_transactions(self, where, params, limit=None):
+        sql = f"SELECT {', '.join(TRANSACTION_COLUMNS)} FROM transactions WHERE {where} ORDER BY block_index, position"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self.db.connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [dict(zip(TRANSACTION_COLUMNS, row)) for row in rows]
 
-    def calculate_hash(self):
-        #Aqui usamos SHA256 para crear una huella digital unica de la transaccion y asegurar integridad
-        tx_string = json.dumps(self.to_dict(), sort_keys=True)
-        return hashlib.sha256(tx_string.encode()).hexdigest()
+    def get_shipment_transactions(self, shipment_id, limit=None):
+        return self._query_transactions("shipment_id = ?", (shipment_id,), limit)
 
-    def sign_transaction(self, private_key_hex: str):
-        #Usamos criptografia asimetrica para firmar la transaccion y garantizar que realmente fuimos nosotros
-        try:
-            sk = SigningKey.from_string(bytes.fromhex(private_key_hex), curve=SECP256k1)
-            self.signature = sk.sign(self.calculate_hash().encode()).hex()
-            return True
-        except Exception as e:
-            print(f"Error al firmar: {e}")
-            return False
+    def get_participant_transactions(self, public_key, role="any", limit=None):
+        if role == "sender":
+            return self._query_transactions("sender = ?", (public_key,), limit)
+        if role == "receiver":
+            return self._query_transactions("receiver = ?", (public_key,), limit)
+        sent = self._query_transactions("sender = ?", (public_key,), limit)
+        received = self._query_transactions("receiver = ? AND sender != ?", (public_key, public_key), limit)
+        history = sorted(sent + received, key=lambda t: (t["block_index"], t["position"]))
+        return history[:limit] if limit else history
 
-    def is_valid(self):
-        #Verificamos matematicamente que la firma coincida con la clave publica del emisor
-        if not self.signature:
-            return False
-        try:
-            vk = VerifyingKey.from_string(bytes.fromhex(self.sender), curve=SECP256k1)
-            return vk.verify(
-                bytes.fromhex(self.signature), self.calculate_hash().encode()
-            )
-        except (BadSignatureError, ValueError):
-            return False
+    def walk_lineage(self, shipment_id, direction: str, max_depth: int):
+        #Recorremos el grafo con un CTE recursivo, devolviendo la profundidad minima de cada envio
+        start_column, next_column = (
+            ("child_id", "parent_id") if direction == "ancestors" else ("parent_id", "child_id")
+        )
+        with self.db.connection() as conn:
+            rows = conn.execute(
+                f"""
+                WITH RECURSIVE walk(id, depth) AS (
+                    SELECT {next_column}, 1 FROM lineage WHERE {start_column} = ?
+                    UNION
+                    SELECT l.{next_column}, w.depth + 1
+                    FROM lineage l JOIN walk w ON l.{start_column} = w.id
+                    WHERE w.depth < ?
+                )
+                SELECT id, MIN(depth) FROM walk GROUP BY id ORDER BY 2, 1
+                """,
+                (shipment_id, max_depth),
+            ).fetchall()
+        return [{"shipment_id": row[0], "depth": row[1]} for row in rows]
 
-class Block:
-    def __init__(
-        self,
-        index: int,
-        transactions: List[Transaction],
-        previous_hash: str,
-        validator_address: str,
-        timestamp: float = None,
-        hash: str = None,
-    ):
-        self.index = index
-        self.timestamp = timestamp if timestamp else time.time()
-        self.transactions = transactions
-        self.previous_hash = previous_hash
-        self.validator = validator_address
-        #Calculamos la raiz de Merkle para resumir todas las transacciones en un solo hash
-        self.merkle_root = self.compute_merkle_root()
-        #Generamos el hash del bloque para hacerlo inmutable
-        self.hash = hash if hash else self.calculate_block_hash()
+    def backfill_lineage(self):
+        #Aristas de procedencia para bloques guardados antes de la migracion 3
+        #Usa el indice de transacciones para decodificar solo bloques que crean activos
+        height = self.get_meta("lineage_backfill_height", 0)
+        if not height:
+            return 0
+        with self.db.connection() as conn:
+            blocks = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT DISTINCT block_index FROM transactions WHERE block_index <= ? AND action IN ('EXTRACTED', 'MANUFACTURED')",
+                    (height,),
+                )
+            ]
+            added = 0
+            try:
+                for index in blocks:
+                    #Los bloques podados ya no tienen cuerpo
+                    data = self.blocks.get(index)
+                    if not data:
+                        continue
+                    added += conn.executemany(
+                        "INSERT OR IGNORE INTO lineage VALUES (?, ?, ?)",
+                        lineage_edges(LazyBlock.from_json(data)),
+                    ).rowcount
+                conn.execute("DELETE FROM node_meta WHERE key = 'lineage_backfill_height'")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return added
 
-    def compute_merkle_root(self):
-        #Implementamos un Arbol de Merkle para agrupar eficientemente todos los hashes de las transacciones
-        if not self.transactions:
-            return ""
-        hashes = [tx.tx_hash for tx in self.transactions]
-        while len(hashes) > 1:
-            temp = []
-            for i in range(0, len(hashes), 2):
-                combined = hashes[i] + (
-                    hashes[i + 1] if i + 1 < len(hashes) else hashes[i]
+    def backfill_transactions(self, batch_blocks=500):
+        #Llena la tabla transactions para bloques guardados antes de la migracion 2
+        #Solo procesa los bloques que aun no tienen filas, se puede repetir sin duplicar
+        with self.db.connection() as conn:
+            pending = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT block_index FROM blocks WHERE block_index > ? AND block_index NOT IN (SELECT DISTINCT block_index FROM transactions) ORDER BY block_index",
+                    (self.get_pruned_height(),),
                 )
-                temp.append(hashlib.sha256(combined.encode()).hexdigest())
-            hashes = temp
-        return hashes[0]
+            ]
+            indexed = 0
+            for start in range(0, len(pending), batch_blocks):
+                chunk = pending[start:start + batch_blocks]
+                wanted = set(chunk)
+                try:
+                    for index, data in self.blocks.scan(chunk[0], chunk[-1]):
+                        if index not in wanted:
+                            continue
+                        rows = transaction_rows(LazyBlock.from_json(data))
+                        conn.executemany(
+                            "INSERT OR IGNORE INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+                        )
+                        indexed += len(rows)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+        return indexed
 
-    def calculate_block_hash(self):
-        #Creamos el hash del bloque vinculandolo con el anterior para formar la cadena irrompible
-        data = {
-            "index": self.index,
-            "timestamp": self.timestamp,
-            "previous_hash": self.previous_hash,
-            "merkle_root": self.merkle_root,
-            "validator": self.validator,
-        }
-        return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+    def export_state(self):
+        #Todo se lee dentro de una transaccion para que bloque y estado sean consistentes
+        with self.db.connection() as conn:
+            conn.execute("BEGIN")
+            try:
+                tip = conn.execute(
+                    "SELECT block_index, block_hash FROM blocks ORDER BY block_index DESC LIMIT 1"
+                ).fetchone()
+                if not tip:
+                    return None
+                state = {
+                    table: [
+                        list(row)
+                        for row in conn.execute(
+                            f"SELECT {', '.join(columns)} FROM {table} ORDER BY {columns[0]}"
+                        )
+                    ]
+                    for table, columns in SNAPSHOT_TABLES.items()
+                }
+            finally:
+                conn.commit()
+        return tip[0], tip[1], state
 
-    def to_json(self):
-        #Preparamos el bloque en formato JSON para guardarlo
-        return json.dumps(
-            {
-                "index": self.index,
-                "timestamp": self.timestamp,
-                "transactions": [
-                    {**tx.to_dict(), "signature": tx.signature}
-                    for tx in self.transactions
-                ],
-                "previous_hash": self.previous_hash,
-                "validator": self.validator,
-                "merkle_root": self.merkle_root,
-                "hash": self.hash,
+    def import_state(self, tip_block: Block, state: Dict[str, Any]):
+        with self._state_lock, self.db.connection() as conn:
+            appended = False
+            try:
+                self.blocks.open_writer()
+                conn.execute("BEGIN")
+                for table, columns in SNAPSHOT_TABLES.items():
+                    conn.execute(f"DELETE FROM {table}")
+                    conn.executemany(
+                        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                        state[table],
+                    )
+                hashes = self._rebuild_state_tree(conn)
+                state_root = state_root_from_buckets(hashes)
+                if tip_block.state_root is not None and tip_block.state_root != state_root:
+                    conn.rollback()
+                    return False, "El estado no coincide con la raiz de estado del bloque punta"
+                conn.execute(
+                    "INSERT INTO blocks (block_index, block_hash, previous_hash, validator, timestamp, data, state_root) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        tip_block.index,
+                        tip_block.hash,
+                        tip_block.previous_hash,
+                        tip_block.validator,
+                        tip_block.timestamp,
+                        self.blocks.column_value(tip_block.to_json()),
+                        state_root,
+                    ),
+                )
+                conn.executemany(
+                    "INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    transaction_rows(tip_block),
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO lineage VALUES (?, ?, ?)", lineage_edges(tip_block)
+                )
+                #Los indices de historial y procedencia empiezan en esta altura (get_history_height)
+                conn.execute(
+                    "INSERT OR REPLACE INTO node_meta (key, value) VALUES ('snapshot_height', ?)",
+                    (tip_block.index,),
+                )
+                #Los bloques anteriores a la instantanea nunca se descargan, se tratan como podados
+                conn.execute(
+                    "INSERT OR REPLACE INTO node_meta (key, value) VALUES ('pruned_height', ?)",
+                    (tip_block.index - 1,),
+                )
+                appended = True
+                self.blocks.append(tip_block.index, tip_block.to_json())
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                if appended:
+                    self.blocks.truncate(0)
+                raise
+            self._bucket_hashes = hashes
+        return True, "Estado importado"
+
+
+def real_columns(row):
+    #quantity y last_updated_timestamp son REAL en SQLite: un entero se guarda como float
+    row = tuple(row)
+    quantity = None if row[2] is None else float(row[2])
+    return row[:2] + (quantity,) + row[3:6] + (float(row[6]),) + row[7:]
+
+
+class MemoryStorage(ChainStorage):
+    #Motor sin SQL ni disco: diccionarios de Python con los mismos efectos que SQLiteStorage
+    #(orden de STATE_UPDATES, columnas REAL, raiz de estado), asi un nodo en memoria
+    #acepta y produce los mismos bloques. Para pruebas y simulaciones, se pierde al cerrar
+    name = "memory"
+    block_store = "memory"
+
+    def __init__(self, db_path=":memory:", storage_profile=None, block_store=None):
+        if block_store == "log":
+            raise ValueError("El log de bloques necesita una base en disco")
+        #Un solo candado: Flask atiende cada peticion en un hilo
+        self._lock = threading.RLock()
+        self.meta = {}
+        #Filas en el orden de SNAPSHOT_TABLES, participantes por public_key
+        self.participants = {}
+        self.goods = {}
+        self.shipments = {}
+        self.leaves = {}
+        self.bucket_members = {}
+        self.bucket_hashes = [EMPTY_BUCKET] * STATE_BUCKETS
+        #tx_hash -> (JSON, llegada), el dict conserva el orden de insercion para los empates
+        self.mempool = {}
+        #block_index -> [BlockHeader, JSON (None si se podo), raiz de estado, encabezado podado]
+        self.blocks = {}
+        self.block_hashes = set()
+        self.height = 0
+        self.tx_locations = {}
+        self.tx_index = {"shipment_id": {}, "sender": {}, "receiver": {}}
+        self.parents = {}
+        self.children = {}
+        #Diario (tabla, llave, valor anterior) para deshacer un bloque que falla a medias
+        self._journal = None
+
+    def get_meta(self, key, default=None):
+        return self.meta.get(key, default)
+
+    def set_meta(self, key, value):
+        self.meta[key] = value
+
+    def get_delegates(self, limit: int):
+        with self._lock:
+            rows = sorted(self.participants.values(), key=lambda row: (-(row[4] or 0), row[0]))
+        return [row[0] for row in rows[:limit]]
+
+    def get_first_participant(self):
+        with self._lock:
+            return next((row[0] for row in self.participants.values()), None)
+
+    def has_participant(self, public_key):
+        return public_key in self.participants
+
+    def participant_keys(self):
+        with self._lock:
+            return set(self.participants)
+
+    def get_public_key_by_name(self, name):
+        with self._lock:
+            return next((pk for pk, row in self.participants.items() if row[0] == name), None)
+
+    def get_name_by_public_key(self, pk):
+        row = self.participants.get(pk)
+        return row[0] if row else None
+
+    def get_shipment_state(self, shipment_id):
+        row = self.shipments.get(shipment_id)
+        return (row[3], row[5], row[7]) if row else None
+
+    def recent_shipment_states(self, limit: int):
+        with self._lock:
+            rows = sorted(self.shipments.values(), key=lambda row: row[6] or 0, reverse=True)
+        return [(row[0], (row[3], row[5], row[7])) for row in rows[:limit]]
+
+    def count_shipments(self):
+        return len(self.shipments)
+
+    def _put(self, table, key, value):
+        self._journal.append((table, key, table.get(key)))
+        table[key] = value
+
+    def _rollback(self):
+        for table, key, old in reversed(self._journal):
+            if old is None:
+                table.pop(key, None)
+            else:
+                table[key] = old
+        self._journal = None
+
+    def _apply_state(self, transactions: List[Transaction]):
+        #Mismos efectos y mismo orden que STATE_UPDATES, cada cambio queda en el diario
+        for tx in transactions:
+            kind = state_update_kind(tx)
+            if kind == "VOTE":
+                row = self.participants.get(tx.receiver)
+                if row:
+                    votes = None if row[4] is None else row[4] + 1
+                    self._put(self.participants, tx.receiver, row[:4] + (votes,))
+                continue
+            row = self.shipments.get(tx.shipment_id)
+            if kind == "CREATE":
+                row = (tx.shipment_id, tx.good_id, tx.quantity, tx.receiver, tx.location, tx.action, tx.timestamp, 1)
+            elif row is None:
+                continue
+            elif kind == "RETIRE":
+                row = row[:5] + (tx.action, tx.timestamp, 0)
+            else:
+                #Si la transaccion no trae cantidad se conserva la anterior
+                quantity = row[2] if tx.quantity is None else tx.quantity
+                row = (row[0], row[1], quantity, tx.receiver, tx.location, tx.action, tx.timestamp, 1)
+            self._put(self.shipments, tx.shipment_id, real_columns(row))
+        changed = {tx.shipment_id for tx in transactions if tx.action != "VOTE"}
+        hashes = list(self.bucket_hashes)
+        for shipment_id in changed:
+            row = self.shipments.get(shipment_id)
+            if row is not None:
+                self._put(self.leaves, shipment_id, state_leaf(row))
+                self.bucket_members.setdefault(state_bucket(shipment_id), set()).add(shipment_id)
+        for bucket in {state_bucket(sid) for sid in changed}:
+            hashes[bucket] = state_bucket_hash(self._bucket_leaves(bucket))
+        return hashes
+
+    def _bucket_leaves(self, bucket):
+        #Un envio de un bloque deshecho puede seguir en bucket_members, sin hoja no cuenta
+        members = self.bucket_members.get(bucket, ())
+        return sorted((sid, self.leaves[sid]) for sid in members if sid in self.leaves)
+
+    def _build_tree(self, shipments):
+        leaves = {sid: state_leaf(row) for sid, row in shipments.items()}
+        members = {}
+        for sid in leaves:
+            members.setdefault(state_bucket(sid), set()).add(sid)
+        hashes = [EMPTY_BUCKET] * STATE_BUCKETS
+        for bucket, ids in members.items():
+            hashes[bucket] = state_bucket_hash(sorted((sid, leaves[sid]) for sid in ids))
+        return leaves, members, hashes
+
+    def rebuild_state_tree(self):
+        with self._lock:
+            self.leaves, self.bucket_members, self.bucket_hashes = self._build_tree(self.shipments)
+            state_root = state_root_from_buckets(self.bucket_hashes)
+            if self.height:
+                self.blocks[self.height][2] = state_root
+            self.meta.pop("state_tree_stale", None)
+        return state_root
+
+    def get_state_root(self):
+        with self._lock:
+            return state_root_from_buckets(self.bucket_hashes)
+
+    def compute_state_root(self, transactions: List[Transaction]):
+        with self._lock:
+            self._journal = []
+            try:
+                hashes = self._apply_state(transactions)
+            finally:
+                self._rollback()
+        return state_root_from_buckets(hashes)
+
+    def get_state_bucket(self, shipment_id):
+        with self._lock:
+            return (
+                self.shipments.get(shipment_id),
+                self._bucket_leaves(state_bucket(shipment_id)),
+                list(self.bucket_hashes),
+            )
+
+    def add_to_mempool(self, tx_hash, data, timestamp):
+        with self._lock:
+            if tx_hash in self.mempool:
+                return False
+            self.mempool[tx_hash] = (data, timestamp)
+        return True
+
+    def get_mempool_data(self):
+        with self._lock:
+            entries = sorted(self.mempool.values(), key=lambda entry: entry[1])
+        return [data for data, _ in entries]
+
+    def remove_from_mempool(self, tx_hashes: List[str]):
+        with self._lock:
+            for tx_hash in tx_hashes:
+                self.mempool.pop(tx_hash, None)
+
+    def save_block(self, block: Block):
+        block_json = block.to_json()
+        rows = transaction_rows(block)
+        edges = lineage_edges(block)
+        with self._lock:
+            if block.index in self.blocks or block.hash in self.block_hashes:
+                return False, "Bloque ya registrado"
+            self._journal = []
+            try:
+                hashes = self._apply_state(block.transactions)
+            except Exception:
+                self._rollback()
+                raise
+            state_root = state_root_from_buckets(hashes)
+            #Si el bloque trae raiz de estado debe coincidir con la nuestra
+            if block.state_root is not None and block.state_root != state_root:
+                self._rollback()
+                return False, "La raiz de estado no coincide con el estado local"
+            self._journal = None
+            self.bucket_hashes = hashes
+            self._add_block(block, block_json, state_root, rows, edges)
+            for tx in block.transactions:
+                self.mempool.pop(tx.tx_hash, None)
+        return True, "Guardado"
+
+    def _add_block(self, block, block_json, state_root, rows, edges):
+        self.blocks[block.index] = [BlockHeader.from_block(block), block_json, state_root, None]
+        self.block_hashes.add(block.hash)
+        self.height = max(self.height, block.index)
+        for row in rows:
+            record = dict(zip(TRANSACTION_COLUMNS, row))
+            self.tx_locations.setdefault(record["tx_hash"], (record["block_index"], record["position"]))
+            for column, index in self.tx_index.items():
+                index.setdefault(record[column], []).append(record)
+        for parent, child, index in edges:
+            self.parents.setdefault(child, {}).setdefault(parent, index)
+            self.children.setdefault(parent, {}).setdefault(child, index)
+
+    def get_last_block_header(self):
+        with self._lock:
+            return self.blocks[self.height][0] if self.height else None
+
+    def get_block_header(self, index):
+        entry = self.blocks.get(index)
+        return entry[0] if entry else None
+
+    def get_block_data(self, index):
+        entry = self.blocks.get(index)
+        return entry[1] if entry else None
+
+    def _range(self, start, end):
+        #Indices guardados entre start y end, leidos de una vez para no iterar bajo el candado
+        with self._lock:
+            last = self.height if end is None else min(end, self.height)
+            return [
+                (index, self.blocks[index])
+                for index in range(max(start, 1), last + 1)
+                if index in self.blocks
+            ]
+
+    def scan_blocks(self, start: int = 1, end: int = None):
+        for index, entry in self._range(start, end):
+            if entry[1] is not None:
+                yield index, entry[1]
+
+    def scan_headers(self, start: int = 1, end: int = None):
+        return [(index, entry[3]) for index, entry in self._range(start, end)]
+
+    def prune_blocks(self, keep: int, archive_dir: str = None, vacuum: bool = False):
+        #Mismo reporte que SQLiteStorage, el espacio recuperado son los JSON soltados
+        keep = max(1, keep)
+        with self._lock:
+            pruned_height = self.get_pruned_height()
+            cutoff = self.height - keep
+            report = {
+                "pruned_blocks": 0,
+                "pruned_height": max(pruned_height, cutoff, 0),
+                "archive": None,
+                "bytes_reclaimed": 0,
             }
-        )
+            if cutoff <= pruned_height:
+                report["pruned_height"] = pruned_height
+                return report
+            rows = list(self.scan_blocks(pruned_height + 1, cutoff))
+            if archive_dir and rows:
+                report["archive"] = archive_blocks(archive_dir, rows)
+            for index, data in rows:
+                entry = self.blocks[index]
+                entry[3] = json.dumps(LazyBlock.from_json(data).header())
+                entry[1] = None
+            self.meta["pruned_height"] = cutoff
+            report["pruned_blocks"] = len(rows)
+            report["bytes_reclaimed"] = sum(len(data) for _, data in rows)
+        return report
 
+    def find_transaction(self, tx_hash):
+        return self.tx_locations.get(tx_hash)
 
-    @staticmethod
-    def from_json(json_str):
-        #Reconstruimos el bloque desde el texto JSON que recibimos
-        d = json.loads(json_str)
-        txs = [
-            Transaction(
-                t["sender"],
-                t["receiver"],
-                t["shipment_id"],
-                ActionType(t["action"]),
-                t["location"],
-                t.get("good_id"),
-                t.get("quantity"),
-                t["metadata"],
-                t["timestamp"],
-                t.get("signature"),
+    def shipment_created(self, shipment_id):
+        with self._lock:
+            records = self.tx_index["shipment_id"].get(shipment_id, ())
+            return any(record["action"] in ("EXTRACTED", "MANUFACTURED") for record in records)
+
+    def _transactions(self, column, value):
+        with self._lock:
+            return [dict(record) for record in self.tx_index[column].get(value, ())]
+
+    def get_shipment_transactions(self, shipment_id, limit=None):
+        history = self._transactions("shipment_id", shipment_id)
+        return history[:limit] if limit else history
+
+    def get_participant_transactions(self, public_key, role="any", limit=None):
+        if role == "sender":
+            history = self._transactions("sender", public_key)
+        elif role == "receiver":
+            history = self._transactions("receiver", public_key)
+        else:
+            received = [t for t in self._transactions("receiver", public_key) if t["sender"] != public_key]
+            history = sorted(
+                self._transactions("sender", public_key) + received,
+                key=lambda t: (t["block_index"], t["position"]),
             )
-            for t in d["transactions"]
-        ]
-        return Block(
-            d["index"],
-            txs,
-            d["previous_hash"],
-            d["validator"],
-            d["timestamp"],
-            d["hash"],
-        )
+        return history[:limit] if limit else history
+
+    def walk_lineage(self, shipment_id, direction: str, max_depth: int):
+        #Recorrido por niveles: la primera vez que se alcanza un envio es su profundidad minima
+        graph = self.parents if direction == "ancestors" else self.children
+        depths = {}
+        frontier = [shipment_id]
+        with self._lock:
+            for depth in range(1, max(max_depth, 1) + 1):
+                reached = []
+                for current in frontier:
+                    for other in graph.get(current, ()):
+                        if other not in depths:
+                            depths[other] = depth
+                            reached.append(other)
+                if not reached:
+                    break
+                frontier = reached
+        ordered = sorted(depths.items(), key=lambda item: (item[1], item[0]))
+        return [{"shipment_id": sid, "depth": depth} for sid, depth in ordered]
+
+    def export_state(self):
+        with self._lock:
+            if not self.height:
+                return None
+            tip = self.blocks[self.height][0]
+            tables = {
+                "participants": self.participants.values(),
+                "goods": self.goods.values(),
+                "shipments": self.shipments.values(),
+            }
+            state = {
+                table: [list(row) for row in sorted(rows, key=lambda row: row[0])]
+                for table, rows in tables.items()
+            }
+        return tip.index, tip.hash, state
+
+    def import_state(self, tip_block: Block, state: Dict[str, Any]):
+        participants = {}
+        for row in state["participants"]:
+            row = tuple(row)
+            participants[row[1]] = row
+        goods = {}
+        for row in state["goods"]:
+            row = tuple(row)
+            goods[row[0]] = row
+        shipments = {}
+        for row in state["shipments"]:
+            row = real_columns(row)
+            shipments[row[0]] = row
+        leaves, members, hashes = self._build_tree(shipments)
+        state_root = state_root_from_buckets(hashes)
+        if tip_block.state_root is not None and tip_block.state_root != state_root:
+            return False, "El estado no coincide con la raiz de estado del bloque punta"
+        with self._lock:
+            self.participants, self.goods, self.shipments = participants, goods, shipments
+            self.leaves, self.bucket_members, self.bucket_hashes = leaves, members, hashes
+            self._add_block(
+                tip_block,
+                tip_block.to_json(),
+                state_root,
+                transaction_rows(tip_block),
+                lineage_edges(tip_block),
+            )
+            #Los indices de historial y procedencia empiezan en esta altura (get_history_height)
+            self.meta["snapshot_height"] = tip_block.index
+            self.meta["pruned_height"] = tip_block.index - 1
+        return True, "Estado importado"
+
+
+#Motores de almacenamiento que implementan ChainStorage
+#BLOCKCHAIN_STORAGE_BACKEND=sqlite|memory (db_path=":memory:" elige memory)
+STORAGE_BACKENDS = {
+    "sqlite": SQLiteStorage,
+    "memory": MemoryStorage,
+}
+DEFAULT_STORAGE_BACKEND = os.environ.get("BLOCKCHAIN_STORAGE_BACKEND")
 
 
-#Logica principal del Nodo Blockchain
 class BlockchainNode:
-    def __init__(self, node_name="Unknown", db_path="blockchain.db"):
+    def __init__(
+        self,
+        node_name="Unknown",
+        db_path="blockchain.db",
+        storage_profile=None,
+        state_cache_size=0,
+        block_store=None,
+        storage_backend=None,
+    ):
         self.node_name = node_name
         self.db_file = db_path
-        self.init_db()
-    def init_db(self):
-        #Preparamos las tablas de la base de datos para guardar bloques y participantes
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        #Tabla para guardar la cadena de bloques completa
-        cursor.execute(
-            "CREATE TABLE IF NOT EXISTS blocks (block_index INTEGER PRIMARY KEY, block_hash TEXT UNIQUE, previous_hash TEXT, validator TEXT, timestamp REAL, data TEXT)"
+        self.storage_profile = storage_profile or DEFAULT_STORAGE_PROFILE
+        #":memory:" usa el motor en memoria, storage_backend="sqlite" la deja como SQLite en RAM
+        self.storage_backend = storage_backend or (
+            "memory" if db_path == ":memory:" else DEFAULT_STORAGE_BACKEND or "sqlite"
         )
-        #Tabla para los participantes donde guardamos sus votos y reputacion
-        cursor.execute(
-            "CREATE TABLE IF NOT EXISTS participants (name TEXT UNIQUE, public_key TEXT PRIMARY KEY, role TEXT, reputation INTEGER DEFAULT 10, votes INTEGER DEFAULT 0)"
+        if self.storage_backend not in STORAGE_BACKENDS:
+            raise ValueError(f"Backend de almacenamiento desconocido: {self.storage_backend}")
+        #Bloques, estado, mempool y participantes: todo se lee y escribe por self.storage
+        self.storage = STORAGE_BACKENDS[self.storage_backend](
+            db_path, self.storage_profile, block_store
         )
-        #Tabla para el catalogo de productos disponibles
-        cursor.execute(
-            "CREATE TABLE IF NOT EXISTS goods (good_id TEXT PRIMARY KEY, name TEXT, unit_of_measure TEXT)"
-        )
-        #Tabla para rastrear el estado actual de cada envio
-        cursor.execute(
-            "CREATE TABLE IF NOT EXISTS shipments (shipment_id TEXT PRIMARY KEY, good_id TEXT, quantity REAL, current_owner_pk TEXT, current_location TEXT, last_action TEXT, last_updated_timestamp REAL, is_active INTEGER DEFAULT 1)"
-        )
-        #Tabla temporal para transacciones que aun no estan en un bloque
-        cursor.execute(
-            "CREATE TABLE IF NOT EXISTS mempool (tx_hash TEXT PRIMARY KEY, data TEXT, timestamp REAL)"
-        )
-        conn.commit()
-        conn.close()
+        self.prune_keep = None
+        self.prune_archive = None
+        self.prune_interval = 100
+        #Punta de la cadena en memoria, se actualiza cada vez que se guarda un bloque
+        self._tip_lock = threading.Lock()
+        self._tip = self.get_last_block_header()
+        #Cache del estado para las reglas, solo la activa el proceso que escribe (p2p.py)
+        #porque otro proceso no veria los bloques que se aplican despues de cargarla
+        self.state_cache = None
+        if state_cache_size:
+            self.enable_state_cache(state_cache_size)
+
+    def schema_version(self):
+        return self.storage.schema_version()
+
+    def explain_hot_queries(self):
+        return self.storage.explain_hot_queries()
+
+    def enable_state_cache(self, max_shipments=200000):
+        self.state_cache = StateCache(max_shipments)
+        self.state_cache.load(self.storage)
+
+    def verify_state_cache(self):
+        #Compara la cache con el almacenamiento, si no coincide la recargamos
+        if not self.state_cache:
+            return True, []
+        mismatches = self.state_cache.verify(self.storage)
+        if mismatches:
+            self.state_cache.load(self.storage)
+        return not mismatches, mismatches
+
+    def set_storage_profile(self, profile: str):
+        self.storage.set_profile(profile)
+        self.storage_profile = profile
+
+    def close(self):
+        #Cerramos el almacenamiento del nodo al apagarlo
+        self.storage.close()
 
     def select_validator(self, previous_block_hash, seed_offset=0):
         #Aqui seleccionamos al validador basandonos en votos en lugar de usar energia de minado
-        with sqlite3.connect(self.db_file) as conn:
-            #Buscamos a los 3 participantes con mas votos
-            delegates = conn.execute(
-                "SELECT name FROM participants ORDER BY votes DESC, name ASC LIMIT 3"
-            ).fetchall()
+        #Buscamos a los 3 participantes con mas votos
+        delegates = self.storage.get_delegates(3)
 
         if not delegates:
             #Si no hay votos usamos un respaldo para que la red no se detenga
-            with sqlite3.connect(self.db_file) as conn:
-                fallback = conn.execute(
-                    "SELECT name FROM participants LIMIT 1"
-                ).fetchone()
-            return fallback[0] if fallback else "Unknown"
+            return self.storage.get_first_participant() or "Unknown"
 
         #Usamos el hash anterior para elegir aleatoriamente uno de los delegados top
         seed_str = f"{previous_block_hash}{seed_offset}"
         seed_int = int(hashlib.sha256(seed_str.encode()).hexdigest(), 16)
         winner_index = seed_int % len(delegates)
-        return delegates[winner_index][0]
+        return delegates[winner_index]
 
 
     def validate_smart_contract_rules(
@@ -246,10 +3408,10 @@ class BlockchainNode:
         #Estas son las reglas del contrato inteligente que validan la logica de negocio
         #Regla para validar votos electorales
         if tx.action == "VOTE":
-            with sqlite3.connect(self.db_file) as conn:
-                exists = conn.execute(
-                    "SELECT 1 FROM participants WHERE public_key=?", (tx.receiver,)
-                ).fetchone()
+            if self.state_cache:
+                exists = self.state_cache.has_participant(tx.receiver)
+            else:
+                exists = self.storage.has_participant(tx.receiver)
             return (True, "Voto Valido") if exists else (False, "Candidato desconocido")
 
         shipment_data = None
@@ -262,11 +3424,7 @@ class BlockchainNode:
             found_in_temp = True
 
         if not found_in_temp:
-            with sqlite3.connect(self.db_file) as conn:
-                shipment_data = conn.execute(
-                    "SELECT current_owner_pk, last_action, is_active FROM shipments WHERE shipment_id = ?",
-                    (tx.shipment_id,),
-                ).fetchone()
+            shipment_data = self.get_shipment_state(tx.shipment_id)
 
         #Reglas para cuando se crea un nuevo activo en la red
         if tx.action in ["EXTRACTED", "MANUFACTURED"]:
@@ -284,27 +3442,43 @@ class BlockchainNode:
         #Verificamos que el producto no haya sido destruido o consumido antes
         if is_active == 0:
             return False, f"El envio {tx.shipment_id} esta inactivo."
-        
+
         #Regla de propiedad solo el dueño actual puede mover la mercancia
         if tx.sender != current_owner:
             return False, f"El emisor no es el propietario actual."
 
         return True, "Reglas del Contrato Validadas"
 
+    def get_shipment_state(self, shipment_id):
+        #(dueño actual, ultima accion, activo) desde la cache en memoria o desde el almacenamiento
+        cache = self.state_cache
+        if cache:
+            state = cache.get_shipment(shipment_id)
+            if state is not STATE_UNKNOWN:
+                return state
+            generation = cache.generation
+        state = self.storage.get_shipment_state(shipment_id)
+        if cache and state:
+            cache.fill(shipment_id, state, generation)
+        return state
+
     def receive_block(self, block: Block):
         #Procesamos un bloque que nos llego de la red
         is_valid, reason = self.validate_block(block)
         if is_valid:
-            self.save_block_to_db(block)
-            self.clear_mempool(block.transactions)
+            saved, reason = self.save_block_to_db(block)
+            if not saved:
+                return False, f"Rechazado por {reason}"
             return True, "Aceptado"
         return False, f"Rechazado por {reason}"
 
     def validate_block(self, block: Block):
         #Hacemos chequeos de seguridad antes de aceptar un bloque nuevo
-        last_block = self.get_last_block()
-        
+        #Solo necesitamos indice y hash del ultimo bloque, los tomamos de la punta en memoria
+        last_block = self.get_tip()
+
         #Validacion especial para el primer bloque de la cadena
+        #El genesis no lleva raiz de estado: su estado se carga aparte con load_genesis
         if block.index == 1:
             if last_block:
                 return False, "El Genesis ya existe"
@@ -319,170 +3493,322 @@ class BlockchainNode:
             return False, "El indice no es consecutivo"
         if block.previous_hash != last_block.hash:
             return False, "La cadena esta rota el hash previo no coincide"
+        #Desde la version 2 la raiz de estado es obligatoria, solo los bloques v1 (y el genesis)
+        #quedan exentos. Sin ella un nodo con otro estado aceptaria el bloque sin notarlo
+        if block.version != BLOCK_VERSION_LEGACY and block.state_root is None:
+            return False, "El bloque no trae raiz de estado"
+        #La raiz publicada debe salir de las transacciones, si no el hash no protege nada
+        if not block.verify_merkle_root():
+            return False, "La raiz de Merkle no coincide con las transacciones"
         if block.hash != block.calculate_block_hash():
             return False, "El hash del bloque es invalido datos alterados"
+        #Verificamos todas las firmas del bloque en paralelo
+        if not all(verify_batch(block.transactions)):
+            return False, "El bloque contiene firmas invalidas"
         return True, "Bloque Valido"
 
     def save_block_to_db(self, block: Block):
         #Guardamos el bloque y actualizamos el estado actual de todos los objetos
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+        #El almacenamiento aplica bloque, estado y limpieza de la mempool de forma atomica
+        saved, reason = self.storage.save_block(block)
+        if not saved:
+            return False, reason
+        if self.state_cache:
+            self.state_cache.apply_block(block.transactions)
+        self._advance_tip(BlockHeader.from_block(block))
+        return True, "Guardado"
+
+    def load_genesis(self, block: Block, state: Dict[str, Any]):
+        #Estado inicial de la red (tablas de SNAPSHOT_TABLES) junto con el bloque genesis
+        #Sus transacciones no se aplican: el estado ya es el resultado del genesis
+        if self.get_height():
+            return False, "El nodo ya tiene bloques"
         try:
-            cursor.execute(
-                "INSERT INTO blocks (block_index, block_hash, previous_hash, validator, timestamp, data) VALUES (?, ?, ?, ?, ?, ?)",
-                (
-                    block.index,
-                    block.hash,
-                    block.previous_hash,
-                    block.validator,
-                    block.timestamp,
-                    block.to_json(),
-                ),
-            )
+            check_state_rows(state)
+        except ValueError as e:
+            return False, f"Estado genesis invalido: {e}"
+        loaded, reason = self.storage.import_state(block, state)
+        if not loaded:
+            return False, reason
+        self._advance_tip(BlockHeader.from_block(block))
+        if self.state_cache:
+            self.state_cache.load(self.storage)
+        return True, "Genesis cargado"
 
+    def rebuild_state_tree(self):
+        #Reconstruye el arbol de estado (bases anteriores a la migracion 4) y fija la raiz de la punta
+        return self.storage.rebuild_state_tree()
 
-            #Actualizamos las tablas segun lo que paso en cada transaccion
-            for tx in block.transactions:
-                if tx.action == "VOTE":
-                    cursor.execute(
-                        "UPDATE participants SET votes = votes + 1 WHERE public_key = ?",
-                        (tx.receiver,),
-                    )
-                elif tx.action in ["DESTROYED", "CONSUMED"]:
-                    cursor.execute(
-                        "UPDATE shipments SET is_active = 0, last_action = ?, last_updated_timestamp = ? WHERE shipment_id = ?",
-                        (tx.action, tx.timestamp, tx.shipment_id),
-                    )
-                elif tx.action in ["EXTRACTED", "MANUFACTURED"]:
-                    cursor.execute(
-                        """
-                        INSERT OR REPLACE INTO shipments (shipment_id, good_id, quantity, current_owner_pk, current_location, last_action, last_updated_timestamp, is_active) 
-                        VALUES (?, ?, ?, ?, ?, ?, ?, 1)
-                    """,
-                        (
-                            tx.shipment_id,
-                            tx.good_id,
-                            tx.quantity,
-                            tx.receiver,
-                            tx.location,
-                            tx.action,
-                            tx.timestamp,
-                        ),
-                    )
-                else:
-                    q_sql = ", quantity = ?" if tx.quantity is not None else ""
-                    params = [tx.receiver, tx.location, tx.action, tx.timestamp]
-                    if tx.quantity is not None:
-                        params.append(tx.quantity)
-                    params.append(tx.shipment_id)
-                    cursor.execute(
-                        f"UPDATE shipments SET current_owner_pk = ?, current_location = ?, last_action = ?, last_updated_timestamp = ?, is_active = 1 {q_sql} WHERE shipment_id = ?",
-                        params,
-                    )
-            conn.commit()
-        except sqlite3.IntegrityError:
-            pass
-        finally:
-            conn.close()
+    def get_state_root(self):
+        #Raiz del estado actual de los envios, dos nodos a la misma altura deben coincidir
+        return self.storage.get_state_root()
 
+    def compute_state_root(self, transactions: List[Transaction]):
+        #Raiz de estado que quedaria despues de aplicar las transacciones, sin guardar nada
+        #El validador la pone en el encabezado del bloque que va a proponer
+        return self.storage.compute_state_root(transactions)
+
+    def get_state_proof(self, shipment_id):
+        #Prueba de que un envio tiene cierto estado (o de que no existe) bajo la raiz actual
+        row, leaves, hashes = self.storage.get_state_bucket(shipment_id)
+        tip = self.get_tip()
+        proof = {
+            "shipment_id": shipment_id,
+            "state": list(row) if row else None,
+            "columns": list(SNAPSHOT_TABLES["shipments"]),
+            "bucket": state_bucket(shipment_id),
+            "bucket_leaves": [[sid, leaf.hex()] for sid, leaf in leaves],
+            "branch": merkle_branch(merkle_levels(hashes), state_bucket(shipment_id)),
+            "state_root": state_root_from_buckets(hashes),
+            "height": tip.index if tip else 0,
+        }
+        #Si el bloque punta trae la raiz en su encabezado la prueba queda anclada a la cadena
+        block = self.get_block_by_index(tip.index) if tip else None
+        if block and block.state_root == proof["state_root"]:
+            proof["block"] = block.header()
+        return proof
 
     def add_to_mempool(self, tx: Transaction):
         #Agregamos una transaccion a la lista de espera
         if not tx.is_valid():
             return False, "Firma digital invalida"
-        conn = sqlite3.connect(self.db_file)
+        tx_data = tx.to_dict()
+        tx_data["signature"] = tx.signature
         try:
-            #Verificamos si ya tenemos esta transaccion para no duplicarla
-            cursor = conn.execute(
-                "SELECT 1 FROM mempool WHERE tx_hash = ?", (tx.tx_hash,)
-            )
-            if cursor.fetchone():
-                return False, "Transaccion duplicada"
-
-            tx_data = tx.to_dict()
-            tx_data["signature"] = tx.signature
-            conn.execute(
-                "INSERT INTO mempool VALUES (?, ?, ?)",
-                (tx.tx_hash, json.dumps(tx_data), time.time()),
-            )
-            conn.commit()
+            added = self.storage.add_to_mempool(tx.tx_hash, json.dumps(tx_data), time.time())
         except Exception as e:
             return False, str(e)
-        finally:
-            conn.close()
+        #Verificamos si ya tenemos esta transaccion para no duplicarla
+        if not added:
+            return False, "Transaccion duplicada"
         return True, "Agregada a mempool"
     def get_mempool_transactions(self):
         #Recuperamos todas las transacciones pendientes en orden de llegada
-        conn = sqlite3.connect(self.db_file)
-        rows = conn.execute(
-            "SELECT data FROM mempool ORDER BY timestamp ASC"
-        ).fetchall()
-        conn.close()
-        txs = []
-        for row in rows:
-            t = json.loads(row[0])
-            tx = Transaction(
-                t["sender"],
-                t["receiver"],
-                t["shipment_id"],
-                ActionType(t["action"]),
-                t["location"],
-                t.get("good_id"),
-                t.get("quantity"),
-                t["metadata"],
-                t["timestamp"],
-                t.get("signature"),
-            )
-            txs.append(tx)
-        return txs
+        return [Transaction.from_dict(json.loads(data)) for data in self.storage.get_mempool_data()]
 
     def clear_mempool(self, processed_txs: List[Transaction]):
         #Limpiamos de la lista de espera las transacciones que ya se procesaron
-        conn = sqlite3.connect(self.db_file)
-        for tx in processed_txs:
-            conn.execute("DELETE FROM mempool WHERE tx_hash = ?", (tx.tx_hash,))
-        conn.commit()
-        conn.close()
+        self.storage.remove_from_mempool([tx.tx_hash for tx in processed_txs])
 
 
     def get_last_block(self):
         #Buscamos cual es el ultimo bloque aceptado en la cadena
-        conn = sqlite3.connect(self.db_file)
-        row = conn.execute(
-            "SELECT data FROM blocks ORDER BY block_index DESC LIMIT 1"
-        ).fetchone()
-        conn.close()
-        return Block.from_json(row[0]) if row else None
+        header = self.get_last_block_header()
+        return self.get_block_by_index(header.index) if header else None
+
+    def get_last_block_header(self):
+        #Encabezado del ultimo bloque sin tocar el JSON
+        return self.storage.get_last_block_header()
+
+    def get_block_header(self, index):
+        return self.storage.get_block_header(index)
+
+    def get_tip(self):
+        #Punta de la cadena (altura, hash, validador) sin consultar el almacenamiento
+        return self._tip
+
+    def get_height(self):
+        tip = self._tip
+        return tip.index if tip else 0
+
+    def _advance_tip(self, header: BlockHeader):
+        with self._tip_lock:
+            if self._tip is None or header.index > self._tip.index:
+                self._tip = header
 
     def get_block_by_index(self, index):
-        conn = sqlite3.connect(self.db_file)
-        row = conn.execute(
-            "SELECT data FROM blocks WHERE block_index = ?", (index,)
-        ).fetchone()
-        conn.close()
-        return Block.from_json(row[0]) if row else None
+        data = self.storage.get_block_data(index)
+        if data is None and 0 < index <= self.get_pruned_height():
+            raise BlockPrunedError(index, self.get_pruned_height())
+        return LazyBlock.from_json(data) if data else None
+
+    def get_header_data(self, index):
+        #Encabezado completo (merkle_root, version, state_root), tambien de bloques podados:
+        #con el se verifican pruebas de inclusion o de estado obtenidas de otro nodo
+        headers = self.iter_header_data(index, index)
+        return next(headers, None)
 
+    def iter_header_data(self, start_index=1, end_index=None):
+        #Los podados traen su encabezado guardado, los demas salen del cuerpo
+        for index, header in self.storage.scan_headers(start_index, end_index):
+            if header:
+                yield json.loads(header)
+                continue
+            data = self.storage.get_block_data(index)
+            if data:
+                yield LazyBlock.from_json(data).header()
+
+    def iter_blocks_json(self, start_index=1):
+        #Texto JSON de los bloques tal como esta guardado, para reenviarlo sin reconstruirlo
+        pruned_height = self.get_pruned_height()
+        if start_index <= pruned_height:
+            raise BlockPrunedError(start_index, pruned_height)
+        for _, data in self.storage.scan_blocks(start_index):
+            yield data
+
+
+    def find_transaction_block(self, tx_hash):
+        #Ubicamos el bloque con el indice de transacciones en lugar de recorrer la cadena
+        location = self.storage.find_transaction(tx_hash)
+        return self.get_block_by_index(location[0]) if location else None
+
+    def get_transaction(self, tx_hash):
+        #Transaccion completa (con ubicacion, metadata y firma) desde su bloque
+        location = self.storage.find_transaction(tx_hash)
+        if not location:
+            return None
+        block = self.get_block_by_index(location[0])
+        return block.transactions[location[1]] if block else None
+
+    def get_history_height(self):
+        #Primer bloque indexado en transactions y lineage (0 si el nodo tiene toda la historia)
+        return int(self.get_meta("snapshot_height", 0))
+
+    def _check_history(self, shipment_ids):
+        #Un envio creado antes de la instantanea tiene eventos y aristas que no estan indexados
+        #Los envios nunca se borran del estado: si existe pero su creacion no esta en el
+        #indice, se creo antes de la instantanea
+        snapshot_height = self.get_history_height()
+        if snapshot_height <= 1:
+            return
+        for shipment_id in shipment_ids:
+            if self.storage.shipment_created(shipment_id):
+                continue
+            if self.storage.get_shipment_state(shipment_id) is not None:
+                raise HistoryUnavailableError(shipment_id, snapshot_height)
+
+    def get_shipment_history(self, shipment_id, limit=None):
+        #Todos los eventos de un envio en orden, sin decodificar bloques
+        self._check_history([shipment_id])
+        return self.storage.get_shipment_transactions(shipment_id, limit)
+
+    def get_participant_transactions(self, public_key, role="any", limit=None):
+        #Transacciones enviadas (sender), recibidas (receiver) o ambas (any) por un participante
+        #Despues de una instantanea las anteriores no estan, se rechaza en vez de responder a medias
+        snapshot_height = self.get_history_height()
+        if snapshot_height > 1:
+            raise HistoryUnavailableError(public_key[:16], snapshot_height)
+        return self.storage.get_participant_transactions(public_key, role, limit)
+
+    def export_snapshot(self):
+        #Estado completo (participantes con votos, bienes y envios) a la altura de la punta
+        exported = self.storage.export_state()
+        if not exported:
+            return None
+        height, tip_hash, state = exported
+        snapshot = {
+            "format": SNAPSHOT_FORMAT,
+            "height": height,
+            "tip_hash": tip_hash,
+            "tip_block": self.storage.get_block_data(height),
+            "state": state,
+        }
+        snapshot["digest"] = snapshot_digest(snapshot)
+        return snapshot
+
+    def import_snapshot(self, snapshot: Dict[str, Any]):
+        #Arranque desde una instantanea: solo en un nodo sin bloques. Despues se sincronizan
+        #los bloques posteriores a snapshot["height"] de forma normal
+        #El estado recibido debe reproducir exactamente la raiz de estado del bloque punta
+        #Solo un bloque punta v1 o genesis no la trae, ahi el estado se confia al par que lo envio
+        if snapshot.get("format") != SNAPSHOT_FORMAT:
+            return False, "Formato de instantanea desconocido"
+        if snapshot.get("digest") != snapshot_digest(snapshot):
+            return False, "La instantanea esta alterada o incompleta"
+        tip_block = LazyBlock.from_json(snapshot["tip_block"])
+        if tip_block.index != snapshot["height"] or tip_block.hash != snapshot["tip_hash"]:
+            return False, "El bloque punta no coincide con la instantanea"
+        if tip_block.hash != tip_block.calculate_block_hash() or not tip_block.verify_merkle_root():
+            return False, "El bloque punta es invalido"
+        if tip_block.version != BLOCK_VERSION_LEGACY and tip_block.index != 1 and tip_block.state_root is None:
+            return False, "El bloque punta no trae raiz de estado"
+        if self.get_height():
+            return False, "El nodo ya tiene bloques"
+        try:
+            check_state_rows(snapshot["state"])
+        except ValueError as e:
+            return False, f"Instantanea invalida: {e}"
+        imported, reason = self.storage.import_state(tip_block, snapshot["state"])
+        if not imported:
+            return False, reason
+        self._advance_tip(BlockHeader.from_block(tip_block))
+        if self.state_cache:
+            self.state_cache.load(self.storage)
+        return True, f"Instantanea importada a la altura {tip_block.index}"
+
+    def get_pruned_height(self):
+        #Ultimo bloque sin cuerpo (0 si el nodo guarda la historia completa)
+        return self.storage.get_pruned_height()
+
+    def enable_pruning(self, keep: int, archive_dir: str = None, interval: int = 100):
+        #Modo podado: se conservan encabezados, estado y los ultimos keep cuerpos de bloque
+        #La poda corre en lotes de interval bloques para no reescribir la base en cada bloque
+        self.prune_keep = max(1, keep)
+        self.prune_archive = archive_dir
+        self.prune_interval = max(1, interval)
+
+    def maybe_prune(self):
+        if not self.prune_keep:
+            return None
+        if self.get_height() - self.get_pruned_height() < self.prune_keep + self.prune_interval:
+            return None
+        return self.prune_blocks(self.prune_keep, self.prune_archive)
+
+    def prune_blocks(self, keep: int, archive_dir: str = None, vacuum: bool = False):
+        #Borra (o archiva en archive_dir) los cuerpos anteriores a los ultimos keep bloques
+        return self.storage.prune_blocks(keep, archive_dir, vacuum)
+
+    def get_meta(self, key, default=None):
+        return self.storage.get_meta(key, default)
+
+    def set_meta(self, key, value):
+        self.storage.set_meta(key, value)
+
+    def get_ancestors(self, shipment_id, max_depth=None):
+        #Insumos de los que proviene un envio (ej. el lote de litio de un telefono)
+        #Cada envio del recorrido debe haberse creado despues de la instantanea, si no faltarian
+        #sus aristas hacia atras
+        max_depth = MAX_LINEAGE_DEPTH if max_depth is None else max_depth
+        ancestors = self.storage.walk_lineage(shipment_id, "ancestors", max_depth)
+        self._check_history([shipment_id] + [item["shipment_id"] for item in ancestors])
+        return ancestors
+
+    def get_descendants(self, shipment_id, max_depth=None):
+        #Productos fabricados a partir de un envio (ej. todo lo hecho con un lote contaminado)
+        #Si el envio se creo despues de la instantanea todos sus derivados tambien
+        self._check_history([shipment_id])
+        max_depth = MAX_LINEAGE_DEPTH if max_depth is None else max_depth
+        return self.storage.walk_lineage(shipment_id, "descendants", max_depth)
+
+    def backfill_lineage(self):
+        #Aristas de procedencia para bloques guardados antes de la migracion 3
+        return self.storage.backfill_lineage()
+
+    def backfill_transactions(self, batch_blocks=500):
+        #Filas de transactions para bloques guardados antes de la migracion 2
+        return self.storage.backfill_transactions(batch_blocks)
+
+    def get_inclusion_proof(self, tx_hash):
+        #Prueba de inclusion: encabezado del bloque, rama de Merkle y la transaccion misma
+        block = self.find_transaction_block(tx_hash)
+        if not block:
+            return None
+        tx = next(tx for tx in block.transactions if tx.tx_hash == tx_hash)
+        return {
+            "tx_hash": tx_hash,
+            "transaction": {**tx.to_dict(), "signature": tx.signature},
+            "block": block.header(),
+            "branch": block.merkle_proof(tx_hash),
+        }
 
     def load_chain(self):
         #Cargamos toda la historia de bloques desde el principio
-        conn = sqlite3.connect(self.db_file)
-        rows = conn.execute(
-            "SELECT data FROM blocks ORDER BY block_index ASC"
-        ).fetchall()
-        conn.close()
-        return [Block.from_json(row[0]) for row in rows]
+        #En modo podado solo se regresan los bloques que aun tienen cuerpo
+        return [LazyBlock.from_json(data) for _, data in self.storage.scan_blocks()]
 
     def get_public_key_by_name(self, name):
-        with sqlite3.connect(self.db_file) as conn:
-            res = conn.execute(
-                "SELECT public_key FROM participants WHERE name = ?", (name,)
-            ).fetchone()
-        return res[0] if res else None
+        return self.storage.get_public_key_by_name(name)
 
 
     def get_name_by_public_key(self, pk):
-        with sqlite3.connect(self.db_file) as conn:
-            res = conn.execute(
-                "SELECT name FROM participants WHERE public_key = ?", (pk,)
-            ).fetchone()
-        return res[0] if res else "Unknown"
\ No newline at end of file
+        return self.storage.get_name_by_public_key(pk) or "Unknown"
@@ -7,11 +7,10 @@ import time
 import random
 import sqlite3
 import json
-from ecdsa import SigningKey, SECP256k1
 
 #Agregamos directorio actual
 sys.path.append(os.getcwd())
-from blockchain_core import Transaction, ActionType
+from blockchain_core import Transaction, ActionType, Wallet
 
 st.set_page_config(
     page_title="SupplyChain Ledger",
@@ -45,25 +44,30 @@ PEERS = {
 
 #FUNCIONES AUXILIARES
 
-def get_node_key(node_name):
+@st.cache_resource
+def load_wallet(key_path):
+    #Streamlit reejecuta el script en cada clic, asi la llave se carga una sola vez
+    return Wallet.from_file(key_path)
+
+def get_node_wallet(node_name):
     #Buscamos la llave privada en la carpeta del nodo
     key_path = os.path.join("nodes", node_name, "private_key.pem")
     if os.path.exists(key_path):
-        with open(key_path, "r") as f:
-            priv = f.read().strip()
-        sk = SigningKey.from_string(bytes.fromhex(priv), curve=SECP256k1)
-        return priv, sk.verifying_key.to_string().hex()
-    return None, None
+        return load_wallet(key_path)
+    return None
 
 def get_db_connection(node_name):
     #Conexion directa a la base de datos SQL del nodo
     db_path = os.path.join("nodes", node_name, "blockchain.db")
     return sqlite3.connect(db_path)
 
-def send_transaction(node_name, tx_obj, private_key_hex):
+def send_transaction(node_name, tx_obj, wallet):
     #Firmamos y mandamos la peticion HTTP
-    tx_obj.sign_transaction(private_key_hex)
-    
+    wallet.sign(tx_obj)
+    return post_transaction(node_name, tx_obj)
+
+def post_transaction(node_name, tx_obj):
+    #Mandamos una transaccion ya firmada al nodo
     port = PEERS[node_name]
     url = f"http://localhost:{port}/transaction"
     payload = tx_obj.to_dict()
@@ -87,11 +91,12 @@ with st.sidebar:
     selected_node = st.selectbox("Selecciona tu Nodo", list(PEERS.keys()), label_visibility="collapsed")
     
     #Cargamos credenciales
-    priv_key, pub_key = get_node_key(selected_node)
+    wallet = get_node_wallet(selected_node)
 
-    if not priv_key:
+    if not wallet:
         st.error(" Error crítico: No se encontró la llave privada. ¿Corriste el setup?")
         st.stop() 
+    pub_key = wallet.public_key
 
 
     st.success(f"🟢 **En línea**\n\nPuerto: `{PEERS[selected_node]}`")
@@ -149,7 +154,7 @@ with tab1:
             if container.button("Firmar y Registrar en Blockchain", use_container_width=True):
                 new_id = f"SHIP-{random.randint(10000, 99999)}"
                 tx = Transaction(pub_key, pub_key, new_id, ActionType.EXTRACTED, loc, good_id, qty)
-                code, res = send_transaction(selected_node, tx, priv_key)
+                code, res = send_transaction(selected_node, tx, wallet)
                 
                 if code == 201:
                     st.toast(f"✅ Recurso creado con ID: {new_id}")
@@ -191,7 +196,7 @@ with tab1:
                 
                 if container.button("Firmar Envío", use_container_width=True):
                     tx = Transaction(pub_key, dest_pk, ship_id, ActionType.SHIPPED, new_loc)
-                    code, res = send_transaction(selected_node, tx, priv_key)
+                    code, res = send_transaction(selected_node, tx, wallet)
                     if code == 201:
                         st.toast("✅ Transacción enviada a la Mempool.")
                         time.sleep(1)
@@ -299,9 +304,11 @@ with tab1:
                         metadata={"source_materials": ids_origen}
                     ))
                     
+                    #Firmamos todo el lote de una vez con la llave ya cargada
+                    wallet.sign_many(lista_txs)
                     exito = True
                     for tx in lista_txs:
-                        c, r = send_transaction(selected_node, tx, priv_key)
+                        c, r = post_transaction(selected_node, tx)
                         if c != 201:
                             st.error(f"Fallo en {tx.shipment_id}: {r}")
                             exito = False
@@ -324,7 +331,7 @@ with tab1:
             
             if container.button("Emitir Voto", use_container_width=True):
                 tx = Transaction(pub_key, cand_pk, f"VOTE-{int(time.time())}", ActionType.VOTE, "Urna Virtual")
-                code, res = send_transaction(selected_node, tx, priv_key)
+                code, res = send_transaction(selected_node, tx, wallet)
                 if code == 201:
 
                     st.success("Voto registrado.")
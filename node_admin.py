@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import sys
+
+#Agregamos el directorio actual para importar las clases del nucleo
+sys.path.append(os.getcwd())
+from blockchain_core import BlockchainNode, HistoryUnavailableError
+
+#Tareas de mantenimiento de la base de datos local del nodo
+#Uso (dentro de la carpeta del nodo): python node_admin.py <comando> [opciones]
+
+
+def cmd_backfill(node, args):
+    #Llena la tabla normalizada de transacciones para bloques guardados antes de tenerla
+    indexed = node.backfill_transactions()
+    print(f"[+] {indexed} transacciones indexadas (esquema version {node.schema_version()})")
+    edges = node.backfill_lineage()
+    print(f"[+] {edges} relaciones de procedencia indexadas")
+
+
+def cmd_lineage(node, args):
+    #Procedencia de un envio: de donde viene (ancestors) o que se fabrico con el (descendants)
+    if args.direction == "ancestors":
+        related = node.get_ancestors(args.shipment_id, args.max_depth)
+    else:
+        related = node.get_descendants(args.shipment_id, args.max_depth)
+    if not related:
+        print(f"Sin relaciones de procedencia para {args.shipment_id}")
+        return
+    for item in related:
+        print(f"{'  ' * item['depth']}{item['shipment_id']} (nivel {item['depth']})")
+
+
+def cmd_history(node, args):
+    #Historial de un envio leido desde el indice de transacciones
+    history = node.get_shipment_history(args.shipment_id)
+    if not history:
+        print(f"No hay eventos para {args.shipment_id}")
+        return
+    print(f"{'Bloque':<8} | {'Accion':<14} | {'De':<22} | {'Para':<22} | TxID")
+    print("-" * 90)
+    for tx in history:
+        print(
+            f"#{tx['block_index']:<7} | {tx['action']:<14} | {node.get_name_by_public_key(tx['sender']):<22} | "
+            f"{node.get_name_by_public_key(tx['receiver']):<22} | {tx['tx_hash'][:16]}..."
+        )
+
+
+def cmd_snapshot_export(node, args):
+    #Guarda el estado actual en un archivo para arrancar otro nodo
+    snapshot = node.export_snapshot()
+    if not snapshot:
+        print("Error: El nodo no tiene bloques")
+        return
+    with open(args.out, "w") as f:
+        json.dump(snapshot, f)
+    print(f"[+] Instantanea de la altura {snapshot['height']} guardada en {args.out}")
+
+
+def cmd_snapshot_import(node, args):
+    #Carga una instantanea en un nodo vacio, luego p2p.py sincroniza los bloques posteriores
+    with open(args.file) as f:
+        snapshot = json.load(f)
+    success, msg = node.import_snapshot(snapshot)
+    print(f"[{'+' if success else '!'}] {msg}")
+
+
+def cmd_prune(node, args):
+    #Borra (o archiva) los cuerpos de bloque viejos, conservando encabezados y estado
+    report = node.prune_blocks(args.keep, args.archive, args.vacuum)
+    print(
+        f"[+] {report['pruned_blocks']} bloques podados, cuerpos disponibles desde el #{report['pruned_height'] + 1}"
+    )
+    if report["archive"]:
+        print(f"[+] Bloques archivados en {report['archive']}")
+    print(f"[+] {report['bytes_reclaimed'] / 1024:.0f} KB liberados")
+
+
+COMMANDS = {
+    "backfill": cmd_backfill,
+    "history": cmd_history,
+    "lineage": cmd_lineage,
+    "prune": cmd_prune,
+    "snapshot-export": cmd_snapshot_export,
+    "snapshot-import": cmd_snapshot_import,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mantenimiento de la base de datos del nodo")
+    parser.add_argument("--db", default="blockchain.db", help="Ruta de la base de datos")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("backfill", help="Indexa las transacciones de bloques antiguos")
+    history_parser = subparsers.add_parser("history", help="Eventos de un envio")
+    history_parser.add_argument("shipment_id")
+    lineage_parser = subparsers.add_parser("lineage", help="Procedencia de un envio")
+    lineage_parser.add_argument("direction", choices=["ancestors", "descendants"])
+    lineage_parser.add_argument("shipment_id")
+    lineage_parser.add_argument("--max-depth", type=int, help="Niveles maximos a recorrer")
+    export_parser = subparsers.add_parser("snapshot-export", help="Exporta el estado actual")
+    export_parser.add_argument("--out", default="snapshot.json")
+    import_parser = subparsers.add_parser("snapshot-import", help="Arranca un nodo vacio desde una instantanea")
+    import_parser.add_argument("file")
+    prune_parser = subparsers.add_parser("prune", help="Elimina los cuerpos de bloque antiguos")
+    prune_parser.add_argument("--keep", type=int, required=True, help="Ultimos bloques que conservan su cuerpo")
+    prune_parser.add_argument("--archive", help="Carpeta donde archivar los bloques podados")
+    prune_parser.add_argument("--vacuum", action="store_true", help="Compacta el archivo de la base despues de podar")
+    args = parser.parse_args()
+
+    #Importar una instantanea puede crear la base de un nodo nuevo
+    if args.command != "snapshot-import" and not os.path.exists(args.db):
+        print(f"Error: No se encontro la base de datos {args.db}")
+        sys.exit(1)
+
+    node = BlockchainNode(os.path.basename(os.getcwd()), args.db)
+    try:
+        COMMANDS[args.command](node, args)
+    except HistoryUnavailableError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        node.close()
@@ -5,8 +5,21 @@ import requests
 import argparse
 import threading
 import time
-from flask import Flask, jsonify, request
-from blockchain_core import BlockchainNode, Block, Transaction, ActionType
+from flask import Flask, Response, jsonify, request
+from blockchain_core import (
+    BlockchainNode,
+    Block,
+    BlockPrunedError,
+    BLOCK_STORES,
+    LazyBlock,
+    Transaction,
+    CRYPTO_BACKENDS,
+    STORAGE_PROFILES,
+    cache_stats,
+    configure_verifier,
+    set_crypto_backend,
+    verify_batch,
+)
 
 #Configuracion Inicial
 app = Flask(__name__)
@@ -34,6 +47,12 @@ PEERS = {
     "CargoShip_EverGiven": "http://localhost:5011",
 }
 
+#Si esta activo un nodo sin bloques arranca desde /snapshot de un par (--snapshot-sync)
+SNAPSHOT_SYNC = False
+
+#Encabezados maximos por respuesta de /headers
+MAX_HEADERS = 2000
+
 #Determinamos en que puerto debe correr este nodo especifico
 MY_PORT = 5000 #Puerto por defecto si no lo encontramos en la lista
 if NODE_NAME in PEERS:
@@ -49,8 +68,8 @@ def auto_mine_loop():
         time.sleep(5) #Esperamos 5 segundos entre cada chequeo (Tiempo de Bloque)
 
         try:
-            #1. Revisamos el estado actual de la red
-            last_block = node.get_last_block()
+            #1. Revisamos el estado actual de la red (punta en memoria, sin leer la base)
+            last_block = node.get_tip()
             if not last_block:
                 continue
 
@@ -68,16 +87,27 @@ def auto_mine_loop():
                     print(f"\n   [ ] Es mi turno! Validando {len(mempool)} transacciones...")
 
                     #4. Filtramos solo las transacciones validas
-                    valid_txs = []
-                    for tx in mempool:
-                        is_valid_logic, _ = node.validate_smart_contract_rules(tx)
-                        if is_valid_logic and tx.is_valid():
-                            valid_txs.append(tx)
+                    candidates = [
+                        tx for tx in mempool
+                        if node.validate_smart_contract_rules(tx)[0]
+                    ]
+                    #Las firmas se verifican en lote usando el pool de procesos
+                    signatures_ok = verify_batch(candidates)
+                    valid_txs = [
+                        tx for tx, ok in zip(candidates, signatures_ok) if ok
+                    ]
 
                     if valid_txs:
                         #5. Creamos el nuevo bloque
                         new_index = height + 1
-                        new_block = Block(new_index, valid_txs, prev_hash, NODE_NAME)
+                        #El encabezado compromete tambien el estado que resulta del bloque
+                        new_block = Block(
+                            new_index,
+                            valid_txs,
+                            prev_hash,
+                            NODE_NAME,
+                            state_root=node.compute_state_root(valid_txs),
+                        )
 
                         #6. Lo guardamos en nuestra propia base de datos
                         success, msg = node.receive_block(new_block)
@@ -87,6 +117,12 @@ def auto_mine_loop():
                             )
                             #7. IMPORTANTE: Lo enviamos a todos los demas nodos (Gossip)
                             broadcast_block(new_block)
+                            #8. En modo podado borramos los cuerpos viejos de vez en cuando
+                            report = node.maybe_prune()
+                            if report and report["pruned_blocks"]:
+                                print(
+                                    f"   [-] Podados {report['pruned_blocks']} bloques hasta #{report['pruned_height']} ({report['bytes_reclaimed'] / 1024:.0f} KB liberados)"
+                                )
                         else:
                             print(f"   [!] Error de auto-validacion: {msg}")
         except Exception as e:
@@ -97,30 +133,103 @@ def auto_mine_loop():
 @app.route("/info", methods=["GET"])
 def get_info():
     #Devuelve informacion basica del estado de este nodo
-    last_block = node.get_last_block()
+    last_block = node.get_tip()
     return jsonify(
         {
             "node_name": NODE_NAME,
             "height": last_block.index if last_block else 0,
             "last_hash": last_block.hash if last_block else "0" * 64,
+            #Dos nodos a la misma altura con distinta raiz tienen estados divergentes
+            "state_root": node.get_state_root(),
         }
     )
 
 
+@app.route("/stats", methods=["GET"])
+def get_stats():
+    #Tasas de acierto de las caches de verificacion para monitorear el nodo
+    stats = {
+        "node_name": NODE_NAME,
+        "caches": cache_stats(),
+        "pruned_height": node.get_pruned_height(),
+    }
+    if node.state_cache:
+        stats["caches"]["state"] = node.state_cache.stats()
+        #/stats?check=1 compara la cache de estado con SQLite (y la recarga si difiere)
+        if request.args.get("check"):
+            consistent, mismatches = node.verify_state_cache()
+            stats["state_consistent"] = consistent
+            stats["state_mismatches"] = mismatches[:20]
+    return jsonify(stats)
+
+
 @app.route("/chain", methods=["GET"])
 def get_chain():
     #Permite a otros nodos descargar nuestra copia de la blockchain para sincronizarse
-    chain_data = []
-    last = node.get_last_block()
-    height = last.index if last else 0
-    for i in range(1, height + 1):
-        blk = node.get_block_by_index(i)
-        if blk:
-            chain_data.append(json.loads(blk.to_json()))
-        # 
-
-
-    return jsonify(chain_data)
+    #Mandamos el JSON guardado tal cual, sin reconstruir los bloques
+    #/chain?from=N devuelve solo los bloques desde la altura N
+    start = request.args.get("from", default=1, type=int)
+    try:
+        chain_json = "[" + ",".join(node.iter_blocks_json(start)) + "]"
+    except BlockPrunedError as e:
+        #Nodo podado: ya no tenemos esos cuerpos, el par debe pedir desde pruned_height + 1
+        #los encabezados completos siguen disponibles en /headers
+        return jsonify({"message": str(e), "pruned_height": e.pruned_height}), 410
+    return Response(chain_json, mimetype="application/json")
+
+
+@app.route("/headers", methods=["GET"])
+def get_headers():
+    #Encabezados completos (incluidos los de bloques podados) para clientes ligeros
+    #/headers?from=N&limit=M, cada uno se verifica con block_header_hash de blockchain_core
+    start = request.args.get("from", default=1, type=int)
+    limit = min(request.args.get("limit", default=MAX_HEADERS, type=int), MAX_HEADERS)
+    return jsonify(list(node.iter_header_data(start, start + limit - 1)))
+
+
+@app.route("/header/<int:index>", methods=["GET"])
+def get_header(index):
+    header = node.get_header_data(index)
+    if not header:
+        return jsonify({"message": "Bloque no encontrado"}), 404
+    return jsonify(header)
+
+
+@app.route("/snapshot", methods=["GET"])
+def get_snapshot():
+    #Estado actual completo para que un nodo nuevo arranque sin repetir la historia
+    snapshot = node.export_snapshot()
+    if not snapshot:
+        return jsonify({"message": "El nodo no tiene bloques"}), 404
+    return jsonify(snapshot)
+
+
+@app.route("/state_proof/<shipment_id>", methods=["GET"])
+def get_state_proof(shipment_id):
+    #Prueba del estado actual de un envio contra la raiz de estado
+    #Se verifica del lado del cliente con verify_state_proof de blockchain_core
+    return jsonify(node.get_state_proof(shipment_id))
+
+
+@app.route("/proof/<tx_hash>", methods=["GET"])
+def get_proof(tx_hash):
+    #Prueba de inclusion para auditores sin descargar la cadena completa
+    #Se verifica del lado del cliente con verify_inclusion_proof de blockchain_core
+    try:
+        proof = node.get_inclusion_proof(tx_hash)
+    except BlockPrunedError as e:
+        #Sin el cuerpo no hay rama de Merkle, pero el encabezado sirve para verificar una
+        #prueba obtenida de un nodo de archivo
+        return jsonify(
+            {
+                "message": str(e),
+                "pruned_height": e.pruned_height,
+                "block": node.get_header_data(e.index),
+            }
+        ), 410
+    if not proof:
+        return jsonify({"message": "Transaccion no encontrada en la cadena"}), 404
+    return jsonify(proof)
 
 
 @app.route("/transaction", methods=["POST"])
@@ -128,18 +237,7 @@ def receive_transaction():
     #Recibimos una transaccion nueva de otro nodo o de una wallet
     data = request.get_json()
     try:
-        tx = Transaction(
-            data["sender"],
-            data["receiver"],
-            data["shipment_id"],
-            ActionType(data["action"]),
-            data["location"],
-            data.get("good_id"),
-            data.get("quantity"),
-            data.get("metadata"),
-            data.get("timestamp"),
-            data.get("signature"),
-        )
+        tx = Transaction.from_dict(data)
 
         #Intentamos agregarla a nuestra mempool local
         success, msg = node.add_to_mempool(tx)
@@ -164,9 +262,10 @@ def receive_transaction():
 @app.route("/block", methods=["POST"])
 def receive_block():
     #Recibimos un bloque nuevo propuesto por el validador del turno
-    data = request.get_json()
+    #Guardamos los bytes recibidos: se validan, se almacenan y se reenvian sin reserializar
+    data = request.get_data()
     try:
-        block = Block.from_json(json.dumps(data))
+        block = LazyBlock.from_json(data, strict=True)
         print(f"[*] Bloque Recibido #{block.index} de {block.validator}")
 
         #1. Intentamos agregarlo a nuestra cadena local
@@ -208,12 +307,14 @@ def broadcast_transaction(tx):
 
 def broadcast_block(block):
     #Envia un bloque nuevo a todos los peers conocidos
-    block_json = json.loads(block.to_json())
+    #El mismo cuerpo para todos: el texto recibido o el que generamos al crear el bloque
+    payload = block.to_json().encode()
+    headers = {"Content-Type": "application/json"}
     for name, url in PEERS.items():
         if name == NODE_NAME:
             continue
         try:
-            requests.post(f"{url}/block", json=block_json, timeout=1)
+            requests.post(f"{url}/block", data=payload, headers=headers, timeout=1)
         except Exception as e:
             print(f"    [!] Fallo al contactar a {name}")
 
@@ -239,25 +340,43 @@ def synchronize_chain():
                     best_peer = url
         except:
             pass
-    my_height = node.get_last_block().index if node.get_last_block() else 0
+    my_height = node.get_height()
+
+    #Un nodo vacio puede arrancar desde la instantanea del par y bajar solo lo posterior
+    if SNAPSHOT_SYNC and my_height == 0 and best_peer:
+        try:
+            resp = requests.get(f"{best_peer}/snapshot", timeout=30)
+            if resp.status_code == 200:
+                success, msg = node.import_snapshot(resp.json())
+                print(f"[*] Instantanea de {best_peer}: {msg}")
+                my_height = node.get_height()
+        except Exception as e:
+            print(f"Fallo la descarga de la instantanea: {e}")
 
     #2. Si encontramos a alguien mas avanzado descargamos su cadena
     if best_height > my_height:
         print(f"[*] Cadena mas larga encontrada ({best_height}) en {best_peer}. Descargando...")
         try:
-            resp = requests.get(f"{best_peer}/chain")
-            if resp.status_code == 200:
+            #Pedimos solo los bloques que nos faltan
+            resp = requests.get(f"{best_peer}/chain", params={"from": my_height + 1})
+            if resp.status_code == 410:
+                #El par esta podado y no tiene los bloques que nos faltan
+                print(
+                    f"[!] {best_peer} podo sus bloques hasta #{resp.json()['pruned_height']}, usa --snapshot-sync para arrancar desde su estado"
+                )
+            elif resp.status_code == 200:
                 chain_dump = resp.json()
                 for blk_data in chain_dump:
-                    blk = Block.from_json(json.dumps(blk_data))
-                    #Solo procesamos los bloques que nos faltan
-                    if blk.index > my_height:
-                        success, msg = node.receive_block(blk)
-                        if success:
-                            print(f"    Sincronizado Bloque #{blk.index}")
-                        else:
-                            print(f"    Error de Sincronizacion en #{blk.index}: {msg}")
-                            break
+                    #Solo procesamos los bloques que nos faltan, los demas ni se construyen
+                    if blk_data["index"] <= my_height:
+                        continue
+                    blk = LazyBlock(blk_data)
+                    success, msg = node.receive_block(blk)
+                    if success:
+                        print(f"    Sincronizado Bloque #{blk.index}")
+                    else:
+                        print(f"    Error de Sincronizacion en #{blk.index}: {msg}")
+                        break
         except Exception as e:
             print(f"Fallo la sincronizacion: {e}")
     else:
@@ -268,11 +387,90 @@ def synchronize_chain():
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--port", type=int, help="Puerto para correr el nodo")
+    parser.add_argument(
+        "--verify-workers",
+        type=int,
+        help="Procesos para verificar firmas en lote (por defecto 2)",
+    )
+    parser.add_argument(
+        "--crypto-backend",
+        choices=["auto"] + sorted(CRYPTO_BACKENDS),
+        default="auto",
+        help="Implementacion de firmas (auto usa libsecp256k1 si esta instalada)",
+    )
+    parser.add_argument(
+        "--storage-profile",
+        choices=sorted(STORAGE_PROFILES),
+        help="Ajustes de SQLite: durable (fsync en cada bloque), balanced o bench",
+    )
+    parser.add_argument(
+        "--state-cache-size",
+        type=int,
+        default=200000,
+        help="Envios que se guardan en memoria para validar reglas (0 la desactiva)",
+    )
+    parser.add_argument(
+        "--snapshot-sync",
+        action="store_true",
+        help="Si la base esta vacia arranca desde la instantanea de estado de un par",
+    )
+    parser.add_argument(
+        "--block-store",
+        choices=BLOCK_STORES,
+        help="Cuerpos de bloque en la tabla de SQLite o en un log segmentado con mmap",
+    )
+    parser.add_argument(
+        "--prune",
+        type=int,
+        metavar="K",
+        help="Modo podado: conserva encabezados, estado y solo los ultimos K cuerpos de bloque",
+    )
+    parser.add_argument(
+        "--prune-archive",
+        metavar="DIR",
+        help="Carpeta donde se archivan (gzip) los bloques podados en lugar de borrarlos",
+    )
     args = parser.parse_args()
 
 
     if args.port:
         MY_PORT = args.port
+    SNAPSHOT_SYNC = args.snapshot_sync
+
+    if args.block_store:
+        #Pasar a log segmentado mueve una sola vez los cuerpos que ya estaban en la tabla
+        node.close()
+        node = BlockchainNode(NODE_NAME, DB_PATH, block_store=args.block_store)
+    print(f"[*] Almacenamiento: {node.storage.name}, bloques en {node.storage.block_store}")
+
+    backend = set_crypto_backend(args.crypto_backend)
+    print(f"[*] Backend criptografico: {backend.name}")
+
+    if args.storage_profile:
+        node.set_storage_profile(args.storage_profile)
+    print(f"[*] Perfil de almacenamiento: {node.storage_profile}")
+
+    if args.state_cache_size > 0:
+        node.enable_state_cache(args.state_cache_size)
+        print(f"[*] Cache de estado: {node.state_cache.stats()['shipments']} envios en memoria")
+
+    #Bases creadas antes del indice de transacciones se completan al arrancar
+    indexed = node.backfill_transactions()
+    if indexed:
+        print(f"[*] Indice de transacciones completado: {indexed} transacciones")
+    edges = node.backfill_lineage()
+    if edges:
+        print(f"[*] Indice de procedencia completado: {edges} relaciones")
+
+    if args.verify_workers:
+        configure_verifier(args.verify_workers)
+
+    if args.prune:
+        node.enable_pruning(args.prune, args.prune_archive)
+        report = node.prune_blocks(args.prune, args.prune_archive)
+        print(
+            f"[*] Modo podado: ultimos {args.prune} bloques, cuerpos hasta #{report['pruned_height']} eliminados ({report['bytes_reclaimed'] / 1024:.0f} KB liberados)"
+        )
 
 
     #Sincronizacion Inicial al prender el nodo
@@ -282,4 +480,7 @@ if __name__ == "__main__":
     threading.Thread(target=auto_mine_loop, daemon=True).start()
 
     print(f"\n=== NODO {NODE_NAME} CORRIENDO EN PUERTO {MY_PORT} ===")
-    app.run(host="0.0.0.0", port=MY_PORT)
\ No newline at end of file
+    try:
+        app.run(host="0.0.0.0", port=MY_PORT)
+    finally:
+        node.close()
\ No newline at end of file
@@ -1,10 +1,8 @@
 import os
 import shutil
-import sqlite3
 import time
 import random
-from ecdsa import SigningKey, SECP256k1
-from blockchain_core import BlockchainNode, Transaction, Block
+from blockchain_core import BlockchainNode, Transaction, Block, get_crypto_backend
 
 #Definimos donde se guardaran los nodos simulados
 NODES_DIR = "nodes"
@@ -16,6 +14,7 @@ FILES_TO_INSTALL = [
     "p2p.py",
     "add_transaction.py",
     "view_blockchain.py",
+    "node_admin.py",
 ]
 
 
@@ -70,11 +69,11 @@ def setup_environment():
     #Creamos claves privadas y publicas para cada participante
     address_book = []
     print("Generando identidades criptograficas...")
+    backend = get_crypto_backend()
     for name, rep, role in participants:
         #Usamos la curva SECP256k1 (la misma de Bitcoin) para las firmas
-        sk = SigningKey.generate(curve=SECP256k1)
-        sk_hex = sk.to_string().hex()
-        pk = sk.verifying_key.to_string().hex()
+        sk_hex = backend.generate_private_key()
+        pk = backend.public_key_from_private(sk_hex)
         address_book.append((name, pk, role, rep, sk_hex))
 
     #5. Eleccion Genesis (Inicio Aleatorio)
@@ -129,47 +128,25 @@ def setup_environment():
 
         #Inicializamos la base de datos local del nodo
         db_path = os.path.join(node_path, "blockchain.db")
-        BlockchainNode(name, db_path)
-
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
-        #Registramos a todos los participantes en la base de datos del nodo
-        for p_name, p_pk, p_role, p_rep, _ in address_book:
-            vote_count = genesis_votes[p_name]
-            c.execute(
-                "INSERT OR IGNORE INTO participants (name, public_key, role, reputation, votes) VALUES (?,?,?,?,?)",
-                (p_name, p_pk, p_role, p_rep, vote_count),
-            )
-
-        #Registramos el catalogo de bienes
-        for g in goods_data:
-            c.execute("INSERT OR IGNORE INTO goods VALUES (?,?,?)", g)
-
-        #Registramos los envios iniciales (Genesis State)
-        for sh in genesis_shipments:
-            sh_id, g_id, qty, owner, loc = sh
-            #Buscamos la clave publica del dueno inicial
-            owner_pk = next(p[1] for p in address_book if p[0] == owner)
-            c.execute(
-                "INSERT OR IGNORE INTO shipments (shipment_id, good_id, quantity, current_owner_pk, current_location, last_action, last_updated_timestamp, is_active) VALUES (?,?,?,?,?,?,?,1)",
-                (sh_id, g_id, qty, owner_pk, loc, "EXTRACTED", time.time()),
-            )
-
-        #Insertamos el Bloque Genesis en la cadena local
-        c.execute(
-            "INSERT INTO blocks (block_index, block_hash, previous_hash, validator, timestamp, data) VALUES (?, ?, ?, ?, ?, ?)",
-            (
-                genesis_block.index,
-                genesis_block.hash,
-                genesis_block.previous_hash,
-                genesis_block.validator,
-                genesis_block.timestamp,
-                genesis_block.to_json(),
-            ),
-        )
-
-        conn.commit()
-        conn.close()
+        node = BlockchainNode(name, db_path)
+
+        #Estado inicial: todos los participantes, el catalogo de bienes y los envios de genesis
+        #La marca de tiempo es la del genesis para que todos los nodos tengan el mismo estado
+        genesis_state = {
+            "participants": [
+                [p_name, p_pk, p_role, p_rep, genesis_votes[p_name]]
+                for p_name, p_pk, p_role, p_rep, _ in address_book
+            ],
+            "goods": [list(g) for g in goods_data],
+            "shipments": [
+                #Buscamos la clave publica del dueno inicial
+                [sh_id, g_id, qty, next(p[1] for p in address_book if p[0] == owner), loc, "EXTRACTED", genesis_block.timestamp, 1]
+                for sh_id, g_id, qty, owner, loc in genesis_shipments
+            ],
+        }
+        #Guardamos el Bloque Genesis junto con su estado (y el arbol de estado)
+        node.load_genesis(genesis_block, genesis_state)
+        node.close()
         print(f"   > Nodo '{name}' instalado.")
     print("\nConfiguracion de Red Completa.")
     print("Ejecuta './start_network.sh' (o el de Windows) para iniciar los servidores.")
@@ -3,8 +3,7 @@ import time
 import requests
 import json
 import random
-from ecdsa import SigningKey, SECP256k1
-from blockchain_core import Transaction, ActionType
+from blockchain_core import Transaction, ActionType, Wallet
 
 #Configuracion de la Red
 PEERS = {
@@ -23,17 +22,18 @@ PEERS = {
 
 
 
-def get_keys(node_name):
-    #Carga la clave privada del disco para poder firmar las pruebas
-    key_path = os.path.join("nodes", node_name, "private_key.pem")
-    if not os.path.exists(key_path):
-        raise FileNotFoundError(f"No se encontro la clave para {node_name}")
+#Billeteras ya cargadas para no leer la llave del disco en cada paso
+WALLETS = {}
+
 
-    with open(key_path, "r") as f:
-        priv_hex = f.read().strip()
-    sk = SigningKey.from_string(bytes.fromhex(priv_hex), curve=SECP256k1)
-    vk = sk.verifying_key
-    return priv_hex, vk.to_string().hex()
+def get_wallet(node_name):
+    #Carga la clave privada del disco para poder firmar las pruebas
+    if node_name not in WALLETS:
+        key_path = os.path.join("nodes", node_name, "private_key.pem")
+        if not os.path.exists(key_path):
+            raise FileNotFoundError(f"No se encontro la clave para {node_name}")
+        WALLETS[node_name] = Wallet.from_file(key_path)
+    return WALLETS[node_name]
 
 
 def execute_step(step_num, sender_name, tx_data, title, narrative):
@@ -45,12 +45,13 @@ def execute_step(step_num, sender_name, tx_data, title, narrative):
 
     #1. Preparamos las credenciales del emisor
     port = PEERS[sender_name]
-    priv_key, pub_key = get_keys(sender_name)
+    wallet = get_wallet(sender_name)
+    pub_key = wallet.public_key
 
     #2. Identificamos la clave publica del receptor
     receiver_pub = pub_key 
     if "receiver_name" in tx_data:
-        _, receiver_pub = get_keys(tx_data.pop("receiver_name"))
+        receiver_pub = get_wallet(tx_data.pop("receiver_name")).public_key
 
     #3. Creamos el objeto Transaccion
     tx = Transaction(
@@ -65,7 +66,7 @@ def execute_step(step_num, sender_name, tx_data, title, narrative):
     )
 
     #4. Firmamos la transaccion (Firma Digital)
-    tx.sign_transaction(priv_key)
+    wallet.sign(tx)
 
     #5. Transmitimos via HTTP
     payload = tx.to_dict()
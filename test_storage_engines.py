@@ -0,0 +1,139 @@
+import json
+import math
+
+import pytest
+
+from blockchain_core import Block, BlockchainNode, LazyBlock, Transaction, snapshot_digest
+
+#Los dos motores deben guardar los mismos valores y llegar a la misma raiz de estado
+#con los mismos bloques. Las firmas no se revisan: save_block_to_db aplica el bloque directo
+
+KEYS = [f"{i:064x}" for i in range(1, 5)]
+SIGNATURE = "0" * 128
+
+
+def make_nodes(tmp_path):
+    genesis = Block(
+        1,
+        [Transaction("0" * 64, "0" * 64, "GENESIS", "MANUFACTURED", "RAIZ", signature=SIGNATURE)],
+        "0" * 64,
+        "P0",
+        timestamp=1000.0,
+    )
+    state = {
+        "participants": [[f"P{i}", pk, "Manufacturer", 10, 0] for i, pk in enumerate(KEYS)],
+        "goods": [["G1", "Acero", "kg"]],
+        #Cantidad entera en una columna REAL
+        "shipments": [["S0", "G1", 5, KEYS[0], "Planta", "EXTRACTED", 1000.0, 1]],
+    }
+    nodes = [
+        BlockchainNode("sqlite", str(tmp_path / "chain.db"), storage_backend="sqlite"),
+        BlockchainNode("memory", ":memory:", storage_backend="memory"),
+    ]
+    for node in nodes:
+        assert node.load_genesis(genesis, json.loads(json.dumps(state)))[0]
+    return genesis, nodes
+
+
+def tx(sender, receiver, shipment_id, action, location, good_id=None, quantity=None, metadata=None, timestamp=2000):
+    #Como llega por la red: un dict que pasa por from_dict
+    return Transaction.from_dict(
+        {
+            "sender": sender,
+            "receiver": receiver,
+            "shipment_id": shipment_id,
+            "action": action,
+            "location": location,
+            "good_id": good_id,
+            "quantity": quantity,
+            "metadata": metadata,
+            "timestamp": timestamp,
+            "signature": SIGNATURE,
+        }
+    )
+
+
+def test_engines_reach_the_same_state_root(tmp_path):
+    genesis, nodes = make_nodes(tmp_path)
+    blocks = [
+        [
+            tx(KEYS[0], KEYS[1], "S1", "EXTRACTED", "Mina", "G1", 7),
+            tx(KEYS[0], KEYS[1], "S2", "EXTRACTED", "Mina", "G1", 7.0),
+            tx(KEYS[0], KEYS[2], "S3", "EXTRACTED", "Mina", "G1", 2**53 + 1),
+            tx(KEYS[0], KEYS[2], "S4", "EXTRACTED", "1e20", "G1", -0.5, timestamp=2000.5),
+        ],
+        [
+            tx(KEYS[1], KEYS[2], "S1", "SHIPPED", "Puerto"),
+            tx(KEYS[1], KEYS[3], "S2", "SHIPPED", "Puerto", quantity=3),
+            tx(KEYS[0], KEYS[3], "S5", "MANUFACTURED", "Planta", "G1", 1, {"source_materials": ["S0", "S3"]}),
+            tx(KEYS[2], KEYS[1], "VOTE", "VOTE", "-"),
+        ],
+        [
+            tx(KEYS[2], KEYS[2], "S1", "CONSUMED", "Tienda"),
+            tx(KEYS[3], KEYS[0], "S5", "SHIPPED", "7", quantity=2**62),
+        ],
+    ]
+    previous_hash = genesis.hash
+    for index, txs in enumerate(blocks, start=2):
+        roots = {node.compute_state_root(txs) for node in nodes}
+        assert len(roots) == 1
+        block = Block(index, txs, previous_hash, "P0", state_root=roots.pop(), timestamp=1000.0 + index)
+        for node in nodes:
+            assert node.save_block_to_db(block) == (True, "Guardado")
+        assert len({node.get_state_root() for node in nodes}) == 1
+        previous_hash = block.hash
+
+    snapshots = [node.export_snapshot() for node in nodes]
+    assert snapshots[0]["state"] == snapshots[1]["state"]
+    assert len({node.rebuild_state_tree() for node in nodes}) == 1
+    for node in nodes:
+        node.close()
+
+
+@pytest.mark.parametrize(
+    "field, value",
+    [
+        ("location", 1e20),
+        ("location", None),
+        ("shipment_id", 7),
+        ("good_id", 5),
+        ("quantity", math.nan),
+        ("quantity", math.inf),
+        ("quantity", "7"),
+        ("quantity", True),
+        ("quantity", 2**63),
+        ("timestamp", "2000"),
+        ("metadata", []),
+        ("version", "2"),
+    ],
+)
+def test_wrong_typed_fields_are_rejected(field, value):
+    data = tx(KEYS[0], KEYS[1], "S1", "EXTRACTED", "Mina", "G1", 7).to_dict()
+    data[field] = value
+    with pytest.raises(ValueError):
+        Transaction.from_dict(data)
+    block = {
+        "index": 2,
+        "timestamp": 1000.0,
+        "transactions": [data],
+        "previous_hash": "0" * 64,
+        "validator": "P0",
+        "merkle_root": "0" * 64,
+        "hash": "0" * 64,
+    }
+    with pytest.raises(ValueError):
+        LazyBlock.from_json(json.dumps(block), strict=True)
+
+
+def test_wrong_typed_state_is_rejected(tmp_path):
+    genesis, nodes = make_nodes(tmp_path)
+    snapshot = nodes[0].export_snapshot()
+    snapshot["state"]["shipments"][0][4] = 1e20
+    snapshot["digest"] = snapshot_digest(snapshot)
+    for backend in ("sqlite", "memory"):
+        node = BlockchainNode("fresh", ":memory:", storage_backend=backend)
+        imported, reason = node.import_snapshot(json.loads(json.dumps(snapshot)))
+        assert not imported and "invalido" in reason
+        node.close()
+    for node in nodes:
+        node.close()
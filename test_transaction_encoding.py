@@ -0,0 +1,57 @@
+import pytest
+
+from blockchain_core import TX_VERSION, TX_VERSION_BINARY, TX_VERSION_TYPED, Block, LazyBlock, Transaction
+
+#Dos transacciones con valores distintos nunca deben firmar los mismos bytes
+
+SENDER = "a" * 128
+RECEIVER = "b" * 128
+
+
+def tx(quantity=None, shipment_id="S1", timestamp=1000.0, version=TX_VERSION):
+    return Transaction(SENDER, RECEIVER, shipment_id, "SHIPPED", "Puerto", "G1", quantity, timestamp=timestamp, version=version)
+
+
+def test_default_version_is_typed():
+    assert TX_VERSION == TX_VERSION_TYPED
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        (5, 5.0),
+        (2**53, 2**53 + 1),
+        (0, None),
+        (-1, 2**32 - 1),
+        (2**70, float(2**70)),
+    ],
+)
+def test_typed_quantities_do_not_collide(a, b):
+    assert tx(a).canonical_bytes() != tx(b).canonical_bytes()
+
+
+def test_typed_timestamps_do_not_collide():
+    assert tx(timestamp=1000).tx_hash != tx(timestamp=1000.0).tx_hash
+
+
+@pytest.mark.parametrize("quantity", [5, 5.0, 2**53 + 1, -7, None, 1e20])
+def test_typed_round_trip_keeps_hash_and_type(quantity):
+    original = tx(quantity)
+    block = Block(2, [original], "0" * 64, "P0")
+    restored = LazyBlock.from_json(block.to_json(), strict=True).transactions[0]
+    assert restored.tx_hash == original.tx_hash
+    assert type(restored.quantity) is type(original.quantity)
+
+
+@pytest.mark.parametrize("field", ["shipment_id", "location", "good_id"])
+def test_ids_must_be_text(field):
+    values = {"shipment_id": "S1", "location": "Puerto", "good_id": "G1", field: 7}
+    with pytest.raises(TypeError):
+        Transaction(SENDER, RECEIVER, values["shipment_id"], "SHIPPED", values["location"], values["good_id"], 1)
+
+
+def test_binary_version_keeps_the_signed_double():
+    #En la version 2 la cantidad se firma como double, el objeto guarda ese mismo valor
+    legacy = tx(2**53 + 1, version=TX_VERSION_BINARY)
+    assert legacy.quantity == float(2**53 + 1) and type(legacy.quantity) is float
+    assert legacy.tx_hash == tx(float(2**53 + 1), version=TX_VERSION_BINARY).tx_hash
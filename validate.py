@@ -3,7 +3,7 @@ import sys
 import requests
 import time
 import json
-from blockchain_core import BlockchainNode, Block
+from blockchain_core import BlockchainNode, Block, verify_batch
 
 #Configuracion basica
 NODE_NAME = os.path.basename(os.getcwd())
@@ -43,7 +43,7 @@ def main():
 
     #2.Verificar logica de consenso leyendo la base de datos
     node = BlockchainNode(NODE_NAME, "blockchain.db")
-    last_block = node.get_last_block()
+    last_block = node.get_tip()
     prev_hash = last_block.hash if last_block else "0" * 64
 
 
@@ -67,11 +67,15 @@ def main():
 
     print(f"    Encontradas {len(mempool)} transacciones.")
     valid_txs = []
-    for tx in mempool:
-        #RUBRICA:Aspectos Relevantes
-        #Validamos reglas de contrato inteligente y firma digital antes de incluir
+    #RUBRICA:Aspectos Relevantes
+    #Validamos reglas de contrato inteligente y firma digital antes de incluir
+    #Las firmas se verifican todas juntas en lote en el pool de procesos
+    signatures_ok = verify_batch(mempool)
+    for tx, signature_ok in zip(mempool, signatures_ok):
         is_valid, msg = node.validate_smart_contract_rules(tx)
-        if is_valid and tx.is_valid():
+        if not signature_ok:
+            msg = "Firma digital invalida"
+        if is_valid and signature_ok:
             valid_txs.append(tx)
         else:
             print(f"    Saltando tx invalida: {tx.tx_hash[:8]} ({msg})")
@@ -81,16 +85,26 @@ def main():
         return
 
     new_index = (last_block.index + 1) if last_block else 1
-    new_block = Block(new_index, valid_txs, prev_hash, NODE_NAME)
+    new_block = Block(
+        new_index,
+        valid_txs,
+        prev_hash,
+        NODE_NAME,
+        state_root=node.compute_state_root(valid_txs),
+    )
 
     print(f"\n[+] Minando Bloque #{new_index}...")
 
 
     #4.Enviar el bloque nuevo al servidor para que lo propague
     try:
-        block_payload = json.loads(new_block.to_json())
+        block_payload = new_block.to_json().encode()
 
-        r = requests.post(f"{BASE_URL}/block", json=block_payload)
+        r = requests.post(
+            f"{BASE_URL}/block",
+            data=block_payload,
+            headers={"Content-Type": "application/json"},
+        )
         if r.status_code == 201:
             print(f"Exito Bloque #{new_index} minado y transmitido.")
         else:
@@ -28,6 +28,9 @@ def view_local_ledger():
 
     #Cargamos toda la cadena de bloques
     chain = node.load_chain()
+    pruned_height = node.get_pruned_height()
+    if pruned_height:
+        print(f"(Nodo podado: los bloques #1 a #{pruned_height} solo conservan su encabezado)")
     if not chain:
         print("(Cadena Vacia)")
     else: